@@ -0,0 +1,102 @@
+// Host-side check that every drive transaction goes to the node a bus was
+// opened with, and that a handle outside the bus table is refused rather
+// than mapped onto another bus. Builds simucube_lib.c against a recording
+// SimpleMotion stand-in instead of libsimplemotionv2: make check
+#include "simucube_lib.c"
+
+#define CHECK_NODE 3
+
+static int wrongNode = 0;  // Transactions addressed to any other node
+static int transactions = 0;
+
+static SM_STATUS record(smaddr node) {
+    transactions++;
+    if (node != CHECK_NODE) {
+        wrongNode++;
+    }
+    return SM_OK;
+}
+
+SM_STATUS smSetParameter(const smbus, const smaddr node, const smint16, smint32) { return record(node); }
+SM_STATUS smRead1Parameter(const smbus, const smaddr node, const smint16, smint32 *value) {
+    *value = 0;
+    return record(node);
+}
+SM_STATUS smAppendSMCommandToQueue(smbus, int, smint32) { return SM_OK; }
+SM_STATUS smExecuteCommandQueue(const smbus, const smaddr node) { return record(node); }
+SM_STATUS smGetQueuedSMCommandReturnValue(const smbus, smint32 *value) {
+    *value = SMP_CMD_STATUS_ACK;
+    return SM_OK;
+}
+smbus smOpenBus(const char *) { return 0; }
+SM_STATUS smCloseBus(const smbus) { return SM_OK; }
+SM_STATUS smBufferedInit(BufferedMotionAxis *, smbus, smaddr node, smint32, smint16, smuint8) { return record(node); }
+SM_STATUS smBufferedDeinit(BufferedMotionAxis *) { return SM_OK; }
+SM_STATUS smBufferedRunAndSyncClocks(BufferedMotionAxis *) { return SM_OK; }
+SM_STATUS smBufferedGetFree(BufferedMotionAxis *, smint32 *freeBytes) {
+    *freeBytes = 0;
+    return SM_OK;
+}
+smint32 smBufferedGetMaxFillSize(BufferedMotionAxis *, smint32) { return 0; }
+SM_STATUS smBufferedFillAndReceive(BufferedMotionAxis *, smint32, smint32 *, smint32 *, smint32 *, smint32 *) {
+    return SM_OK;
+}
+SM_STATUS smBufferedAbort(BufferedMotionAxis *) { return SM_OK; }
+
+int main() {
+    char cache[] = "/tmp/node_check_portXXXXXX";
+    int fd = mkstemp(cache);
+    if (fd < 0 || write(fd, "/dev/ttyCHECK\n", 14) != 14) {
+        fprintf(stderr, "Cannot write the port cache.\n");
+        return 1;
+    }
+    close(fd);
+
+    smbus handle = -1;
+    int failed = openSimucubeFast(&handle, 0, 0, NULL, cache, CHECK_NODE) != 0;
+    unlink(cache);
+    if (failed) {
+        fprintf(stderr, "Open failed.\n");
+        return 1;
+    }
+
+    DriveState state;
+    int addresses[] = {SMP_FAULTS, SMP_STATUS};
+    int values[] = {0, 0};
+    int statuses[] = {0, 0};
+    int value = 0;
+    int points[] = {0, 100, 200};
+    failed |= clearFaultsAndInitialize(handle) != 0;
+    failed |= setSpeed(handle, 100) != 0;
+    failed |= setParameter(handle, SMP_FAULTS, 0) != 0;
+    failed |= getParameter(handle, SMP_FAULTS, &value) != 0;
+    failed |= readParameters(handle, addresses, values, 2) != 0;
+    failed |= writeParameters(handle, addresses, values, statuses, 2) != 0;
+    failed |= getTorque(handle, &value) != 0;
+    failed |= getFaults(handle, &value) != 0;
+    failed |= exchangeState(handle, 100, &state) != 0;
+    failed |= readState(handle, &state) != 0;
+    failed |= streamStart(handle, points, 3, 100) != 0;
+    streamAbort(handle);
+
+    // Out-of-range handles fail without a transaction
+    int before = transactions;
+    smbus badHandles[] = {-1, MAX_BUSES, MAX_BUSES + 7};
+    for (smbus bad : badHandles) {
+        failed |= setSpeed(bad, 100) != -1;
+        failed |= exchangeState(bad, 100, &state) != -1;
+        failed |= readParameters(bad, addresses, values, 2) != -1;
+        failed |= streamStart(bad, points, 3, 100) != -1;
+        failed |= streamActive(bad) != 0;
+    }
+    failed |= transactions != before;
+    closeSimucube(handle);
+
+    if (failed || wrongNode) {
+        fprintf(stderr, "FAILED: %d of %d transactions went to the wrong node%s.\n", wrongNode, transactions,
+                failed ? ", some calls failed or accepted a bad handle" : "");
+        return 1;
+    }
+    printf("OK: %d transactions, all to node %d.\n", transactions, CHECK_NODE);
+    return 0;
+}
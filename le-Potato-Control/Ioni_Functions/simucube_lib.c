@@ -1,12 +1,251 @@
 #include "simplemotion.h"
 #include "simplemotion_defs.h"
+#include "bufferedmotion.h"
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <dirent.h> // For listing devices
+#include <limits.h>
+#include <unistd.h>
+#include <wchar.h>
+#include "hidapi.h"
+#include <pthread.h>
+#include <time.h>
+#include <stdint.h>
+#include <atomic>
+#include <mutex>
+#include <sys/syscall.h>
+#include <sys/ioctl.h>
+#include <fcntl.h>
+#include <poll.h>
+#include <linux/gpio.h>
+#include <condition_variable>
+#include <chrono>
 
 extern "C" {
 
+    // Simucube HID command to expose the IONI SimpleMotion USB port
+    // (outReport / enableSMUSB from config_comm_defines.h)
+    #define GD_USB_VID 0x16d0
+    #define SIMUCUBE_PID 0x0d5a
+    #define SIMUCUBE_OUT_REPORT 0x6B
+    #define SIMUCUBE_ENABLE_SM_USB 9
+    #define SIMUCUBE_REPORT_SIZE 60
+    #define MAX_SERIAL_PORTS 10
+
+    // Drive state filled by one batched bus transaction
+    typedef struct {
+        int torque;
+        int velocity;
+        int faults;
+        int status;
+        int position;
+    } DriveState;
+
+    // One sampler record, laid out for a NumPy structured dtype (32 bytes)
+    typedef struct {
+        uint64_t seq;
+        int64_t timestampNs;
+        int32_t torque;
+        int32_t velocity;
+        int32_t position;
+        int32_t faults;
+    } DriveSample;
+
+    // Buses one process can hold open (SimpleMotion's SM_MAX_BUSES)
+    #define MAX_BUSES 10
+    #define DEFAULT_NODE 1
+
+    // Per-bus state, indexed by the smbus handle. SimpleMotion keeps per-bus
+    // state, so every transaction on a bus is serialised between the
+    // caller's threads, the bus's stream thread and the sampler; different
+    // buses (walls) never wait on each other. One drive (node) per bus: a
+    // wall with a drive of its own gets a bus of its own.
+    struct Estop;
+
+    typedef struct Bus {
+        std::mutex mutex;
+        int node = DEFAULT_NODE;             // SimpleMotion address of the drive on this bus
+        // Buffered setpoint stream (see streamStart)
+        BufferedMotionAxis streamAxis;
+        smint32 *streamPoints = NULL;
+        int streamCount = 0;
+        std::atomic<int> streamSent{0};
+        std::atomic<int> streamRunning{0};
+        std::atomic<int> streamStopRequest{0};
+        std::atomic<uint64_t> streamFills{0};
+        std::mutex streamControl;            // Serialises start/abort
+        pthread_t streamThread;
+        int streamJoinable = 0;
+        std::atomic<Estop *> estop{NULL};    // Native e-stop stopping this drive (see estopStart)
+    } Bus;
+
+    static Bus buses[MAX_BUSES];
+
+    // State of the bus behind smHandle, NULL for a handle that can't be one
+    // of ours (never opened, or garbage) so it never touches another wall's
+    static Bus *busFor(smbus smHandle) {
+        if (smHandle < 0 || smHandle >= MAX_BUSES) {
+            fprintf(stderr, "Invalid bus handle %ld.\n", (long)smHandle);
+            return NULL;
+        }
+        return &buses[smHandle];
+    }
+
+    // Bind bus to smHandle's state at the top of an entry point, or return error
+    #define BUS_OR_RETURN(bus, smHandle, error) \
+        Bus *bus##State = busFor(smHandle); \
+        if (bus##State == NULL) { \
+            return error; \
+        } \
+        Bus &bus = *bus##State
+
+    static int64_t monotonicNs() {
+        struct timespec ts;
+        clock_gettime(CLOCK_MONOTONIC, &ts);
+        return (int64_t)ts.tv_sec * 1000000000LL + ts.tv_nsec;
+    }
+
+    // Span tracing (see tracing.py). Every entry point, every SimpleMotion
+    // transfer and every wait for a busy bus records a begin/end span with
+    // its thread ID into a preallocated ring, laid out like the sampler's.
+    // Off by default: a disabled span is one relaxed atomic load.
+    #define TRACE_NAMES(X) \
+        X(TRACE_OPEN, "openSimucube") \
+        X(TRACE_OPEN_FAST, "openSimucubeFast") \
+        X(TRACE_ACTIVATE, "activateIoni") \
+        X(TRACE_CLOSE, "closeSimucube") \
+        X(TRACE_CLEAR_FAULTS, "clearFaultsAndInitialize") \
+        X(TRACE_SET_SPEED, "setSpeed") \
+        X(TRACE_SET_PARAMETER, "setParameter") \
+        X(TRACE_GET_PARAMETER, "getParameter") \
+        X(TRACE_READ_PARAMETERS, "readParameters") \
+        X(TRACE_WRITE_PARAMETERS, "writeParameters") \
+        X(TRACE_SAVE_CONFIGURATION, "saveConfiguration") \
+        X(TRACE_GET_TORQUE, "getTorque") \
+        X(TRACE_GET_FAULTS, "getFaults") \
+        X(TRACE_EXCHANGE_STATE, "exchangeState") \
+        X(TRACE_READ_STATE, "readState") \
+        X(TRACE_STREAM_START, "streamStart") \
+        X(TRACE_STREAM_ABORT, "streamAbort") \
+        X(TRACE_ESTOP, "estop stop") \
+        X(TRACE_BUS_WAIT, "bus lock wait") \
+        X(TRACE_SM_OPEN_BUS, "smOpenBus") \
+        X(TRACE_SM_SET_PARAMETER, "smSetParameter") \
+        X(TRACE_SM_READ_PARAMETER, "smRead1Parameter") \
+        X(TRACE_SM_EXECUTE_QUEUE, "smExecuteCommandQueue") \
+        X(TRACE_SM_BUFFERED_FILL, "smBufferedFillAndReceive")
+    #define TRACE_ENUM(id, name) id,
+    #define TRACE_STRING(id, name) name,
+    enum { TRACE_NAMES(TRACE_ENUM) TRACE_NAME_COUNT };
+    static const char *const traceNames[] = { TRACE_NAMES(TRACE_STRING) };
+
+    // One span, laid out for a NumPy structured dtype (32 bytes)
+    typedef struct {
+        uint64_t seq;
+        int64_t beginNs;
+        int64_t endNs;
+        uint32_t tid;
+        uint32_t name;
+    } TraceRecord;
+
+    static TraceRecord *traceRecords = NULL;
+    static uint32_t traceCapacity = 0;
+    static std::atomic<uint64_t> traceNext(0);
+    static std::atomic<int> traceOn(0);
+
+    static void traceRecord(uint32_t name, int64_t beginNs, int64_t endNs) {
+        static thread_local uint32_t tid = 0;
+        if (tid == 0) {
+            tid = (uint32_t)syscall(SYS_gettid);
+        }
+        uint64_t seq = traceNext.fetch_add(1, std::memory_order_relaxed);
+        TraceRecord *slot = &traceRecords[seq % traceCapacity];
+        __atomic_store_n(&slot->seq, UINT64_MAX, __ATOMIC_RELEASE);
+        slot->beginNs = beginNs;
+        slot->endNs = endNs;
+        slot->tid = tid;
+        slot->name = name;
+        __atomic_store_n(&slot->seq, seq, __ATOMIC_RELEASE);
+    }
+
+    // Span from construction to destruction (or end()), recorded only if
+    // tracing was on when it began
+    struct TraceScope {
+        uint32_t name;
+        int64_t beginNs;
+        explicit TraceScope(uint32_t traceName)
+            : name(traceName), beginNs(traceOn.load(std::memory_order_relaxed) ? monotonicNs() : 0) {}
+        ~TraceScope() {
+            if (beginNs) {
+                traceRecord(name, beginNs, monotonicNs());
+            }
+        }
+    };
+
+    // Evaluate a SimpleMotion call inside a span of its own
+    #define TRACED(name, call) ([&]() { TraceScope traceSpan(name); return call; }())
+
+    // 1 while the bus's e-stop is latched: every setpoint written is forced to 0
+    static int estopLatchedOn(Bus &bus);
+
+    // Lock a bus mutex; time spent waiting for another thread shows up as a span
+    static std::mutex &lockBus(std::mutex &mutex) {
+        if (!mutex.try_lock()) {
+            TraceScope wait(TRACE_BUS_WAIT);
+            mutex.lock();
+        }
+        return mutex;
+    }
+
+    // Start recording spans. The ring is allocated by the first call and
+    // kept for the life of the process, since a span that began before a
+    // stop may still be written after it; later calls reuse it whatever
+    // capacity they ask for. Returns the ring capacity, or -1.
+    int traceStart(int capacity) {
+        if (traceRecords == NULL) {
+            if (capacity <= 0) {
+                return -1;
+            }
+            TraceRecord *records = (TraceRecord *)calloc(capacity, sizeof(TraceRecord));
+            if (records == NULL) {
+                return -1;
+            }
+            for (int i = 0; i < capacity; i++) {
+                records[i].seq = UINT64_MAX;
+            }
+            traceRecords = records;
+            traceCapacity = (uint32_t)capacity;
+        }
+        traceOn.store(1, std::memory_order_release);
+        return (int)traceCapacity;
+    }
+
+    void traceStop() {
+        traceOn.store(0, std::memory_order_release);
+    }
+
+    TraceRecord *traceBuffer() {
+        return traceRecords;
+    }
+
+    int traceCapacitySlots() {
+        return (int)traceCapacity;
+    }
+
+    // Sequence number of the next span to be written
+    uint64_t traceHead() {
+        return traceNext.load(std::memory_order_acquire);
+    }
+
+    int traceNameCount() {
+        return TRACE_NAME_COUNT;
+    }
+
+    const char *traceName(int name) {
+        return name >= 0 && name < TRACE_NAME_COUNT ? traceNames[name] : "unknown";
+    }
+
     // List serial ports
     void listSerialPorts(char ports[][256], int *portCount) {
         struct dirent *entry;
@@ -16,7 +255,7 @@ extern "C" {
             return;
         }
         *portCount = 0;
-        while ((entry = readdir(dir)) != NULL) {
+        while ((entry = readdir(dir)) != NULL && *portCount < MAX_SERIAL_PORTS) {
             if (strstr(entry->d_name, "ttyUSB") || strstr(entry->d_name, "ttyACM")) {
                 snprintf(ports[*portCount], 256, "/dev/%s", entry->d_name);
                 (*portCount)++;
@@ -27,7 +266,8 @@ extern "C" {
 
     // Open Simucube
     int openSimucube(smbus *smHandle) {
-        char ports[10][256];
+        TraceScope span(TRACE_OPEN);
+        char ports[MAX_SERIAL_PORTS][256];
         int portCount = 0;
         listSerialPorts(ports, &portCount);
         if (portCount == 0) {
@@ -36,8 +276,15 @@ extern "C" {
         }
         for (int i = 0; i < portCount; i++) {
             printf("Trying port: %s\n", ports[i]);
-            *smHandle = smOpenBus(ports[i]);
+            *smHandle = TRACED(TRACE_SM_OPEN_BUS, smOpenBus(ports[i]));
+            if (*smHandle >= MAX_BUSES) {
+                fprintf(stderr, "Too many open buses (max %d).\n", MAX_BUSES);
+                smCloseBus(*smHandle);
+                *smHandle = -1;
+                return -1;
+            }
             if (*smHandle != -1) {
+                buses[*smHandle].node = DEFAULT_NODE;
                 printf("SM bus opened successfully on %s\n", ports[i]);
                 return 0;
             }
@@ -46,30 +293,238 @@ extern "C" {
         return -1;
     }
 
-    // Close Simucube
+    void streamAbort(smbus smHandle);
+    static void samplerRelease(smbus smHandle);
+    static void estopDetach(smbus smHandle);
+
+    // Close Simucube. A stream or sampler still running on the bus is
+    // stopped first, and its e-stop is detached so a later open of the same
+    // slot does not inherit it (estopRebind moves it to the reopened bus).
     void closeSimucube(smbus smHandle) {
+        TraceScope span(TRACE_CLOSE);
+        streamAbort(smHandle);
+        samplerRelease(smHandle);
+        estopDetach(smHandle);
         smCloseBus(smHandle);
         printf("SM bus closed successfully.\n");
     }
 
+    static int readSysfsHex(const char *path) {
+        FILE *f = fopen(path, "r");
+        unsigned int value = 0;
+        if (f == NULL) {
+            return -1;
+        }
+        int ok = fscanf(f, "%x", &value);
+        fclose(f);
+        return ok == 1 ? (int)value : -1;
+    }
+
+    static int readSysfsString(const char *path, char *out, size_t len) {
+        FILE *f = fopen(path, "r");
+        if (f == NULL) {
+            return -1;
+        }
+        if (fgets(out, (int)len, f) == NULL) {
+            fclose(f);
+            return -1;
+        }
+        fclose(f);
+        out[strcspn(out, "\n")] = 0;
+        return 0;
+    }
+
+    // Does the USB device behind tty (e.g. "ttyUSB0") match vid/pid, and
+    // serial if given? Walks /sys/class/tty/<tty>/device up to the USB
+    // device directory.
+    static int ttyMatches(const char *tty, int vid, int pid, const char *serial) {
+        char link[PATH_MAX], devicePath[PATH_MAX];
+        snprintf(link, sizeof(link), "/sys/class/tty/%s/device", tty);
+        if (realpath(link, devicePath) == NULL) {
+            return 0;
+        }
+        // Interface -> USB device: climb until idVendor appears
+        for (int depth = 0; depth < 4; depth++) {
+            char attr[PATH_MAX + 16];
+            snprintf(attr, sizeof(attr), "%s/idVendor", devicePath);
+            int foundVid = readSysfsHex(attr);
+            if (foundVid >= 0) {
+                snprintf(attr, sizeof(attr), "%s/idProduct", devicePath);
+                char foundSerial[128] = "";
+                int foundPid = readSysfsHex(attr);
+                snprintf(attr, sizeof(attr), "%s/serial", devicePath);
+                readSysfsString(attr, foundSerial, sizeof(foundSerial));
+                return foundVid == vid && foundPid == pid &&
+                       (serial == NULL || serial[0] == 0 || strcmp(serial, foundSerial) == 0);
+            }
+            char *slash = strrchr(devicePath, '/');
+            if (slash == NULL) {
+                break;
+            }
+            *slash = 0;
+        }
+        return 0;
+    }
+
+    // Find the tty whose USB device matches vid/pid (and serial if given)
+    int findSimucubePort(int vid, int pid, const char *serial, char *port, int portLen) {
+        DIR *dir = opendir("/sys/class/tty");
+        struct dirent *entry;
+        if (dir == NULL) {
+            return -1;
+        }
+        while ((entry = readdir(dir)) != NULL) {
+            if (strncmp(entry->d_name, "ttyUSB", 6) != 0 && strncmp(entry->d_name, "ttyACM", 6) != 0) {
+                continue;
+            }
+            if (ttyMatches(entry->d_name, vid, pid, serial)) {
+                snprintf(port, portLen, "/dev/%s", entry->d_name);
+                closedir(dir);
+                return 0;
+            }
+        }
+        closedir(dir);
+        return -1;
+    }
+
+    // Send enableSMUSB over HID in-process, unless the SM port is already up.
+    // The command goes to every attached Simucube, since which one carries
+    // a given IONI serial is not visible until its port appears. Waits up
+    // to timeoutMs for the port to enumerate after the command.
+    int activateIoni(int vid, int pid, const char *serial, int timeoutMs) {
+        TraceScope span(TRACE_ACTIVATE);
+        char port[256];
+        if (findSimucubePort(vid, pid, serial, port, sizeof(port)) == 0) {
+            printf("IONI already active on %s\n", port);
+            return 0;
+        }
+        if (hid_init() != 0) {
+            fprintf(stderr, "Failed to initialize HIDAPI.\n");
+            return -1;
+        }
+        unsigned char report[SIMUCUBE_REPORT_SIZE];
+        memset(report, 0, sizeof(report));
+        report[0] = SIMUCUBE_OUT_REPORT;
+        report[1] = SIMUCUBE_ENABLE_SM_USB;
+        int sent = 0;
+        struct hid_device_info *devices = hid_enumerate(GD_USB_VID, SIMUCUBE_PID);
+        for (struct hid_device_info *info = devices; info != NULL; info = info->next) {
+            hid_device *simucube = hid_open_path(info->path);
+            if (simucube == NULL) {
+                continue;
+            }
+            if (hid_write(simucube, report, sizeof(report)) != -1) {
+                sent++;
+            }
+            hid_close(simucube);
+        }
+        hid_free_enumeration(devices);
+        hid_exit();
+        if (sent == 0) {
+            fprintf(stderr, "Failed to send enableSMUSB to any SimuCUBE.\n");
+            return -1;
+        }
+        for (int waited = 0; waited < timeoutMs; waited += 10) {
+            if (findSimucubePort(vid, pid, serial, port, sizeof(port)) == 0) {
+                printf("IONI activated on %s after %d ms\n", port, waited);
+                return 0;
+            }
+            usleep(10000);
+        }
+        fprintf(stderr, "IONI port did not appear within %d ms.\n", timeoutMs);
+        return -1;
+    }
+
+    // Open a port and check that the drive at node actually answers on it
+    static int openAndProbe(const char *port, int node, smbus *smHandle) {
+        smbus handle = TRACED(TRACE_SM_OPEN_BUS, smOpenBus(port));
+        if (handle == -1) {
+            return -1;
+        }
+        if ((unsigned)handle >= MAX_BUSES) {
+            fprintf(stderr, "Too many open buses (max %d).\n", MAX_BUSES);
+            smCloseBus(handle);
+            return -1;
+        }
+        smint32 faults = 0;
+        if (TRACED(TRACE_SM_READ_PARAMETER, smRead1Parameter(handle, node, SMP_FAULTS, &faults)) != SM_OK) {
+            smCloseBus(handle);
+            return -1;
+        }
+        buses[handle].node = node;
+        *smHandle = handle;
+        return 0;
+    }
+
+    // Open the drive at node, trying the cached port first, then a sysfs
+    // VID/PID/serial match, then the full /dev scan. With a serial the scan
+    // is skipped and a cached port must still belong to that serial, so
+    // one wall can never grab another wall's drive. The port that worked is
+    // written back to cachePath.
+    int openSimucubeFast(smbus *smHandle, int vid, int pid, const char *serial, const char *cachePath,
+                         int node) {
+        TraceScope span(TRACE_OPEN_FAST);
+        char port[256] = "";
+        int opened = -1;
+        int bound = serial != NULL && serial[0] != 0;
+        if (cachePath != NULL && readSysfsString(cachePath, port, sizeof(port)) == 0 && port[0] &&
+            (!bound || (strncmp(port, "/dev/", 5) == 0 && ttyMatches(port + 5, vid, pid, serial)))) {
+            opened = openAndProbe(port, node, smHandle);
+            if (opened == 0) {
+                printf("SM bus opened on cached port %s\n", port);
+                return 0;
+            }
+        }
+        if (findSimucubePort(vid, pid, serial, port, sizeof(port)) == 0) {
+            opened = openAndProbe(port, node, smHandle);
+        }
+        if (opened != 0 && !bound) {
+            char ports[MAX_SERIAL_PORTS][256];
+            int portCount = 0;
+            listSerialPorts(ports, &portCount);
+            for (int i = 0; i < portCount && opened != 0; i++) {
+                opened = openAndProbe(ports[i], node, smHandle);
+                if (opened == 0) {
+                    snprintf(port, sizeof(port), "%s", ports[i]);
+                }
+            }
+        }
+        if (opened != 0) {
+            fprintf(stderr, "Failed to open SM bus on any port.\n");
+            return -1;
+        }
+        printf("SM bus opened successfully on %s\n", port);
+        if (cachePath != NULL) {
+            FILE *f = fopen(cachePath, "w");
+            if (f != NULL) {
+                fprintf(f, "%s\n", port);
+                fclose(f);
+            }
+        }
+        return 0;
+    }
+
     // Clear Faults and Enable Motor
     int clearFaultsAndInitialize(smbus smHandle) {
+        TraceScope span(TRACE_CLEAR_FAULTS);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
         smint32 faultStatus = 0;
-        SM_STATUS status = smRead1Parameter(smHandle, 1, SMP_FAULTS, &faultStatus);
+        SM_STATUS status = TRACED(TRACE_SM_READ_PARAMETER, smRead1Parameter(smHandle, bus.node, SMP_FAULTS, &faultStatus));
         if (status != SM_OK) {
             fprintf(stderr, "Failed to read fault status.\n");
             return -1;
         }
         if (faultStatus != 0) {
             printf("Faults detected: %d. Attempting to clear...\n", faultStatus);
-            status = smSetParameter(smHandle, 1, SMP_CONTROL_BITS1, SMP_CB1_CLEARFAULTS);
+            status = TRACED(TRACE_SM_SET_PARAMETER, smSetParameter(smHandle, bus.node, SMP_CONTROL_BITS1, SMP_CB1_CLEARFAULTS));
             if (status != SM_OK) {
                 fprintf(stderr, "Failed to clear faults.\n");
                 return -1;
             }
             printf("Faults cleared.\n");
         }
-        status = smSetParameter(smHandle, 1, SMP_CONTROL_BITS1, SMP_CB1_ENABLE);
+        status = TRACED(TRACE_SM_SET_PARAMETER, smSetParameter(smHandle, bus.node, SMP_CONTROL_BITS1, SMP_CB1_ENABLE));
         if (status != SM_OK) {
             fprintf(stderr, "Failed to enable the motor.\n");
             return -1;
@@ -78,21 +533,148 @@ extern "C" {
         return 0;
     }
 
-    // Set Speed
+    // Set Speed (an explicit setpoint cancels any trajectory being streamed)
     int setSpeed(smbus smHandle, int speed) {
-        SM_STATUS status = smSetParameter(smHandle, 1, SMP_ABSOLUTE_SETPOINT, speed);
+        TraceScope span(TRACE_SET_SPEED);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        streamAbort(smHandle);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+        if (estopLatchedOn(bus)) {
+            speed = 0;
+        }
+        SM_STATUS status = TRACED(TRACE_SM_SET_PARAMETER, smSetParameter(smHandle, bus.node, SMP_ABSOLUTE_SETPOINT, speed));
         if (status != SM_OK) {
             fprintf(stderr, "Failed to set speed to %d.\n", speed);
             return -1;
         }
-        printf("Speed set to %d successfully.\n", speed);
+        return 0;
+    }
+
+    // Write a single drive parameter
+    int setParameter(smbus smHandle, int address, int value) {
+        TraceScope span(TRACE_SET_PARAMETER);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+        SM_STATUS status = TRACED(TRACE_SM_SET_PARAMETER, smSetParameter(smHandle, bus.node, (smint16)address, value));
+        if (status != SM_OK) {
+            fprintf(stderr, "Failed to write parameter %d.\n", address);
+            return -1;
+        }
+        return 0;
+    }
+
+    // Read a single drive parameter
+    int getParameter(smbus smHandle, int address, int *value) {
+        TraceScope span(TRACE_GET_PARAMETER);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+        smint32 paramValue = 0;
+        SM_STATUS status = TRACED(TRACE_SM_READ_PARAMETER, smRead1Parameter(smHandle, bus.node, (smint16)address, &paramValue));
+        if (status != SM_OK) {
+            fprintf(stderr, "Failed to read parameter %d.\n", address);
+            return -1;
+        }
+        *value = (int)paramValue;
+        return 0;
+    }
+
+    // Parameters per queued transaction, sized to stay inside the
+    // SimpleMotion command buffer
+    #define PARAM_BATCH 16
+
+    // Read count parameters, PARAM_BATCH per bus transaction
+    int readParameters(smbus smHandle, const int *addresses, int *values, int count) {
+        TraceScope span(TRACE_READ_PARAMETERS);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+        for (int first = 0; first < count; first += PARAM_BATCH) {
+            int n = count - first < PARAM_BATCH ? count - first : PARAM_BATCH;
+            smint32 ignored = 0, value = 0;
+            SM_STATUS smStat = 0;
+
+            // Each write to SMP_RETURN_PARAM_ADDR returns the value of that parameter
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_SETPARAMADDR, SMP_RETURN_PARAM_LEN);
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMPRET_32B);
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_SETPARAMADDR, SMP_RETURN_PARAM_ADDR);
+            for (int i = 0; i < n; i++) {
+                smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, addresses[first + i]);
+            }
+            smStat |= TRACED(TRACE_SM_EXECUTE_QUEUE, smExecuteCommandQueue(smHandle, bus.node));
+
+            for (int i = 0; i < 3; i++) {
+                smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+            }
+            for (int i = 0; i < n; i++) {
+                smStat |= smGetQueuedSMCommandReturnValue(smHandle, &value);
+                values[first + i] = (int)value;
+            }
+            if (smStat != SM_OK) {
+                fprintf(stderr, "Batched parameter read failed.\n");
+                return -1;
+            }
+        }
+        return 0;
+    }
+
+    // Write count parameters, PARAM_BATCH per bus transaction. Each write's
+    // command status goes to statuses[i]; returns the number of writes the
+    // drive rejected, or -1 on a bus error
+    int writeParameters(smbus smHandle, const int *addresses, const int *values, int *statuses, int count) {
+        TraceScope span(TRACE_WRITE_PARAMETERS);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+        int rejected = 0;
+        for (int first = 0; first < count; first += PARAM_BATCH) {
+            int n = count - first < PARAM_BATCH ? count - first : PARAM_BATCH;
+            smint32 ignored = 0, status = 0;
+            SM_STATUS smStat = 0;
+
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_SETPARAMADDR, SMP_RETURN_PARAM_LEN);
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMPRET_CMD_STATUS);
+            for (int i = 0; i < n; i++) {
+                smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_SETPARAMADDR, addresses[first + i]);
+                smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_32B, values[first + i]);
+            }
+            smStat |= TRACED(TRACE_SM_EXECUTE_QUEUE, smExecuteCommandQueue(smHandle, bus.node));
+
+            smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+            smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+            for (int i = 0; i < n; i++) {
+                smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+                smStat |= smGetQueuedSMCommandReturnValue(smHandle, &status);
+                statuses[first + i] = (int)status;
+                if (status != SMP_CMD_STATUS_ACK) {
+                    rejected++;
+                }
+            }
+            if (smStat != SM_OK) {
+                fprintf(stderr, "Batched parameter write failed.\n");
+                return -1;
+            }
+        }
+        return rejected;
+    }
+
+    // Store the drive's current parameters to its flash
+    int saveConfiguration(smbus smHandle) {
+        TraceScope span(TRACE_SAVE_CONFIGURATION);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+        SM_STATUS status = TRACED(TRACE_SM_SET_PARAMETER, smSetParameter(smHandle, bus.node, SMP_SYSTEM_CONTROL, SMP_SYSTEM_CONTROL_SAVECFG));
+        if (status != SM_OK) {
+            fprintf(stderr, "Failed to save drive configuration.\n");
+            return -1;
+        }
         return 0;
     }
 
     // Get Torque
     int getTorque(smbus smHandle, int *torque) {
+        TraceScope span(TRACE_GET_TORQUE);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
         smint32 torqueValue = 0;
-        SM_STATUS status = smRead1Parameter(smHandle, 1, SMP_ACTUAL_TORQUE, &torqueValue);
+        SM_STATUS status = TRACED(TRACE_SM_READ_PARAMETER, smRead1Parameter(smHandle, bus.node, SMP_ACTUAL_TORQUE, &torqueValue));
         if (status != SM_OK) {
             fprintf(stderr, "Failed to read torque.\n");
             return -1;
@@ -104,14 +686,737 @@ extern "C" {
 
     // Get Faults
     int getFaults(smbus smHandle, int *faultStatus) {
+        TraceScope span(TRACE_GET_FAULTS);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
         smint32 faults = 0;
-        SM_STATUS status = smRead1Parameter(smHandle, 1, SMP_FAULTS, &faults);
+        SM_STATUS status = TRACED(TRACE_SM_READ_PARAMETER, smRead1Parameter(smHandle, bus.node, SMP_FAULTS, &faults));
         if (status != SM_OK) {
             fprintf(stderr, "Failed to read fault status.\n");
             return -1;
         }
-        *faultStatus = (int)faults;
-        printf("Faults read: %d\n", *faultStatus);
+        *faultStatus = (int)faults;  // Polled by the fault supervisor, so no log line
         return 0;
     }
+
+    // Queue an optional setpoint write plus reads of torque, velocity, faults,
+    // status and position, and run them as a single SimpleMotion transaction
+    static int exchange(smbus smHandle, int writeSetpoint, int speed, DriveState *state) {
+        smint32 setpointStatus = SMP_CMD_STATUS_ACK, ignored = 0;
+        smint32 torque = 0, velocity = 0, faults = 0, status = 0, position = 0;
+        SM_STATUS smStat = 0;
+        BUS_OR_RETURN(bus, smHandle, -1);
+        if (writeSetpoint) {
+            streamAbort(smHandle);
+        }
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+        if (estopLatchedOn(bus)) {
+            speed = 0;
+        }
+
+        if (writeSetpoint) {
+            // Setpoint write returns its command status
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_SETPARAMADDR, SMP_RETURN_PARAM_LEN);
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMPRET_CMD_STATUS);
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_SETPARAMADDR, SMP_ABSOLUTE_SETPOINT);
+            smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_32B, speed);
+        }
+        // Each write to SMP_RETURN_PARAM_ADDR returns the value of that parameter
+        smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_SETPARAMADDR, SMP_RETURN_PARAM_LEN);
+        smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMPRET_32B);
+        smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_SETPARAMADDR, SMP_RETURN_PARAM_ADDR);
+        smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMP_ACTUAL_TORQUE);
+        smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMP_ACTUAL_VELOCITY_FB);
+        smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMP_FAULTS);
+        smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMP_STATUS);
+        smStat |= smAppendSMCommandToQueue(smHandle, SMPCMD_24B, SMP_ACTUAL_POSITION_FB);
+        smStat |= TRACED(TRACE_SM_EXECUTE_QUEUE, smExecuteCommandQueue(smHandle, bus.node));
+
+        if (writeSetpoint) {
+            smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+            smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+            smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+            smStat |= smGetQueuedSMCommandReturnValue(smHandle, &setpointStatus);
+        }
+        smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+        smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+        smStat |= smGetQueuedSMCommandReturnValue(smHandle, &ignored);
+        smStat |= smGetQueuedSMCommandReturnValue(smHandle, &torque);
+        smStat |= smGetQueuedSMCommandReturnValue(smHandle, &velocity);
+        smStat |= smGetQueuedSMCommandReturnValue(smHandle, &faults);
+        smStat |= smGetQueuedSMCommandReturnValue(smHandle, &status);
+        smStat |= smGetQueuedSMCommandReturnValue(smHandle, &position);
+
+        if (smStat != SM_OK) {
+            fprintf(stderr, "Batched drive transaction failed.\n");
+            return -1;
+        }
+        state->torque = (int)torque;
+        state->velocity = (int)velocity;
+        state->faults = (int)faults;
+        state->status = (int)status;
+        state->position = (int)position;
+        if (setpointStatus != SMP_CMD_STATUS_ACK) {
+            fprintf(stderr, "Drive rejected speed %d.\n", speed);
+            return -1;
+        }
+        return 0;
+    }
+
+    // Set Speed and read back the drive state in one transaction
+    int exchangeState(smbus smHandle, int speed, DriveState *state) {
+        TraceScope span(TRACE_EXCHANGE_STATE);
+        return exchange(smHandle, 1, speed, state);
+    }
+
+    // Read torque, velocity, faults and status in one transaction
+    int readState(smbus smHandle, DriveState *state) {
+        TraceScope span(TRACE_READ_STATE);
+        return exchange(smHandle, 0, 0, state);
+    }
+
+    // Background sampler: a pthread reads one drive at a fixed rate into a
+    // single-producer ring buffer. Each slot carries its sequence number and
+    // is invalidated while being written, so a reader copying the buffer can
+    // tell a torn or overwritten slot from a good one.
+    static DriveSample *samplerSamples = NULL;
+    static uint32_t samplerCapacity = 0;
+    static std::atomic<uint64_t> samplerNext(0);
+    static std::atomic<uint64_t> samplerErrors(0);
+    static std::atomic<int> samplerRunning(0);
+    static pthread_t samplerThread;
+    static smbus samplerHandle;
+    static long samplerPeriodNs = 0;
+
+    static void *samplerMain(void *) {
+        struct timespec deadline;
+        clock_gettime(CLOCK_MONOTONIC, &deadline);
+        while (samplerRunning.load(std::memory_order_acquire)) {
+            DriveState state;
+            if (exchange(samplerHandle, 0, 0, &state) == 0) {
+                uint64_t seq = samplerNext.load(std::memory_order_relaxed);
+                DriveSample *slot = &samplerSamples[seq % samplerCapacity];
+                __atomic_store_n(&slot->seq, UINT64_MAX, __ATOMIC_RELEASE);
+                slot->timestampNs = monotonicNs();
+                slot->torque = state.torque;
+                slot->velocity = state.velocity;
+                slot->position = state.position;
+                slot->faults = state.faults;
+                __atomic_store_n(&slot->seq, seq, __ATOMIC_RELEASE);
+                samplerNext.store(seq + 1, std::memory_order_release);
+            } else {
+                samplerErrors.fetch_add(1, std::memory_order_relaxed);
+            }
+
+            // Absolute deadlines so bus time does not stretch the period
+            deadline.tv_nsec += samplerPeriodNs;
+            while (deadline.tv_nsec >= 1000000000L) {
+                deadline.tv_nsec -= 1000000000L;
+                deadline.tv_sec++;
+            }
+            clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &deadline, NULL);
+        }
+        return NULL;
+    }
+
+    // Start sampling torque, velocity, position and faults at rateHz. Like
+    // the trace ring, the buffer is allocated by the first call and kept for
+    // the life of the process, since a reader may still hold a view of it;
+    // later calls reuse it whatever capacity they ask for (see
+    // samplerCapacitySlots).
+    int startSampler(smbus smHandle, int rateHz, int capacity) {
+        if (samplerRunning.load() || rateHz <= 0 || busFor(smHandle) == NULL) {
+            return -1;
+        }
+        if (samplerSamples == NULL) {
+            if (capacity <= 0) {
+                return -1;
+            }
+            DriveSample *samples = (DriveSample *)calloc(capacity, sizeof(DriveSample));
+            if (samples == NULL) {
+                return -1;
+            }
+            samplerSamples = samples;
+            samplerCapacity = (uint32_t)capacity;
+        }
+        for (uint32_t i = 0; i < samplerCapacity; i++) {
+            __atomic_store_n(&samplerSamples[i].seq, UINT64_MAX, __ATOMIC_RELEASE);
+        }
+        samplerNext.store(0);
+        samplerErrors.store(0);
+        samplerHandle = smHandle;
+        samplerPeriodNs = 1000000000L / rateHz;
+        samplerRunning.store(1, std::memory_order_release);
+        if (pthread_create(&samplerThread, NULL, samplerMain, NULL) != 0) {
+            samplerRunning.store(0);
+            fprintf(stderr, "Failed to start sampler thread.\n");
+            return -1;
+        }
+        printf("Sampler started at %d Hz (%u slots).\n", rateHz, samplerCapacity);
+        return 0;
+    }
+
+    // Stop the sampler; the buffer stays readable until the next start resets it
+    void stopSampler() {
+        if (samplerRunning.exchange(0)) {
+            pthread_join(samplerThread, NULL);
+        }
+    }
+
+    // The sampler's bus is closing: stop it rather than poll a dead handle
+    static void samplerRelease(smbus smHandle) {
+        if (samplerRunning.load(std::memory_order_acquire) && samplerHandle == smHandle) {
+            stopSampler();
+        }
+    }
+
+    DriveSample *samplerBuffer() {
+        return samplerSamples;
+    }
+
+    int samplerCapacitySlots() {
+        return (int)samplerCapacity;
+    }
+
+    // Sequence number of the next sample to be written
+    uint64_t samplerHead() {
+        return samplerNext.load(std::memory_order_acquire);
+    }
+
+    uint64_t samplerErrorCount() {
+        return samplerErrors.load(std::memory_order_relaxed);
+    }
+
+    // Buffered setpoint streaming: a precomputed trajectory is copied in and
+    // a pthread keeps the drive's motion buffer topped up while the drive
+    // plays it back at its own sample rate, so playback timing never depends
+    // on the host. Each bus streams independently; bus access shares the
+    // bus mutex with every other call on that bus.
+    #define STREAM_MAX_FILL 256          // Points per fill transaction
+    #define STREAM_REFILL_NS 2000000L    // Buffer space check interval
+
+    static void *streamMain(void *arg) {
+        Bus *bus = (Bus *)arg;
+        smint32 readback[STREAM_MAX_FILL];
+        struct timespec pause = {0, STREAM_REFILL_NS};
+        int playing = 0;
+        int failed = 0;
+        while (!bus->streamStopRequest.load(std::memory_order_acquire)) {
+            int sent = bus->streamSent.load(std::memory_order_relaxed);
+            smint32 freeBytes = 0;
+            {
+                std::lock_guard<std::mutex> guard(lockBus(bus->mutex), std::adopt_lock);
+                if (bus->streamStopRequest.load(std::memory_order_acquire)) {
+                    break;  // Stopped (possibly by the e-stop) while waiting for the bus
+                }
+                if (smBufferedGetFree(&bus->streamAxis, &freeBytes) != SM_OK) {
+                    failed = 1;
+                    break;
+                }
+                if (sent < bus->streamCount) {
+                    smint32 fill = smBufferedGetMaxFillSize(&bus->streamAxis, freeBytes);
+                    if (fill > bus->streamCount - sent) fill = bus->streamCount - sent;
+                    if (fill > STREAM_MAX_FILL) fill = STREAM_MAX_FILL;
+                    if (fill > 0) {
+                        smint32 received = 0, filled = 0;
+                        if (TRACED(TRACE_SM_BUFFERED_FILL, smBufferedFillAndReceive(&bus->streamAxis, fill,
+                                   bus->streamPoints + sent, &received, readback, &filled)) != SM_OK) {
+                            failed = 1;
+                            break;
+                        }
+                        bus->streamFills.fetch_add(1, std::memory_order_relaxed);
+                        bus->streamSent.store(sent + fill, std::memory_order_release);
+                    }
+                }
+                // Start playback once the first batch is in the buffer
+                if (!playing && bus->streamSent.load() > 0) {
+                    if (smBufferedRunAndSyncClocks(&bus->streamAxis) != SM_OK) {
+                        failed = 1;
+                        break;
+                    }
+                    playing = 1;
+                }
+            }
+            // Done once every point is sent and the drive has drained the buffer
+            if (bus->streamSent.load() == bus->streamCount && freeBytes >= bus->streamAxis.bufferLength) {
+                break;
+            }
+            nanosleep(&pause, NULL);
+        }
+        {
+            std::lock_guard<std::mutex> guard(lockBus(bus->mutex), std::adopt_lock);
+            if (failed || bus->streamStopRequest.load()) {
+                smBufferedAbort(&bus->streamAxis);
+            }
+            smBufferedDeinit(&bus->streamAxis);
+            bus->streamRunning.store(0, std::memory_order_release);  // Under the bus lock, for the e-stop
+        }
+        if (failed) {
+            fprintf(stderr, "Setpoint stream failed after %d points.\n", bus->streamSent.load());
+        }
+        return NULL;
+    }
+
+    // Stop a running trajectory and discard what is left in the drive buffer
+    void streamAbort(smbus smHandle) {
+        BUS_OR_RETURN(bus, smHandle, );
+        std::lock_guard<std::mutex> control(bus.streamControl);
+        if (!bus.streamJoinable) {
+            return;
+        }
+        TraceScope span(TRACE_STREAM_ABORT);  // Only when there is a stream to stop
+        bus.streamStopRequest.store(1, std::memory_order_release);
+        pthread_join(bus.streamThread, NULL);
+        bus.streamJoinable = 0;
+    }
+
+    // Stream count setpoints to the drive, played back at rateHz by the drive
+    int streamStart(smbus smHandle, const int *setpoints, int count, int rateHz) {
+        TraceScope span(TRACE_STREAM_START);
+        BUS_OR_RETURN(bus, smHandle, -1);
+        if (count <= 0 || rateHz <= 0 || estopLatchedOn(bus)) {
+            return -1;
+        }
+        streamAbort(smHandle);
+        std::lock_guard<std::mutex> control(bus.streamControl);
+        smint32 *points = (smint32 *)malloc(count * sizeof(smint32));
+        if (points == NULL) {
+            return -1;
+        }
+        for (int i = 0; i < count; i++) {
+            points[i] = setpoints[i];
+        }
+        free(bus.streamPoints);
+        bus.streamPoints = points;
+        bus.streamCount = count;
+        bus.streamSent.store(0);
+        bus.streamStopRequest.store(0);
+        {
+            std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+            if (estopLatchedOn(bus)) {
+                return -1;  // Tripped since the check above
+            }
+            if (smBufferedInit(&bus.streamAxis, smHandle, bus.node, rateHz, SMP_ACTUAL_TORQUE, SMPRET_32B) != SM_OK) {
+                fprintf(stderr, "Failed to initialise buffered motion at %d Hz.\n", rateHz);
+                return -1;
+            }
+            bus.streamRunning.store(1, std::memory_order_release);
+        }
+        if (pthread_create(&bus.streamThread, NULL, streamMain, &bus) != 0) {
+            bus.streamRunning.store(0);
+            std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+            smBufferedDeinit(&bus.streamAxis);
+            fprintf(stderr, "Failed to start stream thread.\n");
+            return -1;
+        }
+        bus.streamJoinable = 1;
+        return 0;
+    }
+
+    // 1 while a trajectory is being streamed or played back on this bus
+    int streamActive(smbus smHandle) {
+        BUS_OR_RETURN(bus, smHandle, 0);
+        return bus.streamRunning.load(std::memory_order_acquire);
+    }
+
+    // Points handed to the drive so far
+    int streamSentPoints(smbus smHandle) {
+        BUS_OR_RETURN(bus, smHandle, 0);
+        return bus.streamSent.load(std::memory_order_acquire);
+    }
+
+    // Fill transactions issued on this bus since the library was loaded
+    uint64_t streamFillCount(smbus smHandle) {
+        BUS_OR_RETURN(bus, smHandle, 0);
+        return bus.streamFills.load(std::memory_order_relaxed);
+    }
+
+    // Hard e-stop: a native thread per armed bus waits for edges on its IR
+    // sensor's GPIO line (kernel GPIO character device) and, on the falling
+    // edge of a broken beam, latches the stop, aborts any setpoint stream
+    // and writes setpoint 0 (optionally also disabling the motor) on that
+    // bus itself, without waiting for Python or the GIL. The latch holds
+    // every later setpoint on that bus at 0 until estopAcknowledge(); other
+    // buses (walls) are not affected.
+    #define ESTOP_POLL_MS 100              // Wake-up interval to notice estopStop()
+    #define ESTOP_RETRIES 3                // Stop command attempts on a bus error
+    #define ESTOP_CLEAR_NS 5000000LL       // Beam clear this long before a stop can be acknowledged
+    #define ESTOP_MAX_EDGE_AGE_NS 10000000000LL  // Older "edges" mean a CLOCK_REALTIME stamp (pre-5.7 kernels)
+
+    typedef struct {
+        uint64_t triggers;      // Stops latched
+        uint64_t events;        // State changes (trip, beam clear, acknowledge), for estopWait
+        int64_t edgeNs;         // CLOCK_MONOTONIC time of the last trip edge
+        int64_t latencyNs;      // Last trip edge -> stop command acknowledged by the drive
+        int64_t maxLatencyNs;
+        int64_t clearNs;        // When the beam last cleared, 0 while it is broken
+        int32_t latched;
+        int32_t level;          // Sensor line: 1 idle, 0 beam broken
+        int32_t result;         // Last stop command: 0 sent, -1 bus error
+        int32_t priority;       // SCHED_FIFO priority the thread runs at, 0 if refused
+    } EstopStats;
+
+    // One armed e-stop. Slots are never freed, so a pointer read from a bus
+    // stays valid after the e-stop is stopped.
+    struct Estop {
+        int inUse = 0;                       // Guarded by estopSlots
+        std::atomic<int> running{0};
+        std::atomic<int> latched{0};
+        std::atomic<long> handle{-1};        // Bus the stop goes to; follows reconnects via estopRebind
+        std::atomic<long> closed{-1};        // Bus it was on when that bus closed, until rebound
+        pthread_t thread;
+        int fd = -1;
+        int disable = 0;
+        std::mutex mutex;                    // Guards stats; never held across bus I/O
+        std::condition_variable changed;
+        EstopStats stats;
+    };
+
+    static Estop estops[MAX_BUSES];
+    static std::mutex estopSlots;
+
+    static int estopLatchedOn(Bus &bus) {
+        Estop *estop = bus.estop.load(std::memory_order_acquire);
+        return estop != NULL && estop->latched.load(std::memory_order_acquire);
+    }
+
+    // An e-stop whose bus smHandle was closed and not yet rebound, or NULL.
+    // Caller holds estopSlots.
+    static Estop *estopDetachedFrom(smbus smHandle) {
+        for (int i = 0; i < MAX_BUSES; i++) {
+            if (estops[i].inUse && estops[i].closed.load(std::memory_order_acquire) == (long)smHandle) {
+                return &estops[i];
+            }
+        }
+        return NULL;
+    }
+
+    // The e-stop armed on smHandle's bus, or the one detached when it closed
+    // (still watching the beam and latched while its drive reconnects), or NULL
+    static Estop *estopFor(smbus smHandle) {
+        if (smHandle >= 0 && smHandle < MAX_BUSES) {
+            Estop *estop = buses[smHandle].estop.load(std::memory_order_acquire);
+            if (estop != NULL) {
+                return estop;
+            }
+        }
+        std::lock_guard<std::mutex> guard(estopSlots);
+        return estopDetachedFrom(smHandle);
+    }
+
+    static int estopReadLevel(Estop *estop) {
+        struct gpiohandle_data data;
+        memset(&data, 0, sizeof(data));
+        if (ioctl(estop->fd, GPIOHANDLE_GET_LINE_VALUES_IOCTL, &data) < 0) {
+            return -1;
+        }
+        return data.values[0];
+    }
+
+    // Stop the belt: drop any stream, then setpoint 0 (and disable) under the bus lock
+    static int estopSendStop(Estop *estop) {
+        TraceScope span(TRACE_ESTOP);
+        smbus smHandle = (smbus)estop->handle.load(std::memory_order_acquire);
+        if (smHandle < 0) {
+            return -1;  // Bus closed for a reconnect; the latch holds the new one at 0
+        }
+        BUS_OR_RETURN(bus, smHandle, -1);
+        bus.streamStopRequest.store(1, std::memory_order_release);  // The stream thread winds down after us
+        std::lock_guard<std::mutex> guard(lockBus(bus.mutex), std::adopt_lock);
+        if (bus.streamRunning.load(std::memory_order_acquire)) {
+            smBufferedAbort(&bus.streamAxis);
+        }
+        SM_STATUS status = smSetParameter(smHandle, bus.node, SMP_ABSOLUTE_SETPOINT, 0);
+        if (estop->disable) {
+            status |= smSetParameter(smHandle, bus.node, SMP_CONTROL_BITS1, 0);
+        }
+        return status == SM_OK ? 0 : -1;
+    }
+
+    static void estopTrip(Estop *estop, int64_t edgeNs, int64_t wokeNs) {
+        int first = !estop->latched.exchange(1, std::memory_order_acq_rel);
+        int result = 0;
+        if (first) {
+            for (int attempt = 0; attempt < ESTOP_RETRIES; attempt++) {
+                if ((result = estopSendStop(estop)) == 0) {
+                    break;
+                }
+            }
+        }
+        int64_t done = monotonicNs();
+        int64_t latency = done - edgeNs;
+        if (latency < 0 || latency > ESTOP_MAX_EDGE_AGE_NS) {
+            latency = done - wokeNs;
+            edgeNs = wokeNs;
+        }
+        std::lock_guard<std::mutex> guard(estop->mutex);
+        EstopStats &stats = estop->stats;
+        stats.level = 0;
+        stats.clearNs = 0;
+        if (first) {
+            stats.triggers++;
+            stats.latched = 1;
+            stats.edgeNs = edgeNs;
+            stats.latencyNs = latency;
+            if (latency > stats.maxLatencyNs) {
+                stats.maxLatencyNs = latency;
+            }
+            stats.result = result;
+        }
+        stats.events++;
+        estop->changed.notify_all();
+    }
+
+    static void estopClear(Estop *estop, int64_t edgeNs) {
+        std::lock_guard<std::mutex> guard(estop->mutex);
+        estop->stats.level = 1;
+        estop->stats.clearNs = edgeNs > 0 && monotonicNs() - edgeNs < ESTOP_MAX_EDGE_AGE_NS ? edgeNs : monotonicNs();
+        estop->stats.events++;
+        estop->changed.notify_all();
+    }
+
+    static void *estopMain(void *arg) {
+        Estop *estop = (Estop *)arg;
+        // A beam already broken at start counts as a trip
+        int level = estopReadLevel(estop);
+        if (level == 0) {
+            int64_t now = monotonicNs();
+            estopTrip(estop, now, now);
+        } else if (level == 1) {
+            estopClear(estop, monotonicNs());
+        }
+        struct pollfd pfd = {estop->fd, POLLIN, 0};
+        while (estop->running.load(std::memory_order_acquire)) {
+            if (poll(&pfd, 1, ESTOP_POLL_MS) <= 0) {
+                continue;
+            }
+            struct gpioevent_data event;
+            if (read(estop->fd, &event, sizeof(event)) != (ssize_t)sizeof(event)) {
+                continue;
+            }
+            if (event.id == GPIOEVENT_EVENT_FALLING_EDGE) {
+                estopTrip(estop, (int64_t)event.timestamp, monotonicNs());
+            } else {
+                estopClear(estop, (int64_t)event.timestamp);
+            }
+        }
+        return NULL;
+    }
+
+    // Watch line on chipPath (e.g. "/dev/gpiochip0") and stop the drive on
+    // smHandle when it falls; one e-stop per bus. priority > 0 asks for
+    // SCHED_FIFO; without the privilege the thread still runs at normal
+    // priority (see EstopStats.priority).
+    int estopStart(smbus smHandle, const char *chipPath, int line, int priority, int disableMotor) {
+        BUS_OR_RETURN(bus, smHandle, -1);
+        Estop *estop = NULL;
+        {
+            std::lock_guard<std::mutex> guard(estopSlots);
+            if (bus.estop.load() != NULL) {
+                fprintf(stderr, "E-stop already armed on bus %ld.\n", (long)smHandle);
+                return -1;
+            }
+            for (int i = 0; i < MAX_BUSES && estop == NULL; i++) {
+                if (!estops[i].inUse) {
+                    estop = &estops[i];
+                    estop->inUse = 1;
+                }
+            }
+        }
+        if (estop == NULL) {
+            return -1;
+        }
+
+        int chip = open(chipPath, O_RDONLY | O_CLOEXEC);
+        struct gpioevent_request request;
+        memset(&request, 0, sizeof(request));
+        request.lineoffset = (uint32_t)line;
+        request.handleflags = GPIOHANDLE_REQUEST_INPUT;
+        request.eventflags = GPIOEVENT_REQUEST_BOTH_EDGES;
+        snprintf(request.consumer_label, sizeof(request.consumer_label), "zazu_estop");
+        int requested = chip < 0 ? -1 : ioctl(chip, GPIO_GET_LINEEVENT_IOCTL, &request);
+        if (chip >= 0) {
+            close(chip);
+        }
+        if (requested < 0) {
+            fprintf(stderr, "E-stop: cannot request edge events on %s line %d.\n", chipPath, line);
+            std::lock_guard<std::mutex> guard(estopSlots);
+            estop->inUse = 0;
+            return -1;
+        }
+        estop->fd = request.fd;
+        estop->handle.store(smHandle);
+        estop->disable = disableMotor;
+        {
+            std::lock_guard<std::mutex> guard(estop->mutex);
+            uint64_t events = estop->stats.events;  // Keep counting, so no waiter misses a change
+            memset(&estop->stats, 0, sizeof(estop->stats));
+            estop->stats.events = events;
+            estop->stats.level = 1;
+        }
+        estop->latched.store(0);
+        estop->running.store(1, std::memory_order_release);
+
+        int started = -1;
+        if (priority > 0) {
+            pthread_attr_t attr;
+            struct sched_param param;
+            memset(&param, 0, sizeof(param));
+            param.sched_priority = priority;
+            pthread_attr_init(&attr);
+            pthread_attr_setinheritsched(&attr, PTHREAD_EXPLICIT_SCHED);
+            pthread_attr_setschedpolicy(&attr, SCHED_FIFO);
+            pthread_attr_setschedparam(&attr, &param);
+            started = pthread_create(&estop->thread, &attr, estopMain, estop);
+            pthread_attr_destroy(&attr);
+            if (started == 0) {
+                std::lock_guard<std::mutex> guard(estop->mutex);
+                estop->stats.priority = priority;
+            } else {
+                fprintf(stderr, "E-stop: SCHED_FIFO %d refused; running at normal priority.\n", priority);
+            }
+        }
+        if (started != 0 && pthread_create(&estop->thread, NULL, estopMain, estop) != 0) {
+            estop->running.store(0);
+            close(estop->fd);
+            estop->fd = -1;
+            std::lock_guard<std::mutex> guard(estopSlots);
+            estop->inUse = 0;
+            fprintf(stderr, "E-stop: failed to start thread.\n");
+            return -1;
+        }
+        pthread_setname_np(estop->thread, "estop");
+        bus.estop.store(estop, std::memory_order_release);
+        printf("E-stop armed on %s line %d for bus %ld.\n", chipPath, line, (long)smHandle);
+        return 0;
+    }
+
+    // Stop watching smHandle's sensor; its latch is released with it
+    void estopStop(smbus smHandle) {
+        Estop *estop = NULL;
+        {
+            std::lock_guard<std::mutex> guard(estopSlots);
+            if (smHandle >= 0 && smHandle < MAX_BUSES) {
+                estop = buses[smHandle].estop.exchange(NULL);
+            }
+            if (estop == NULL) {
+                estop = estopDetachedFrom(smHandle);
+            }
+            if (estop == NULL) {
+                return;
+            }
+            estop->closed.store(-1, std::memory_order_release);
+        }
+        estop->running.store(0, std::memory_order_release);
+        pthread_join(estop->thread, NULL);
+        close(estop->fd);
+        estop->fd = -1;
+        estop->latched.store(0, std::memory_order_release);
+        {
+            std::lock_guard<std::mutex> guard(estop->mutex);
+            estop->stats.latched = 0;
+            estop->stats.events++;
+            estop->changed.notify_all();
+        }
+        std::lock_guard<std::mutex> guard(estopSlots);
+        estop->inUse = 0;
+    }
+
+    // closeSimucube: keep the e-stop watching and latched, but bound to no
+    // bus until estopRebind hands it the reopened one
+    static void estopDetach(smbus smHandle) {
+        if (smHandle < 0 || smHandle >= MAX_BUSES) {
+            return;
+        }
+        std::lock_guard<std::mutex> guard(estopSlots);
+        Estop *estop = buses[smHandle].estop.exchange(NULL);
+        if (estop != NULL) {
+            estop->handle.store(-1, std::memory_order_release);
+            estop->closed.store(smHandle, std::memory_order_release);
+        }
+    }
+
+    // The supervisor reopened the drive's bus; move its e-stop (and latch)
+    // from oldHandle, closed or not, to newHandle. Returns 0 when moved or
+    // when no e-stop was armed on oldHandle, -1 when it could not follow
+    // (bad handle, or newHandle already has an e-stop of its own); it then
+    // stays where it was, still latched, and is found under oldHandle.
+    int estopRebind(smbus oldHandle, smbus newHandle) {
+        BUS_OR_RETURN(to, newHandle, -1);
+        std::lock_guard<std::mutex> guard(estopSlots);
+        Estop *estop = oldHandle >= 0 && oldHandle < MAX_BUSES ? buses[oldHandle].estop.load() : NULL;
+        int attached = estop != NULL;
+        if (estop == NULL) {
+            estop = estopDetachedFrom(oldHandle);
+        }
+        if (estop == NULL || (attached && oldHandle == newHandle)) {
+            return 0;
+        }
+        Estop *there = to.estop.load();
+        if (there != NULL && there != estop) {
+            fprintf(stderr, "E-stop: bus %ld already has an e-stop; cannot move bus %ld's to it.\n",
+                    (long)newHandle, (long)oldHandle);
+            return -1;
+        }
+        if (attached) {
+            buses[oldHandle].estop.store(NULL, std::memory_order_release);
+        }
+        estop->handle.store(newHandle, std::memory_order_release);
+        estop->closed.store(-1, std::memory_order_release);
+        to.estop.store(estop, std::memory_order_release);
+        return 0;
+    }
+
+    int estopIsLatched(smbus smHandle) {
+        Estop *estop = estopFor(smHandle);
+        return estop != NULL && estop->latched.load(std::memory_order_acquire);
+    }
+
+    // Release smHandle's latch. Refused (-1) unless the beam has been clear
+    // for ESTOP_CLEAR_NS, so a bouncing or still-broken beam keeps the belt stopped
+    int estopAcknowledge(smbus smHandle) {
+        Estop *estop = estopFor(smHandle);
+        if (estop == NULL) {
+            return 0;
+        }
+        std::lock_guard<std::mutex> guard(estop->mutex);
+        EstopStats &stats = estop->stats;
+        if (!stats.latched) {
+            return 0;
+        }
+        if (stats.level != 1 || stats.clearNs == 0 || monotonicNs() - stats.clearNs < ESTOP_CLEAR_NS ||
+            estopReadLevel(estop) != 1) {
+            return -1;
+        }
+        stats.latched = 0;
+        stats.events++;
+        estop->latched.store(0, std::memory_order_release);
+        estop->changed.notify_all();
+        return 0;
+    }
+
+    int estopGetStats(smbus smHandle, EstopStats *out) {
+        Estop *estop = estopFor(smHandle);
+        if (estop == NULL) {
+            return -1;
+        }
+        std::lock_guard<std::mutex> guard(estop->mutex);
+        *out = estop->stats;
+        return 0;
+    }
+
+    // Block until smHandle's e-stop state changes from seenEvents or
+    // timeoutMs passes; returns the current event count (ctypes drops the
+    // GIL meanwhile), or seenEvents when no e-stop is armed on the bus
+    uint64_t estopWait(smbus smHandle, uint64_t seenEvents, int timeoutMs) {
+        Estop *estop = estopFor(smHandle);
+        if (estop == NULL) {
+            return seenEvents;
+        }
+        std::unique_lock<std::mutex> lock(estop->mutex);
+        estop->changed.wait_for(lock, std::chrono::milliseconds(timeoutMs), [estop, seenEvents] {
+            return estop->stats.events != seenEvents || !estop->running.load();
+        });
+        return estop->stats.events;
+    }
 }
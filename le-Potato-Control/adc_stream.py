@@ -0,0 +1,247 @@
+import os
+import re
+import select
+import numpy as np
+from backend import open_virtual_adc
+from filters import build_chain, deployment_config
+from metrics import timed
+
+# ADC Configuration
+IIO_DEVICE = "iio:device0"
+IIO_SYSFS = f"/sys/bus/iio/devices/{IIO_DEVICE}"
+ADC_CHANNEL = 0
+ADC_PATH = f"{IIO_SYSFS}/in_voltage{ADC_CHANNEL}_raw"
+
+# Buffered acquisition
+SAMPLE_RATE = 1000     # Hz, set on the trigger when it exposes sampling_frequency
+BLOCK_SIZE = 32        # Samples per wake-up (buffer watermark)
+BUFFER_LENGTH = 512    # Kernel buffer length in samples
+RING_SIZE = 4096       # Samples kept in the NumPy ring buffer
+OVERSAMPLE = 16        # Samples combined into one filtered reading
+ADC_FILTERS = deployment_config("adc_filters", [["median", {"window": OVERSAMPLE}]])
+TRIGGER_NAME = None    # e.g. "hrtimer0"; None keeps whatever trigger is set
+
+# scan_elements type strings look like "le:u12/16>>0"
+SCAN_TYPE = re.compile(r"(?P<endian>[bl]e):(?P<sign>[su])(?P<bits>\d+)/(?P<storage>\d+)(?:X\d+)?>>(?P<shift>\d+)")
+
+
+def _write_sysfs(path, value):
+    with open(path, "w") as f:
+        f.write(str(value))
+
+
+def _read_sysfs(path):
+    with open(path, "r") as f:
+        return f.read().strip()
+
+
+def parse_scan_type(type_string):
+    """Turn an IIO scan type string into (numpy dtype, bits, shift)."""
+    match = SCAN_TYPE.match(type_string)
+    if not match:
+        raise ValueError(f"Unsupported scan type: {type_string}")
+    endian = "<" if match["endian"] == "le" else ">"
+    kind = "i" if match["sign"] == "s" else "u"
+    storage_bytes = int(match["storage"]) // 8
+    dtype = np.dtype(f"{endian}{kind}{storage_bytes}")
+    return dtype, int(match["bits"]), int(match["shift"])
+
+
+# ADC Reader class for efficient file handling
+class ADCReader:
+    """Sysfs single-sample reader, kept as the fallback path."""
+
+    def __init__(self, path=ADC_PATH):
+        self.path = path
+        self.file = None
+
+    def open(self):
+        try:
+            self.file = open(self.path, "r")
+            return True
+        except Exception as e:
+            print(f"Error opening ADC file: {e}")
+            return False
+
+    def read(self):
+        if not self.file:
+            if not self.open():
+                return None
+
+        try:
+            self.file.seek(0)
+            raw_value = int(self.file.read().strip())
+            return raw_value
+        except Exception as e:
+            print(f"Error reading ADC: {e}")
+            self.close()
+            return None
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class SampleRing:
+    """Fixed-size NumPy ring buffer of ADC codes."""
+
+    def __init__(self, size=RING_SIZE, dtype=np.int32):
+        self.data = np.zeros(size, dtype=dtype)
+        self.size = size
+        self.head = 0    # Next write position
+        self.count = 0   # Total samples ever written
+
+    def extend(self, block):
+        n = len(block)
+        if n >= self.size:
+            self.data[:] = block[-self.size:]
+            self.head = 0
+        else:
+            end = self.head + n
+            if end <= self.size:
+                self.data[self.head:end] = block
+            else:
+                split = self.size - self.head
+                self.data[self.head:] = block[:split]
+                self.data[:end - self.size] = block[split:]
+            self.head = end % self.size
+        self.count += n
+
+    def latest(self, n):
+        """Return the most recent n samples, oldest first."""
+        n = min(n, self.count, self.size)
+        start = (self.head - n) % self.size
+        if start + n <= self.size:
+            return self.data[start:start + n].copy()
+        return np.concatenate((self.data[start:], self.data[:self.head]))
+
+
+class BufferedADC:
+    """IIO triggered-buffer reader that streams binary samples in blocks.
+
+    The channel is enabled in scan_elements, the kernel buffer is sized and
+    given a watermark of BLOCK_SIZE, and each read() drains every pending scan
+    from /dev/iio:deviceN in one syscall, decodes them with NumPy into a ring
+    buffer and runs the block through the ADC filter chain (by default a
+    median over OVERSAMPLE samples), returning the newest filtered value.
+    """
+
+    def __init__(self, device=IIO_DEVICE, channel=ADC_CHANNEL, sample_rate=SAMPLE_RATE,
+                 block_size=BLOCK_SIZE, buffer_length=BUFFER_LENGTH,
+                 ring_size=RING_SIZE, filters=ADC_FILTERS, trigger=TRIGGER_NAME):
+        self.device = device
+        self.sysfs = f"/sys/bus/iio/devices/{device}"
+        self.channel = channel
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.buffer_length = buffer_length
+        self.filter = build_chain(filters)
+        self.trigger = trigger
+        self.ring = SampleRing(ring_size)
+        self.fd = None
+        self.poller = None
+        self.dtype = None
+        self.bits = 12
+        self.shift = 0
+        self.reads = 0   # read() syscalls issued, for comparison with sysfs mode
+
+    def _configure(self):
+        scan = f"{self.sysfs}/scan_elements"
+        _write_sysfs(f"{self.sysfs}/buffer/enable", 0)
+
+        # Enable only our channel so each scan is a single sample
+        for name in os.listdir(scan):
+            if name.endswith("_en"):
+                _write_sysfs(f"{scan}/{name}", 1 if name == f"in_voltage{self.channel}_en" else 0)
+        self.dtype, self.bits, self.shift = parse_scan_type(
+            _read_sysfs(f"{scan}/in_voltage{self.channel}_type"))
+
+        if self.trigger:
+            _write_sysfs(f"{self.sysfs}/trigger/current_trigger", self.trigger)
+            for entry in os.listdir("/sys/bus/iio/devices"):
+                trig = f"/sys/bus/iio/devices/{entry}"
+                if entry.startswith("trigger") and _read_sysfs(f"{trig}/name") == self.trigger:
+                    if os.path.exists(f"{trig}/sampling_frequency"):
+                        _write_sysfs(f"{trig}/sampling_frequency", self.sample_rate)
+
+        _write_sysfs(f"{self.sysfs}/buffer/length", self.buffer_length)
+        if os.path.exists(f"{self.sysfs}/buffer/watermark"):
+            _write_sysfs(f"{self.sysfs}/buffer/watermark", self.block_size)
+        _write_sysfs(f"{self.sysfs}/buffer/enable", 1)
+
+    def open(self):
+        try:
+            self._configure()
+            self.fd = os.open(f"/dev/{self.device}", os.O_RDONLY | os.O_NONBLOCK)
+            self.poller = select.poll()
+            self.poller.register(self.fd, select.POLLIN)
+            return True
+        except (OSError, ValueError) as e:
+            print(f"Buffered ADC unavailable: {e}")
+            self.close()
+            return False
+
+    def read_block(self, timeout_ms=None):
+        """Drain pending scans into the ring buffer and return them decoded."""
+        if timeout_ms is None:
+            timeout_ms = max(1, int(2000 * self.block_size / self.sample_rate))
+        if not self.poller.poll(timeout_ms):
+            return np.empty(0, dtype=np.int32)
+        item = self.dtype.itemsize
+        try:
+            raw = os.read(self.fd, self.buffer_length * item)
+        except BlockingIOError:
+            return np.empty(0, dtype=np.int32)
+        self.reads += 1
+        usable = len(raw) - len(raw) % item
+        block = np.frombuffer(raw[:usable], dtype=self.dtype).astype(np.int32)
+        block = (block >> self.shift) & ((1 << self.bits) - 1)
+        if self.dtype.kind == "i":
+            block = np.where(block >= 1 << (self.bits - 1), block - (1 << self.bits), block)
+        self.ring.extend(block)
+        self.filter.process(block)
+        return block
+
+    def read(self, timeout_ms=None):
+        """Filtered ADC code from the newest oversampled window."""
+        if self.fd is None:
+            return None
+        try:
+            self.read_block(timeout_ms)
+        except OSError as e:
+            print(f"Error reading ADC: {e}")
+            return None
+        if self.filter.value is None:
+            return None
+        return int(self.filter.value)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        try:
+            _write_sysfs(f"{self.sysfs}/buffer/enable", 0)
+        except OSError:
+            pass
+
+
+def _open_reader(buffered, **kwargs):
+    virtual = open_virtual_adc()
+    if virtual is not None:
+        return virtual
+    if buffered:
+        adc = BufferedADC(**kwargs)
+        if adc.open():
+            return adc
+        print("Falling back to sysfs ADC reads.")
+    channel = kwargs.get("channel", ADC_CHANNEL)
+    device = kwargs.get("device", IIO_DEVICE)
+    return ADCReader(f"/sys/bus/iio/devices/{device}/in_voltage{channel}_raw")
+
+
+def open_adc(buffered=True, **kwargs):
+    """Return a BufferedADC when the triggered buffer works, else the sysfs reader."""
+    adc = _open_reader(buffered, **kwargs)
+    adc.read = timed("adc_read", adc.read)
+    return adc
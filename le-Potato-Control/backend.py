@@ -0,0 +1,47 @@
+import os
+
+# Backend selection: "hardware" (default) or "sim" for the virtual wall.
+#   ZAZU_BACKEND=sim          use simulated drive, LCD, ADC and GPIO
+#   ZAZU_TIME_SCALE=10        run the virtual clock 10x faster than real time
+#   ZAZU_SIM_SCENARIO=x.json  override scenario keys from virtual_wall.DEFAULT_SCENARIO
+BACKEND = os.environ.get("ZAZU_BACKEND", "hardware")
+SIMULATED = BACKEND == "sim"
+TIME_SCALE = float(os.environ.get("ZAZU_TIME_SCALE", "1"))
+SCENARIO_PATH = os.environ.get("ZAZU_SIM_SCENARIO")
+
+wall = None
+if SIMULATED:
+    import virtual_wall
+
+    if TIME_SCALE != 1:
+        virtual_wall.VirtualClock(TIME_SCALE).install()
+    scenario = virtual_wall.load_scenario(SCENARIO_PATH) if SCENARIO_PATH else None
+    wall = virtual_wall.VirtualWall(scenario)
+    print(f"Using simulated wall backend (time scale {TIME_SCALE:g}x).")
+
+
+def load_simucube(path):
+    """libsimucube, or the simulated drive with the same functions."""
+    if SIMULATED:
+        return virtual_wall.SimulatedHost(wall)
+    import ctypes
+    return ctypes.CDLL(path)
+
+
+def open_smbus(bus_number):
+    if SIMULATED:
+        return virtual_wall.VirtualSMBus(bus_number)
+    from smbus2 import SMBus
+    return SMBus(bus_number)
+
+
+def load_gpiod():
+    if SIMULATED:
+        return virtual_wall.VirtualGpiod(wall)
+    import gpiod
+    return gpiod
+
+
+def open_virtual_adc():
+    """The simulated button ladder, or None on real hardware."""
+    return virtual_wall.VirtualADC(wall) if SIMULATED else None
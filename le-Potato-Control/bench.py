@@ -0,0 +1,330 @@
+import argparse
+import contextlib
+import ctypes
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# Benchmark Configuration
+DEFAULT_ITERATIONS = 2000
+BUTTON_PRESSES = 30
+TORQUE_SECONDS = 3.0
+PERCENTILES = (50, 90, 99)
+MAX_WALLS = 4
+
+
+class StopBenchmark(BaseException):
+    """Raised inside a patched call to end an otherwise endless control loop.
+
+    A BaseException, so run_periodic's per-tick error handling lets it through.
+    """
+
+
+def summarize(samples_ms):
+    """Percentile summary of a list of durations in milliseconds."""
+    import numpy as np
+    data = np.asarray(samples_ms, dtype=np.float64)
+    if data.size == 0:
+        return {"count": 0}
+    summary = {"count": int(data.size), "mean_ms": float(data.mean()), "max_ms": float(data.max())}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = float(np.percentile(data, p))
+    return summary
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return samples
+
+
+# detect_button: table lookup alone and the full decoder update
+def bench_detect_button(iterations):
+    import numpy as np
+    from button_decoder import ButtonDecoder
+    decoder = ButtonDecoder()
+    codes = np.random.randint(0, 4096, iterations).tolist()
+    results = {}
+    start = time.perf_counter()
+    for code in codes:
+        decoder.classify(code)
+    results["classify_us_per_sample"] = (time.perf_counter() - start) * 1e6 / iterations
+    now = 0.0
+    start = time.perf_counter()
+    for code in codes:
+        now += 0.001
+        decoder.update(code, now)
+    results["update_us_per_sample"] = (time.perf_counter() - start) * 1e6 / iterations
+    return results
+
+
+class ScriptedADC:
+    """ADC stand-in that alternates press and release on a fixed cadence."""
+
+    def __init__(self, presses, code, hold=0.12, gap=0.12):
+        self.presses = presses
+        self.code = code
+        self.hold = hold
+        self.gap = gap
+        self.start = time.perf_counter()
+        self.press_times = []  # First read that returned the press code
+
+    def read(self):
+        elapsed = time.perf_counter() - self.start
+        index, phase = divmod(elapsed, self.hold + self.gap)
+        if index >= self.presses:
+            raise StopBenchmark()
+        if phase < self.hold:
+            if len(self.press_times) <= index:
+                self.press_times.append(time.perf_counter())
+            return self.code
+        return 3507
+
+    def close(self):
+        pass
+
+
+# Button press -> setSpeed returned, through the scheduled main.button_poller
+def bench_button_path(presses):
+    import main
+    from scheduler import PeriodicTask, run_periodic
+    adc = ScriptedADC(presses, code=540)
+    set_times = []
+    last_speed = [None]
+    original = main.libsimucube.setSpeed
+
+    def set_speed(handle, speed):
+        result = original(handle, speed)
+        if speed != last_speed[0]:  # Keepalives re-send the old value; skip them
+            last_speed[0] = speed
+            set_times.append(time.perf_counter())
+        return result
+
+    main.open_adc = lambda: adc
+    main.libsimucube.setSpeed = set_speed
+    main.current_speed = main.MIN_SPEED_RPM
+    handle = ctypes.c_int(1)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                run_periodic(PeriodicTask("buttons", main.POLL_DELAY, main.button_poller(handle)))
+            except StopBenchmark:
+                pass
+    finally:
+        main.libsimucube.setSpeed = original
+
+    # Pair each press with the first setpoint that followed it
+    latencies = []
+    for pressed in adc.press_times:
+        after = [t for t in set_times if t >= pressed]
+        if after:
+            latencies.append((after[0] - pressed) * 1000.0)
+    return summarize(latencies)
+
+
+# LCD repaint cost on the bus stand-in: full frame and one changed digit
+def bench_lcd(iterations):
+    from lcd_driver import LCD
+    from virtual_wall import VirtualSMBus
+    lcd = LCD(VirtualSMBus())
+    lcd.init()
+    full, single = [], []
+    for i in range(iterations):
+        lcd.invalidate()
+        lcd.set_line(f"Speed: {i % 20:02} m/min".center(16), 1)
+        lcd.set_line("Motor Control".center(16), 2)
+        full_stats = lcd.refresh()
+        full.append(full_stats.elapsed_ms)
+        lcd.set_line(f"Speed: {(i + 1) % 20:02} m/min".center(16), 1)
+        single_stats = lcd.refresh()
+        single.append(single_stats.elapsed_ms)
+    return {"full_repaint": summarize(full), "digit_change": summarize(single),
+            "bytes_full": full_stats.i2c_bytes, "bytes_digit_change": single_stats.i2c_bytes}
+
+
+# monitor_torque_and_sensor tick time and achieved loop rate
+def bench_torque_tick(seconds):
+    import torque_speed
+    lib = torque_speed.libsimucube
+    originals = {"exchangeState": lib.exchangeState, "readState": lib.readState}
+    calls = []
+    deadline = time.perf_counter() + seconds
+
+    def recorded(original):
+        def call(*args):
+            start = time.perf_counter()
+            if start > deadline:
+                raise StopBenchmark()
+            result = original(*args)
+            calls.append((start, time.perf_counter()))
+            return result
+        return call
+
+    class IdleSensor:
+        triggered = False
+
+    for name, original in originals.items():
+        setattr(lib, name, recorded(original))
+    handle = ctypes.c_int(1)
+    setpoints = torque_speed.SetpointManager(handle)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                torque_speed.monitor_torque_and_sensor(handle, IdleSensor(), setpoints)
+            except StopBenchmark:
+                pass
+    finally:
+        for name, original in originals.items():
+            setattr(lib, name, original)
+
+    periods = [(b[0] - a[0]) * 1000.0 for a, b in zip(calls, calls[1:])]
+    bus = [(end - start) * 1000.0 for start, end in calls]
+    stats = setpoints.stats
+    return {"ticks_per_second": len(calls) / seconds, "period": summarize(periods),
+            "bus_call": summarize(bus), "setpoint_writes": stats.writes,
+            "keepalives": stats.keepalives, "suppressed_writes": stats.suppressed}
+
+
+# Raw libsimucube call latency
+def bench_drive_calls(iterations):
+    from simucube import libsimucube, DriveState
+    handle = ctypes.c_int()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if libsimucube.openSimucube(ctypes.byref(handle)) != 0:
+            return {"error": "failed to open drive"}
+        libsimucube.clearFaultsAndInitialize(handle.value)
+    torque = ctypes.c_int()
+    state = DriveState()
+    results = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results["setSpeed"] = summarize(timed(lambda: libsimucube.setSpeed(handle.value, 0), iterations))
+            results["getTorque"] = summarize(timed(
+                lambda: libsimucube.getTorque(handle.value, ctypes.byref(torque)), iterations))
+            results["exchangeState"] = summarize(timed(
+                lambda: libsimucube.exchangeState(handle.value, 0, ctypes.byref(state)), iterations))
+            results["readState"] = summarize(timed(
+                lambda: libsimucube.readState(handle.value, ctypes.byref(state)), iterations))
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            libsimucube.setSpeed(handle.value, 0)
+            libsimucube.closeSimucube(handle.value)
+    return results
+
+
+# Per-wall loop rate and exchange latency as walls are added
+def bench_walls(seconds, max_walls):
+    import walls
+    results = {}
+    for count in range(1, max_walls + 1):
+        # Fresh names per run so each gets its own simulated drive and metrics series
+        group = [walls.Wall(walls.wall_drive(f"bench{count}_{i}", f"BENCH{count}{i}".encode()))
+                 for i in range(1, count + 1)]
+        samples = {wall.name: [] for wall in group}
+        for wall in group:
+            def exchange(state, now=None, original=wall.setpoints.exchange, out=samples[wall.name]):
+                start = time.perf_counter()
+                result = original(state, now)
+                out.append((time.perf_counter() - start) * 1000.0)
+                return result
+            wall.setpoints.exchange = exchange
+        with contextlib.redirect_stdout(io.StringIO()):
+            for wall in group:
+                if not wall.connect()[0]:
+                    return {"error": f"failed to open {wall.name}"}
+            for wall in group:
+                wall.start()
+            time.sleep(seconds)
+            for wall in group:
+                wall.stop()
+            for wall in group:
+                wall.close()
+        per_wall = {}
+        for wall in group:
+            latency = summarize(samples[wall.name])
+            per_wall[wall.name] = {"loops_per_second": wall.task.stats.runs / seconds,
+                                   "overruns": wall.task.stats.overruns,
+                                   "exchange_p50_ms": latency.get("p50_ms", 0.0),
+                                   "exchange_p99_ms": latency.get("p99_ms", 0.0)}
+        results[f"{count}_walls"] = per_wall
+    return results
+
+
+BENCHMARKS = {
+    "detect_button": lambda args: bench_detect_button(args.iterations * 10),
+    "button_path": lambda args: bench_button_path(args.presses),
+    "lcd": lambda args: bench_lcd(args.iterations),
+    "torque_tick": lambda args: bench_torque_tick(args.seconds),
+    "drive_calls": lambda args: bench_drive_calls(args.iterations),
+    "walls": lambda args: bench_walls(args.seconds, args.walls),
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_results(name, results, indent="  "):
+    for key, value in results.items():
+        if isinstance(value, dict) and "count" in value:
+            parts = [f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in value.items()]
+            print(f"{indent}{key}: {' '.join(parts)}")
+        elif isinstance(value, dict):
+            print(f"{indent}{key}:")
+            print_results(key, value, indent + "  ")
+        else:
+            print(f"{indent}{key}: {value:.3f}" if isinstance(value, float) else f"{indent}{key}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmarks for the wall control stack.")
+    parser.add_argument("--backend", choices=["sim", "hardware"], default="sim")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS),
+                        help="Run only the named benchmark (repeatable)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--presses", type=int, default=BUTTON_PRESSES)
+    parser.add_argument("--seconds", type=float, default=TORQUE_SECONDS)
+    parser.add_argument("--walls", type=int, default=MAX_WALLS, help="Largest wall count for the walls benchmark")
+    parser.add_argument("--json", help="Write machine-readable results to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    # The backend is chosen at import time, and latencies need a real-time clock
+    os.environ["ZAZU_BACKEND"] = args.backend
+    os.environ["ZAZU_TIME_SCALE"] = "1"
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {},
+    }
+    for name in args.only or BENCHMARKS:
+        print(f"{name}:")
+        results = BENCHMARKS[name](args)
+        report["results"][name] = results
+        print_results(name, results)
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
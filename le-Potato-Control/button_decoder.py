@@ -0,0 +1,195 @@
+import numpy as np
+
+# ADC range of the button ladder
+ADC_CODES = 4096
+RELEASED = "no_press"
+
+# Default Button Calibration Thresholds (ADC code at each button)
+DEFAULT_THRESHOLDS = {
+    "button_1": 5,
+    "button_2": 540,
+    "button_3": 1807,
+    "button_4": 1196,
+    "button_5": 2615,
+    RELEASED: 3507,
+}
+
+# Timing (seconds)
+DEBOUNCE_TIME = 0.03     # Code must stay on a new button this long
+LONG_PRESS_TIME = 0.6    # Held this long -> long_press event
+REPEAT_DELAY = 0.5       # Held this long -> auto-repeat starts
+REPEAT_RATE = 8.0        # Repeats per second once repeating (0 disables)
+HYSTERESIS = 60          # ADC codes a reading may stray past a midpoint
+
+# Events
+PRESS = "press"
+RELEASE = "release"
+LONG_PRESS = "long_press"
+REPEAT = "repeat"
+
+
+def build_lookup(thresholds, codes=ADC_CODES):
+    """Precompute the code->button index table and each button's code range.
+
+    Buttons are sorted by their calibrated code and split at the midpoints
+    between neighbours, so the result does not depend on dict order.
+    """
+    names = sorted(thresholds, key=thresholds.get)
+    levels = np.array([thresholds[name] for name in names], dtype=np.float64)
+    edges = np.ceil((levels[:-1] + levels[1:]) / 2).astype(np.int64)
+    table = np.searchsorted(edges, np.arange(codes), side="right").astype(np.int8)
+    bounds = np.concatenate(([0], edges, [codes]))
+    ranges = {name: (int(bounds[i]), int(bounds[i + 1]) - 1) for i, name in enumerate(names)}
+    return names, table, ranges
+
+
+def calibrate(recordings, trim=0.1):
+    """Learn thresholds from recorded samples.
+
+    recordings maps a button name to an array of ADC codes captured while
+    that button (or nothing, for "no_press") was held. The trimmed mean of
+    each recording becomes the button's calibrated level.
+    """
+    thresholds = {}
+    for name, samples in recordings.items():
+        data = np.sort(np.asarray(samples, dtype=np.float64))
+        cut = int(len(data) * trim)
+        if cut and len(data) > 2 * cut:
+            data = data[cut:-cut]
+        thresholds[name] = int(round(data.mean()))
+    return thresholds
+
+
+def calibrate_labelled(samples, labels, trim=0.1):
+    """Calibrate from one recording with a per-sample button label array."""
+    samples = np.asarray(samples)
+    labels = np.asarray(labels)
+    return calibrate({name: samples[labels == name] for name in np.unique(labels)}, trim)
+
+
+class ButtonDecoder:
+    """Table-driven button decoder with debounce, long-press and auto-repeat.
+
+    update(code, now) is the only input and returns the events produced by
+    that sample, so the decoder can be driven by live ADC reads or by
+    recorded arrays through decode().
+    """
+
+    def __init__(self, thresholds=DEFAULT_THRESHOLDS, debounce=DEBOUNCE_TIME,
+                 long_press=LONG_PRESS_TIME, repeat_delay=REPEAT_DELAY,
+                 repeat_rate=REPEAT_RATE, hysteresis=HYSTERESIS, repeat_rates=None):
+        self.names, self.table, self.ranges = build_lookup(thresholds)
+        self.debounce = debounce
+        self.long_press = long_press
+        self.repeat_delay = repeat_delay
+        self.repeat_rate = repeat_rate
+        self.repeat_rates = repeat_rates or {}  # Per-button override, 0 = no repeat
+        self.hysteresis = hysteresis
+        self.reset()
+
+    def reset(self):
+        self.current = RELEASED   # Debounced button
+        self.candidate = None     # Button waiting out the debounce time
+        self.candidate_since = 0.0
+        self.pressed_at = 0.0
+        self.long_sent = False
+        self.next_repeat = None
+
+    def classify(self, code):
+        """Raw button for an ADC code, no state involved."""
+        return self.names[self.table[min(max(int(code), 0), len(self.table) - 1)]]
+
+    def _sticky(self, code):
+        # Stay on the current button while inside its widened band
+        lo, hi = self.ranges[self.current]
+        if lo - self.hysteresis <= code <= hi + self.hysteresis:
+            return self.current
+        return self.classify(code)
+
+    def _rate(self, button):
+        return self.repeat_rates.get(button, self.repeat_rate)
+
+    def update(self, code, now):
+        """Feed one ADC sample taken at time now and return the events."""
+        events = []
+        button = self._sticky(code)
+
+        if button != self.current:
+            if button != self.candidate:
+                self.candidate = button
+                self.candidate_since = now
+            if now - self.candidate_since >= self.debounce:
+                if self.current != RELEASED:
+                    events.append((RELEASE, self.current))
+                self.current = button
+                self.candidate = None
+                if button != RELEASED:
+                    events.append((PRESS, button))
+                    self.pressed_at = now
+                    self.long_sent = False
+                    rate = self._rate(button)
+                    self.next_repeat = now + self.repeat_delay if rate > 0 else None
+            return events
+
+        self.candidate = None
+        if self.current == RELEASED:
+            return events
+        held = now - self.pressed_at
+        if not self.long_sent and held >= self.long_press:
+            self.long_sent = True
+            events.append((LONG_PRESS, self.current))
+        if self.next_repeat is not None and now >= self.next_repeat:
+            events.append((REPEAT, self.current))
+            self.next_repeat += 1.0 / self._rate(self.current)
+            if self.next_repeat <= now:
+                # Sampling slower than the repeat rate: don't burst to catch up
+                self.next_repeat = now + 1.0 / self._rate(self.current)
+        return events
+
+    def decode(self, samples, times=None, sample_rate=None):
+        """Run the decoder over recorded samples and return (time, event, button).
+
+        Pass either times (seconds per sample) or sample_rate (Hz).
+        """
+        samples = np.asarray(samples)
+        if times is None:
+            if not sample_rate or sample_rate <= 0:
+                raise ValueError("decode needs the sample times or a positive sample_rate")
+            times = np.arange(len(samples)) / float(sample_rate)
+        elif len(times) != len(samples):
+            raise ValueError(f"{len(times)} times for {len(samples)} samples")
+        self.reset()
+        results = []
+        for code, now in zip(samples.tolist(), np.asarray(times).tolist()):
+            for event, button in self.update(code, now):
+                results.append((now, event, button))
+        return results
+
+
+# Interactive calibration: record each button and print the learned thresholds
+if __name__ == "__main__":
+    import time
+    from adc_stream import open_adc
+
+    adc = open_adc()
+    recordings = {}
+    try:
+        for name in DEFAULT_THRESHOLDS:
+            input(f"Hold {name} (release all for {RELEASED}) and press Enter...")
+            samples = []
+            end = time.monotonic() + 1.0
+            while time.monotonic() < end:
+                value = adc.read()
+                if value is not None:
+                    samples.append(value)
+                time.sleep(0.005)
+            recordings[name] = samples
+            print(f"{name}: {len(samples)} samples")
+    finally:
+        adc.close()
+
+    thresholds = calibrate(recordings)
+    print("button_thresholds = {")
+    for name, value in sorted(thresholds.items(), key=lambda item: item[1]):
+        print(f'    "{name}": {value},')
+    print("}")
@@ -0,0 +1,533 @@
+import asyncio
+import ctypes
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from adc_stream import open_adc
+from button_decoder import ButtonDecoder, PRESS, REPEAT
+from ir_sensor import IRSensor
+from estop import NativeEStop
+from lcd_driver import open_lcd, LCD_WIDTH
+from metrics import METRICS, start_server, timed
+from simucube import libsimucube, DriveState, connect_drive, print_timings
+from startup import Startup, ensure_overlays, print_ready
+from supervisor import DriveSupervisor
+from setpoint import SetpointManager
+from speed_ramp import SpeedStreamer
+from incline import open_incline
+from telemetry import open_recorder
+from torque_speed import TorqueGate
+from tracing import record as trace_span
+
+# Button Calibration Thresholds
+button_thresholds = {
+    "button_1": 5,     # Decrease incline
+    "button_2": 540,   # Increase speed
+    "button_3": 1807,  # Increase incline
+    "button_4": 1196,  # Decrease speed
+    "button_5": 2615,  # Toggle auto mode
+    "no_press": 3507,  # No button pressed
+}
+
+# Motor Configuration
+SPEED_SETPOINT = 1500  # Default speed (1500 rpm = 10 m/min)
+MAX_SPEED_RPM = 3000   # Max speed (20 m/min)
+MIN_SPEED_RPM = 1000   # Min speed (5 m/min)
+SPEED_STEP_RPM = 200   # Increment/decrement step
+RAMP_SPEED_CHANGES = True  # Stream S-curve ramps instead of stepping the setpoint
+RPM_PER_M_MIN = 150
+AUTO_MODE = False      # Start in auto (torque-driven) mode
+
+# Incline Configuration
+INCLINE_MIN = -45
+INCLINE_MAX = 15
+INCLINE_STEP = 5          # Degrees per button press
+
+# Task timing (seconds)
+BUTTON_PERIOD = 0.01  # Polling period when the ADC has no pollable fd
+DRIVE_PERIOD = 0.05   # Drive exchange period
+LCD_PERIOD = 0.1      # Minimum time between LCD repaints
+
+# IR stop handled by libsimucube's own e-stop thread (estop.py) rather than
+# Drive.emergency_stop from the Python sensor thread
+NATIVE_ESTOP = True
+
+# Shutdown
+STOP_RETRIES = 5      # setSpeed(0) attempts before giving up
+STOP_RETRY_DELAY = 0.05
+
+
+class WallState:
+    """State shared by the tasks; only touched from the event loop thread."""
+
+    def __init__(self):
+        self.speed = SPEED_SETPOINT
+        self.incline = 0
+        self.auto_mode = AUTO_MODE
+        self.motor_running = False
+        self.sensor_stop = False
+        self.beam_clear = False       # Native e-stop latched but the beam is clear: a press acknowledges
+        self.resume_required = False  # Manual mode waits for a press after a sensor stop
+        self.torque = 0.0
+        self.adc = -1                    # Latest button ladder code
+        self.button = None               # Press not yet written to telemetry
+        self.changed = asyncio.Event()   # Something on screen changed
+        self.setpoint = asyncio.Event()  # Drive setpoint should be refreshed now
+
+    def notify(self, drive=False):
+        self.changed.set()
+        if drive:
+            self.setpoint.set()
+
+    def apply_button(self, button):
+        """Apply a decoded press to speed, incline and mode; returns a log line or None."""
+        message = None
+        if button == "button_2":
+            self.speed = min(self.speed + SPEED_STEP_RPM, MAX_SPEED_RPM)
+            message = f"Speed increased to {self.speed} RPM."
+        elif button == "button_4":
+            self.speed = max(self.speed - SPEED_STEP_RPM, MIN_SPEED_RPM)
+            message = f"Speed decreased to {self.speed} RPM."
+        elif button == "button_1":
+            self.incline = max(self.incline - INCLINE_STEP, INCLINE_MIN)
+        elif button == "button_3":
+            self.incline = min(self.incline + INCLINE_STEP, INCLINE_MAX)
+        elif button == "button_5":
+            self.auto_mode = not self.auto_mode
+            message = f"Auto mode {'on' if self.auto_mode else 'off'}."
+        self.resume_required = False
+        return message
+
+    def update_motor(self, gate, torque):
+        """Decide whether the belt should run given a fresh torque reading."""
+        run = gate.update(torque)
+        self.torque = gate.torque
+        if self.auto_mode:
+            # Run while the climber loads the belt, stop when they step off
+            self.motor_running = run
+        else:
+            self.motor_running = not self.resume_required
+
+
+class Drive:
+    """Runs every libsimucube call on one dedicated executor thread.
+
+    Calls are serialised by the executor rather than by a lock held around
+    blocking I/O, so the UI never waits on the bus. The only lock left is
+    shared with the IR sensor thread, which stops the drive directly without
+    a trip through the event loop. Faults and a dropped link are handled by
+    the supervisor on the same thread, in place of the regular exchange.
+    """
+
+    def __init__(self, handle, tripped, on_health=None):
+        self.handle = handle
+        self.tripped = tripped
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="drive")
+        self.stop_lock = threading.Lock()
+        self.state = DriveState()
+        streamer = SpeedStreamer(handle) if RAMP_SPEED_CHANGES else None
+        self.setpoints = SetpointManager(handle, streamer=streamer)  # Only used on the drive thread
+        self.supervisor = DriveSupervisor(handle, self.setpoints, on_change=on_health)
+        self.stop_latencies_ms = deque(maxlen=100)
+
+    def _call(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _exchange(self, speed):
+        with self.stop_lock:
+            if not self.supervisor.healthy:
+                self.supervisor.recover()
+                return None, self.state.torque
+            # A tripped sensor wins over any setpoint queued before the trip
+            self.setpoints.request(0 if self.tripped() else speed)
+            result = self.setpoints.exchange(self.state)
+            self.supervisor.observe(result, self.state.faults if result == 0 else None)
+        return result, self.state.torque
+
+    async def exchange(self, speed):
+        """Read torque back, writing the setpoint if it changed or a keepalive
+        is due; returns (result, torque). result is None while the supervisor
+        is recovering the drive instead."""
+        return await self._call(self._exchange, speed)
+
+    async def set_speed(self, speed):
+        return await self._call(libsimucube.setSpeed, self.handle.value, speed)
+
+    def emergency_stop(self, event_ns):
+        """Sensor-thread stop path: straight to the bus, no event loop hop."""
+        with self.stop_lock:
+            result = libsimucube.setSpeed(self.handle.value, 0)
+            self.setpoints.invalidate()
+        latency_ms = (time.monotonic_ns() - event_ns) / 1e6
+        self.stop_latencies_ms.append(latency_ms)
+        if result == 0:
+            print(f"Sensor triggered: motor stopped {latency_ms:.2f} ms after edge.")
+        else:
+            print("Sensor triggered: failed to disable motor.")
+
+    def _acknowledge_stop(self, estop):
+        with self.stop_lock:
+            if not estop.acknowledge():
+                return False
+            self.setpoints.reset(0)  # The latch held the drive at 0
+        return True
+
+    async def acknowledge_stop(self, estop):
+        """Release a native e-stop latch; False while the beam is not clear yet."""
+        return await self._call(self._acknowledge_stop, estop)
+
+    def close(self):
+        """Drain the executor, then make sure the drive is at speed 0 and closed."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        stopped = False
+        for _ in range(STOP_RETRIES):
+            if libsimucube.setSpeed(self.handle.value, 0) == 0:
+                stopped = True
+                break
+            time.sleep(STOP_RETRY_DELAY)
+        print("Motor disabled on exit." if stopped else "WARNING: could not confirm speed 0 on exit.")
+        print(self.setpoints.stats.summary())
+        libsimucube.closeSimucube(self.handle.value)
+        return stopped
+
+
+class Incline:
+    """Incline position service; moves run on the axis's own pulse thread and never block."""
+
+    def __init__(self):
+        self.chip = None
+        self.service = None
+
+    def open(self):
+        """Start the service; returns the angle the incline is at (or homing toward)."""
+        try:
+            self.chip, self.service = open_incline()
+        except OSError:
+            print("Incline control disabled: stepper GPIO unavailable.")
+            return 0
+        return self.service.target_angle
+
+    def move_to(self, degrees):
+        if self.service:
+            self.service.set_angle(degrees)
+
+    def close(self):
+        if self.service:
+            self.service.close()
+            print(f"Incline: {self.service.axis.stats.summary()}")
+        if self.chip:
+            self.chip.close()
+
+
+class Controller:
+    """Buttons, IR sensor, torque control, incline and LCD as asyncio tasks."""
+
+    def __init__(self):
+        self.handle = ctypes.c_int()
+        self.state = WallState()
+        if NATIVE_ESTOP:
+            self.sensor = NativeEStop(self.handle, on_trigger=self._on_estop_trigger, on_clear=self._on_estop_clear)
+        else:
+            self.sensor = IRSensor(on_trigger=self._on_trigger, on_clear=self._on_clear)
+        self.drive = Drive(self.handle, lambda: self.sensor.triggered, self._on_drive_health)
+        self.incline = Incline()
+        self.recorder = open_recorder()
+        self.lcd = None
+        self.adc = None
+        self.drive_timings = {}
+        self.loop = None
+        self.stopping = None   # asyncio.Event set by SIGINT/SIGTERM once run() is up
+        self._register_metrics()
+
+    def _register_metrics(self):
+        state, drive = self.state, self.drive
+        METRICS.gauge("zazu_speed_setpoint_rpm", "Speed the wall is set to.", lambda: state.speed)
+        METRICS.gauge("zazu_speed_commanded_rpm", "Setpoint last requested from the drive.",
+                      lambda: drive.setpoints.target)
+        METRICS.gauge("zazu_velocity", "Drive velocity feedback.", lambda: drive.state.velocity)
+        METRICS.gauge("zazu_torque", "Raw drive torque.", lambda: drive.state.torque)
+        METRICS.gauge("zazu_torque_filtered", "Filtered torque used for auto mode.", lambda: state.torque)
+        METRICS.gauge("zazu_faults", "Drive fault bits.", lambda: drive.state.faults)
+        METRICS.gauge("zazu_motor_running", "1 while the belt should run.", lambda: state.motor_running)
+        METRICS.gauge("zazu_sensor_stop", "1 while the IR sensor stop is active.", lambda: state.sensor_stop)
+        METRICS.gauge("zazu_incline_degrees", "Incline target.", lambda: state.incline)
+        stats = drive.setpoints.stats
+        METRICS.counter("zazu_setpoint_writes_total", "Setpoint writes sent to the drive.", lambda: stats.writes)
+        METRICS.counter("zazu_setpoint_failures_total", "Failed drive transactions.", lambda: stats.failures)
+
+    # Drive thread -> event loop
+    def _on_drive_health(self, health):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.state.notify, True)
+
+    # Sensor thread -> event loop
+    def _on_trigger(self, event_ns):
+        self.drive.emergency_stop(event_ns)
+        self.loop.call_soon_threadsafe(self._sensor_changed, True)
+
+    def _on_clear(self, event_ns):
+        self.loop.call_soon_threadsafe(self._sensor_changed, False)
+
+    # Native e-stop notifier -> event loop; the drive is already stopped and
+    # stays latched until the operator acknowledges with a button press
+    def _on_estop_trigger(self, edge_ns):
+        self.loop.call_soon_threadsafe(self._sensor_changed, True)
+
+    def _on_estop_clear(self, clear_ns):
+        self.loop.call_soon_threadsafe(self._estop_beam_clear)
+
+    def _estop_beam_clear(self):
+        if self.state.sensor_stop:
+            self.state.beam_clear = True
+            print("Sensor clear: press a button to acknowledge the e-stop.")
+            self.state.notify()
+
+    async def _acknowledge_estop(self):
+        state = self.state
+        if await self.drive.acknowledge_stop(self.sensor):
+            print("E-stop acknowledged.")
+            self._sensor_changed(False)
+            state.resume_required = False  # The acknowledging press also resumes
+        else:
+            state.beam_clear = False
+            print("Beam still broken; e-stop stays latched.")
+            state.notify()
+
+    def _sensor_changed(self, tripped):
+        state = self.state
+        state.sensor_stop = tripped
+        state.beam_clear = False
+        if tripped:
+            state.motor_running = False
+            state.resume_required = True
+        else:
+            print("Sensor clear.")
+        state.notify(drive=True)
+
+    # Buttons
+    def _handle_button(self, button):
+        state = self.state
+        if NATIVE_ESTOP and state.sensor_stop:
+            # Any press is the operator's acknowledgement of the latched stop
+            self.loop.create_task(self._acknowledge_estop())
+            return
+        incline = state.incline
+        message = state.apply_button(button)
+        if message:
+            print(message)
+        if state.incline != incline:
+            self.incline.move_to(state.incline)
+        state.notify(drive=True)
+
+    async def button_task(self):
+        adc = self.adc or open_adc()
+        decoder = ButtonDecoder(button_thresholds, repeat_rates={"button_5": 0})
+        detect_button = timed("detect_button", decoder.update)
+        fd = getattr(adc, "fd", None)
+        ready = asyncio.Event()
+        if fd is not None:
+            # Wake only when the IIO buffer reaches its watermark
+            self.loop.add_reader(fd, ready.set)
+        try:
+            while True:
+                if fd is not None:
+                    await ready.wait()
+                    ready.clear()
+                    code = adc.read(timeout_ms=0)
+                else:
+                    await asyncio.sleep(BUTTON_PERIOD)
+                    code = adc.read()
+                if code is None:
+                    continue
+                self.state.adc = code
+                for event, button in detect_button(code, time.monotonic()):
+                    if event in (PRESS, REPEAT):
+                        self.state.button = button
+                        self._handle_button(button)
+        finally:
+            if fd is not None:
+                self.loop.remove_reader(fd)
+            adc.close()
+            self.adc = None
+
+    # Drive
+    async def drive_task(self):
+        state = self.state
+        gate = TorqueGate()
+        tick = METRICS.histogram("zazu_task_duration_seconds", "Time spent in each task tick.", task="drive")
+        deadline = self.loop.time()
+        while True:
+            started = time.perf_counter_ns()
+            state.setpoint.clear()
+            running = state.motor_running
+            result, torque = await self.drive.exchange(state.speed if running else 0)
+            if self.recorder and result == 0:
+                drive_state = self.drive.state
+                self.recorder.record(self.drive.setpoints.target, drive_state.velocity, torque,
+                                     drive_state.faults, state.sensor_stop, state.adc, state.button,
+                                     state.incline)
+                state.button = None
+
+            if state.sensor_stop or result is None:
+                gate.reset()  # Torque history is stale after a stop or an outage
+            elif result != 0:
+                print("Failed to exchange drive state.")
+            else:
+                state.update_motor(gate, torque)
+                if state.motor_running != running:
+                    print(f"Motor {'ON' if state.motor_running else 'OFF'} "
+                          f"(filtered torque {state.torque:.1f}).")
+                    state.notify(drive=True)
+
+            ended = time.perf_counter_ns()
+            tick.record((ended - started) / 1000.0)
+            trace_span("drive", started, ended)
+
+            # Next exchange on the fixed period, or immediately on a setpoint
+            # change; a write held back for coalescing goes out once its window ends
+            deadline = max(deadline + DRIVE_PERIOD, self.loop.time())
+            wake = deadline
+            if self.drive.setpoints.pending:
+                wake = min(wake, self.loop.time() + self.drive.setpoints.min_interval)
+            try:
+                await asyncio.wait_for(state.setpoint.wait(), wake - self.loop.time())
+            except asyncio.TimeoutError:
+                pass
+
+    # LCD
+    def _render(self):
+        state = self.state
+        speed_text = f"Speed: {state.speed // RPM_PER_M_MIN:02} m/min"
+        if state.sensor_stop:
+            status_text = "PRESS TO RESUME" if state.beam_clear else "SENSOR STOP"
+        elif not self.drive.supervisor.healthy:
+            status_text = self.drive.supervisor.status_text()
+        else:
+            mode = "AUTO" if state.auto_mode else "MAN"
+            status_text = f"Tilt:{state.incline:+03}deg {mode}"
+        return speed_text.center(LCD_WIDTH), status_text.center(LCD_WIDTH)
+
+    async def lcd_task(self):
+        lcd = self.lcd or open_lcd()
+        state = self.state
+        try:
+            while True:
+                state.changed.clear()
+                line_1, line_2 = self._render()
+                lcd.set_line(line_1, 1)
+                lcd.set_line(line_2, 2)
+                # I2C writes block, so they go to the default executor
+                await self.loop.run_in_executor(None, lcd.refresh)
+                await state.changed.wait()
+                await asyncio.sleep(LCD_PERIOD)  # Coalesce bursts of changes
+        finally:
+            lcd.close()
+            self.lcd = None
+
+    # Startup
+    def add_phases(self, startup, activated=None):
+        """Queue the controller's startup phases; independent ones run concurrently.
+
+        Expects an "overlays" phase for the LCD to wait on. activated names
+        a phase that already sent the IONI activation, if any.
+        """
+        def drive():
+            ready, self.drive_timings = connect_drive(self.handle, activate=activated is None)
+            if ready:
+                print("Faults cleared and motor initialized.")
+            return ready
+
+        startup.add("drive", drive, after=(activated,) if activated else ())
+        startup.add("lcd", self._open_lcd, after=("overlays",))
+        startup.add("adc", self._open_adc)
+        startup.add("incline", self._open_incline, required=False)
+        startup.add("metrics", start_server, required=False)
+
+    def _open_lcd(self):
+        lcd = open_lcd()
+        lcd.set_line("Starting...".center(LCD_WIDTH), 1)
+        lcd.refresh()
+        self.lcd = lcd
+
+    def _open_adc(self):
+        self.adc = open_adc()
+
+    def _open_incline(self):
+        angle = self.incline.open()
+        self.state.incline = min(max(round(angle / INCLINE_STEP) * INCLINE_STEP, INCLINE_MIN), INCLINE_MAX)
+
+    def print_drive_timings(self):
+        if self.drive_timings:
+            print("Drive connect timing:")
+            print_timings(self.drive_timings)
+
+    # Lifecycle
+    async def run(self):
+        """Run the wall; add_phases() must have completed successfully first."""
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(sig, self.stopping.set)
+
+        self.sensor.start()
+        self.state.motor_running = not self.state.auto_mode
+
+        tasks = [asyncio.create_task(coro, name=coro.__name__) for coro in (
+            self.drive_task(), self.button_task(), self.lcd_task())]
+        stop = asyncio.create_task(self.stopping.wait())
+        try:
+            done, _ = await asyncio.wait(tasks + [stop], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not stop and not task.cancelled() and task.exception():
+                    print(f"Task {task.get_name()} failed: {task.exception()!r}")
+        finally:
+            stop.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Queue the stop behind any drive call still in flight
+            await self.drive.set_speed(0)
+
+    def close(self):
+        self.sensor.stop()
+        for device in (self.lcd, self.adc):  # Opened at startup but never handed to a task
+            if device:
+                device.close()
+        self.incline.close()
+        self.drive.close()
+        if self.recorder:
+            self.recorder.close()
+        if NATIVE_ESTOP:
+            print(self.sensor.summary())
+        elif self.drive.stop_latencies_ms:
+            worst = max(self.drive.stop_latencies_ms)
+            print(f"Sensor stop latency: {len(self.drive.stop_latencies_ms)} stops, worst {worst:.2f} ms")
+        print("Simucube closed.")
+
+
+def run_wall(controller, startup):
+    """Wait for startup, report its timing, then run until interrupted."""
+    ready = startup.wait()
+    startup.report()
+    controller.print_drive_timings()
+    try:
+        if ready:
+            print_ready()
+            asyncio.run(controller.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Exiting...")
+        controller.close()
+
+
+# Main Function
+if __name__ == "__main__":
+    controller = Controller()
+    startup = Startup()
+    startup.add("overlays", ensure_overlays)
+    controller.add_phases(startup)
+    startup.start()
+    run_wall(controller, startup)
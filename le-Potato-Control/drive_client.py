@@ -0,0 +1,153 @@
+import socket
+import sys
+import time
+from collections import deque
+from drive_protocol import (SOCKET_PATH, OP_CONTROL, OP_RELEASE, OP_SET_SPEED, OP_STOP, OP_STATE,
+                            OP_READ_PARAMS, OP_SUBSCRIBE, OP_TELEMETRY, OK, SPEED, EVERY, PARAM_ADDRESS,
+                            PARAM_VALUE, FrameReader, decode_telemetry, frame)
+
+# Usage:
+#   python3 drive_client.py state
+#   python3 drive_client.py watch [every]      print telemetry (every Nth bus tick)
+#   python3 drive_client.py params ADDR...     batched parameter read
+#   python3 drive_client.py speed RPM [secs]   take control, run at RPM, then release (stops the belt)
+#   python3 drive_client.py stop
+
+RECV_SIZE = 65536
+TELEMETRY_BACKLOG = 1024  # Telemetry frames kept while waiting for a reply
+
+
+class DriveClient:
+    """Blocking client for drive_daemon.py.
+
+    call() sends one request and waits for its reply. For pipelining, send()
+    several requests and then collect the replies in the same order with
+    reply(). Telemetry pushed in between is kept for telemetry(). Like
+    libsimucube, methods return 0 on success and a status code otherwise.
+    """
+
+    def __init__(self, path=SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.reader = FrameReader()
+        self.frames = deque()
+        self.pushed = deque(maxlen=TELEMETRY_BACKLOG)
+        self.seq = 0
+
+    def close(self):
+        self.sock.close()
+
+    def send(self, op, payload=b""):
+        self.seq = self.seq % 0xFFFFFFFF + 1  # 0 is reserved for pushed telemetry
+        self.sock.sendall(frame(op, self.seq, payload))
+        return self.seq
+
+    def _next_frame(self):
+        while not self.frames:
+            data = self.sock.recv(RECV_SIZE)
+            if not data:
+                raise ConnectionError("drive daemon closed the connection")
+            self.frames.extend(self.reader.feed(data))
+        return self.frames.popleft()
+
+    def reply(self, seq):
+        """(status, payload) of request seq; replies arrive in request order."""
+        while True:
+            op, status, frame_seq, payload = self._next_frame()
+            if op == OP_TELEMETRY:
+                self.pushed.append(decode_telemetry(payload))
+            elif frame_seq == seq:
+                return status, payload
+            else:
+                raise ConnectionError(f"reply {frame_seq} out of order, expected {seq}")
+
+    def call(self, op, payload=b""):
+        return self.reply(self.send(op, payload))
+
+    # Requests
+    def take_control(self):
+        return self.call(OP_CONTROL)[0]
+
+    def release(self):
+        return self.call(OP_RELEASE)[0]
+
+    def set_speed(self, speed):
+        return self.call(OP_SET_SPEED, SPEED.pack(speed))[0]
+
+    def stop(self):
+        return self.call(OP_STOP)[0]
+
+    def state(self):
+        """Latest telemetry the daemon has, without a bus round trip; None on error."""
+        status, payload = self.call(OP_STATE)
+        return decode_telemetry(payload) if status == OK else None
+
+    def read_params(self, addresses):
+        """Parameter values read in one batched bus transaction; None on error."""
+        status, payload = self.call(OP_READ_PARAMS, b"".join(PARAM_ADDRESS.pack(a) for a in addresses))
+        if status != OK:
+            return None
+        return [value for (value,) in PARAM_VALUE.iter_unpack(payload)]
+
+    def subscribe(self, every=1):
+        """Receive every Nth telemetry frame; 0 unsubscribes."""
+        return self.call(OP_SUBSCRIBE, EVERY.pack(every))[0]
+
+    def telemetry(self):
+        """Next telemetry frame, waiting for one if none is queued."""
+        if self.pushed:
+            return self.pushed.popleft()
+        while True:
+            op, _, _, payload = self._next_frame()
+            if op == OP_TELEMETRY:
+                return decode_telemetry(payload)
+
+
+def print_frame(t):
+    print(f"tick={t.tick} setpoint={t.setpoint} velocity={t.velocity} torque={t.torque} "
+          f"faults=0x{t.faults:x} health={t.health}")
+
+
+# Main Function
+if __name__ == "__main__":
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("state", [])
+    client = DriveClient()
+    try:
+        if command == "state":
+            print_frame(client.state())
+        elif command == "watch":
+            every = int(args[0]) if args else 1
+            client.subscribe(every)
+            last = None
+            while True:
+                t = client.telemetry()
+                if last is not None and t.tick - last > every:
+                    print(f"  ({t.tick - last - every} ticks late)")
+                last = t.tick
+                print_frame(t)
+        elif command == "params":
+            addresses = [int(arg, 0) for arg in args]
+            values = client.read_params(addresses)
+            if values is None:
+                print("Parameter read failed.")
+            else:
+                for address, value in zip(addresses, values):
+                    print(f"  {address:5d}: {value}")
+        elif command == "speed":
+            if client.take_control() != OK:
+                print("Another client has control of the drive.")
+                sys.exit(1)
+            print(f"Setting speed {args[0]} rpm: status {client.set_speed(int(args[0]))}")
+            end = time.monotonic() + float(args[1]) if len(args) > 1 else None
+            while end is None or time.monotonic() < end:
+                time.sleep(0.1)
+        elif command == "stop":
+            print(f"Stop: status {client.stop()}")
+        else:
+            print(f"Unknown command {command}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if command == "speed":
+            client.release()  # Stops the belt
+        client.close()
@@ -0,0 +1,204 @@
+import configparser
+import ctypes
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+# Drive configuration exported from Granity (.drc); applied at startup if present
+DRC_PATH = "/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/zazuwall.drc"
+CONFIG_CACHE = "/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/.drive_config_hash"
+SAVE_TO_FLASH = True  # Store applied changes so they survive a drive power cycle
+
+# One .drc entry; value is the raw integer the drive stores (scaled and offset)
+Parameter = namedtuple("Parameter", ["addr", "name", "value", "readonly"])
+
+
+def parse_drc(path):
+    """Parameters from a Granity .drc export.
+
+    The file is QSettings INI: a [Parameters] array whose entries look like
+    `12\\addr=173`, `12\\value=1.5`, `12\\scaling=1000`, `12\\offset=0`,
+    `12\\readonly=false`. Later entries for the same address win.
+    """
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    parser.optionxform = str
+    if not parser.read(path):
+        raise OSError(f"Cannot read drive configuration {path}")
+    if not parser.has_section("Parameters"):
+        raise ValueError(f"{path} has no [Parameters] section")
+
+    entries = {}
+    for key, value in parser.items("Parameters"):
+        index, sep, field = key.partition("\\")
+        if sep and index.isdigit():
+            entries.setdefault(int(index), {})[field] = value.strip().strip('"')
+
+    params = {}
+    for index in sorted(entries):
+        entry = entries[index]
+        if "addr" not in entry or "value" not in entry:
+            continue
+        scaling = float(entry.get("scaling", 1))
+        offset = float(entry.get("offset", 0))
+        addr = int(entry["addr"])
+        params[addr] = Parameter(addr, entry.get("name", ""),
+                                 int(round(float(entry["value"]) * scaling - offset)),
+                                 entry.get("readonly", "false").lower() == "true")
+    return list(params.values())
+
+
+def config_hash(params):
+    """Stable hash of the writable part of a configuration."""
+    pairs = sorted((p.addr, p.value) for p in params if not p.readonly)
+    return hashlib.sha256(json.dumps(pairs).encode()).hexdigest()
+
+
+def load_cached_hash(path=CONFIG_CACHE):
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("hash")
+    except (OSError, ValueError):
+        return None
+
+
+def save_cached_hash(digest, path=CONFIG_CACHE):
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump({"hash": digest, "applied": time.time()}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Could not cache drive configuration hash: {e}")
+
+
+def _int_array(values):
+    return (ctypes.c_int * len(values))(*values)
+
+
+def read_parameters(handle, addresses, lib):
+    """Current values of addresses, read in batched transactions; None on bus error."""
+    values = _int_array([0] * len(addresses))
+    if lib.readParameters(handle.value, _int_array(addresses), values, len(addresses)) != 0:
+        return None
+    return list(values)
+
+
+def write_parameters(handle, params, lib):
+    """Write params in batched transactions; returns the ones the drive rejected, None on bus error."""
+    statuses = _int_array([0] * len(params))
+    result = lib.writeParameters(handle.value, _int_array([p.addr for p in params]),
+                                 _int_array([p.value for p in params]), statuses, len(params))
+    if result < 0:
+        return None
+    return [(p, status) for p, status in zip(params, statuses) if status != 0]
+
+
+class ConfigResult:
+    def __init__(self):
+        self.total = 0        # Writable parameters in the file
+        self.changed = 0      # Differed from the drive
+        self.written = 0      # Accepted by the drive
+        self.failed = []      # (parameter, reason)
+        self.skipped = False  # Unchanged since last applied
+        self.elapsed_ms = 0.0
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def summary(self):
+        if self.skipped:
+            return f"Drive configuration unchanged; skipped ({self.elapsed_ms:.1f} ms)."
+        return (f"Drive configuration: {self.total} params, {self.changed} changed, "
+                f"{self.written} written, {len(self.failed)} failed ({self.elapsed_ms:.1f} ms).")
+
+
+def apply_config(handle, params, lib, cache_path=CONFIG_CACHE, force=False, save=SAVE_TO_FLASH):
+    """Bring the drive in line with params, writing only the differences.
+
+    Reads every writable parameter in bulk, writes the ones that differ,
+    reads those back to verify, and caches the config hash on success so an
+    unchanged config costs no bus traffic on the next start.
+    """
+    result = ConfigResult()
+    start = time.perf_counter()
+    digest = config_hash(params)
+    if not force and load_cached_hash(cache_path) == digest:
+        result.skipped = True
+        result.elapsed_ms = (time.perf_counter() - start) * 1000.0
+        return result
+
+    writable = [p for p in params if not p.readonly]
+    result.total = len(writable)
+    current = read_parameters(handle, [p.addr for p in writable], lib)
+    if current is None:
+        result.failed = [(p, "read failed") for p in writable]
+        result.elapsed_ms = (time.perf_counter() - start) * 1000.0
+        return result
+    changes = [p for p, value in zip(writable, current) if value != p.value]
+    result.changed = len(changes)
+
+    if changes:
+        rejected = write_parameters(handle, changes, lib)
+        if rejected is None:
+            result.failed = [(p, "write failed") for p in changes]
+        else:
+            result.failed = [(p, f"rejected (status {status})") for p, status in rejected]
+            rejected_params = {p for p, _ in rejected}
+            written = [p for p in changes if p not in rejected_params]
+            readback = read_parameters(handle, [p.addr for p in written], lib)
+            if readback is None:
+                mismatched = [(p, "verify read failed") for p in written]
+            else:
+                mismatched = [(p, f"reads back {value}") for p, value in zip(written, readback)
+                              if value != p.value]
+            result.failed += mismatched
+            result.written = len(written) - len(mismatched)
+
+    if result.ok:
+        if changes and save and lib.saveConfiguration(handle.value) != 0:
+            result.failed.append((None, "save to flash failed"))
+        else:
+            save_cached_hash(digest, cache_path)
+    result.elapsed_ms = (time.perf_counter() - start) * 1000.0
+    return result
+
+
+def configure_drive(handle, lib, path=DRC_PATH, cache_path=CONFIG_CACHE, force=False):
+    """Apply the .drc at path if it exists. Returns a ConfigResult, or None without a file."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        params = parse_drc(path)
+    except (OSError, ValueError) as e:
+        print(f"Drive configuration not applied: {e}")
+        return None
+    result = apply_config(handle, params, lib, cache_path, force)
+    print(result.summary())
+    for param, reason in result.failed:
+        if param is None:
+            print(f"  {reason}")
+        else:
+            print(f"  {param.name or 'param'} (addr {param.addr}) = {param.value}: {reason}")
+    return result
+
+
+# Main Function
+if __name__ == "__main__":
+    from simucube import libsimucube, open_drive
+
+    args = [arg for arg in sys.argv[1:] if arg != "--force"]
+    handle = ctypes.c_int()
+    if not open_drive(handle):
+        print("Failed to open Simucube.")
+        sys.exit(1)
+    try:
+        result = configure_drive(handle, libsimucube, args[0] if args else DRC_PATH,
+                                 force="--force" in sys.argv)
+        if result is None:
+            print("No drive configuration found.")
+    finally:
+        libsimucube.closeSimucube(handle.value)
@@ -0,0 +1,316 @@
+import ctypes
+import os
+import selectors
+import socket
+import threading
+import time
+from simucube import libsimucube, DriveState, connect_drive, print_timings
+from scheduler import PeriodicTask, run_periodic
+from setpoint import SetpointManager
+from speed_ramp import SpeedStreamer
+from supervisor import DriveSupervisor, HEALTH_CODES
+from drive_config import read_parameters
+from metrics import METRICS, start_server
+from drive_protocol import (SOCKET_PATH, OP_CONTROL, OP_RELEASE, OP_SET_SPEED, OP_STOP, OP_STATE,
+                            OP_READ_PARAMS, OP_SUBSCRIBE, OP_TELEMETRY, OK, ERR_UNKNOWN_OP, ERR_BAD_PAYLOAD,
+                            ERR_NOT_CONTROLLER, ERR_BUS, ERR_DRIVE_DOWN, SPEED, MIN_SPEED_RPM, MAX_SPEED_RPM,
+                            EVERY, PARAM_ADDRESS, PARAM_VALUE, MAX_PARAMS, TELEMETRY, FrameReader, frame)
+
+# Daemon Configuration
+BUS_PERIOD = 0.01          # One drive exchange per tick; telemetry goes out at this rate
+RAMP_SPEED_CHANGES = True  # Stream S-curve ramps instead of stepping the setpoint
+MAX_BACKLOG = 64 * 1024    # Unsent bytes per client before telemetry frames are dropped
+RECV_SIZE = 4096
+REPORT_INTERVAL = 60       # Seconds between loop timing reports
+SOCKET_MODE = 0o660        # Owner and group only: any client may stop the belt, the controller drive it
+
+# Real-time scheduling for the bus thread (None leaves the default policy)
+REALTIME_PRIORITY = None   # SCHED_FIFO priority, e.g. 50
+CONTROL_CPUS = None        # CPU set to pin the bus thread to, e.g. {3}
+
+
+class Client:
+    def __init__(self, sock, number):
+        self.sock = sock
+        self.name = f"client {number}"
+        self.reader = FrameReader()
+        self.out = bytearray()   # Replies and telemetry not yet accepted by the socket
+        self.every = 0           # Telemetry decimation, 0 when not subscribed
+        self.dropped = 0         # Telemetry frames skipped because the client fell behind
+
+
+class DriveDaemon:
+    """Owns the drive and shares it with any number of Unix socket clients.
+
+    The bus thread does one exchange per tick (setpoint when due, state
+    always), exactly as a single control loop would, packs the result into
+    one telemetry frame and wakes the socket thread. The socket thread
+    handles every client with a selector: requests are applied in the order
+    they arrive and their replies queued in the same order, and the latest
+    telemetry frame is appended to each subscriber's queue. Subscribers
+    therefore cost no bus traffic; a slow one just has frames dropped.
+    Only the client holding control may change the setpoint, and when it
+    disconnects the belt is stopped.
+    """
+
+    def __init__(self, handle, setpoints, path=SOCKET_PATH, period=BUS_PERIOD, lib=libsimucube):
+        self.handle = handle
+        self.setpoints = setpoints
+        self.path = path
+        self.lib = lib
+        self.lock = threading.Lock()   # The bus: tick vs. stops and parameter reads
+        self.state = DriveState()
+        self.supervisor = DriveSupervisor(handle, setpoints, lib)
+        self.ticks = 0
+        self.telemetry = TELEMETRY.pack(0, 0, 0, 0, 0, 0, 0)  # Latest payload
+        self.published = 0           # Tick of the last frame handed to subscribers
+        self.controller = None       # Client holding control
+        self.clients = set()
+        self.accepted = 0
+        self.selector = selectors.DefaultSelector()
+        self.listener = None
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_w.setblocking(False)
+        self.running = False
+        self.task = PeriodicTask("daemon_bus", period, self.tick, REALTIME_PRIORITY, CONTROL_CPUS)
+        self.threads = []
+
+        self.request_count = METRICS.counter("zazu_daemon_requests_total", "Client requests handled.")
+        self.dropped_count = METRICS.counter("zazu_daemon_telemetry_dropped_total",
+                                             "Telemetry frames skipped for clients that fell behind.")
+        METRICS.gauge("zazu_daemon_clients", "Connected daemon clients.", lambda: len(self.clients))
+        METRICS.gauge("zazu_daemon_subscribers", "Clients subscribed to telemetry.",
+                      lambda: sum(1 for client in self.clients if client.every))
+
+    # Bus thread
+    def tick(self):
+        with self.lock:
+            if self.supervisor.healthy:
+                result = self.setpoints.exchange(self.state)
+                self.supervisor.observe(result, self.state.faults if result == 0 else None)
+            else:
+                self.supervisor.recover()
+            setpoint = self.setpoints.target
+        self.ticks += 1
+        state = self.state
+        self.telemetry = TELEMETRY.pack(self.ticks, time.time_ns(), setpoint, state.velocity, state.torque,
+                                        state.faults, HEALTH_CODES[self.supervisor.health])
+        try:
+            self.wake_w.send(b"\0")
+        except BlockingIOError:
+            pass  # The socket thread is already behind; it publishes the latest frame when it catches up
+
+    # Socket thread
+    def _listen(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o750, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left over from a daemon that did not shut down cleanly
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Create the socket without other-user access rather than chmod it after bind
+        umask = os.umask(0o777 & ~SOCKET_MODE)
+        try:
+            self.listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, SOCKET_MODE)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+
+    def serve(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=0.5):
+                if key.fileobj is self.listener:
+                    self._accept()
+                elif key.fileobj is self.wake_r:
+                    self.wake_r.recv(RECV_SIZE)
+                    self._publish()
+                else:
+                    if events & selectors.EVENT_READ:
+                        self._receive(key.data)
+                    if events & selectors.EVENT_WRITE and key.data in self.clients:
+                        self._flush(key.data)
+
+    def _accept(self):
+        sock, _ = self.listener.accept()
+        sock.setblocking(False)
+        self.accepted += 1
+        client = Client(sock, self.accepted)
+        self.clients.add(client)
+        self.selector.register(sock, selectors.EVENT_READ, client)
+
+    def _drop(self, client):
+        self.clients.discard(client)
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        if client.dropped:
+            print(f"Drive daemon: {client.name} fell behind; {client.dropped} telemetry frames dropped.")
+        if client is self.controller:
+            print(f"Drive daemon: controlling {client.name} disconnected; stopping the belt.")
+            self._stop()
+            self.controller = None
+
+    def _receive(self, client):
+        try:
+            data = client.sock.recv(RECV_SIZE)
+        except ConnectionError:
+            data = b""
+        if not data:
+            self._drop(client)
+            return
+        # Pipelined requests: apply in order, send all their replies in one go
+        for op, _, seq, payload in client.reader.feed(data):
+            self.request_count.inc()
+            status, reply = self._handle(client, op, payload)
+            client.out += frame(op, seq, reply, status)
+        self._flush(client)
+
+    def _flush(self, client):
+        try:
+            sent = client.sock.send(client.out) if client.out else 0
+        except BlockingIOError:
+            sent = 0
+        except ConnectionError:
+            self._drop(client)
+            return
+        del client.out[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.out else 0)
+        self.selector.modify(client.sock, events, client)
+
+    def _publish(self):
+        """Queue the latest telemetry frame for each subscriber whose decimation it hits."""
+        tick = self.ticks
+        if tick == self.published:
+            return
+        published, self.published = self.published, tick
+        message = frame(OP_TELEMETRY, 0, self.telemetry)
+        for client in list(self.clients):
+            # Send when a multiple of every was reached since the last publish
+            if not client.every or tick // client.every == published // client.every:
+                continue
+            if len(client.out) > MAX_BACKLOG:
+                client.dropped += 1
+                self.dropped_count.inc()
+                continue
+            client.out += message
+            self._flush(client)
+
+    # Requests
+    def _stop(self):
+        """Zero the setpoint with an immediate write rather than at the next tick."""
+        with self.lock:
+            self.setpoints.request(0)
+            if not self.supervisor.healthy:
+                return ERR_DRIVE_DOWN
+            result = self.setpoints.flush(force=True)
+            self.supervisor.observe(result)
+        return OK if result == 0 else ERR_BUS
+
+    def _read_params(self, payload):
+        count = len(payload) // PARAM_ADDRESS.size
+        if not count or count > MAX_PARAMS or len(payload) % PARAM_ADDRESS.size:
+            return ERR_BAD_PAYLOAD, b""
+        addresses = [address for (address,) in PARAM_ADDRESS.iter_unpack(payload)]
+        with self.lock:
+            if not self.supervisor.healthy:
+                return ERR_DRIVE_DOWN, b""
+            values = read_parameters(self.handle, addresses, self.lib)
+        if values is None:
+            return ERR_BUS, b""
+        return OK, b"".join(PARAM_VALUE.pack(value) for value in values)
+
+    def _handle(self, client, op, payload):
+        """Apply one request; returns (status, reply payload)."""
+        if op == OP_STATE:
+            return OK, self.telemetry
+        if op == OP_SUBSCRIBE:
+            if len(payload) != EVERY.size:
+                return ERR_BAD_PAYLOAD, b""
+            client.every = EVERY.unpack(payload)[0]
+            return OK, b""
+        if op == OP_READ_PARAMS:
+            return self._read_params(payload)
+        if op == OP_STOP:
+            return self._stop(), b""
+        if op == OP_CONTROL:
+            if self.controller not in (None, client):
+                return ERR_NOT_CONTROLLER, b""
+            self.controller = client
+            return OK, b""
+        if op == OP_RELEASE:
+            if self.controller is not client:
+                return ERR_NOT_CONTROLLER, b""
+            self.controller = None
+            return self._stop(), b""
+        if op == OP_SET_SPEED:
+            if self.controller is not client:
+                return ERR_NOT_CONTROLLER, b""
+            if len(payload) != SPEED.size:
+                return ERR_BAD_PAYLOAD, b""
+            speed = SPEED.unpack(payload)[0]
+            if speed != 0 and not MIN_SPEED_RPM <= speed <= MAX_SPEED_RPM:
+                return ERR_BAD_PAYLOAD, b""
+            with self.lock:
+                self.setpoints.request(speed)
+            return OK, b""
+        return ERR_UNKNOWN_OP, b""
+
+    # Lifecycle
+    def start(self):
+        self._listen()
+        self.running = True
+        for name, target, args in (("daemon_bus", run_periodic, (self.task,)), ("daemon_socket", self.serve, ())):
+            thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=1.0):
+        self.running = False
+        self.task.running = False
+        for thread in self.threads:
+            thread.join(timeout)
+        for client in list(self.clients):
+            self._drop(client)
+        if self.listener:
+            self.listener.close()
+            os.unlink(self.path)
+
+    def print_report(self):
+        print(f"[{self.task.name} @ {1.0 / self.task.period:g} Hz] {self.task.stats.summary()}")
+        print(f"[{self.task.name}] {self.setpoints.stats.summary()}")
+        print(f"[daemon_socket] clients={len(self.clients)} requests={self.request_count.value} "
+              f"telemetry dropped={self.dropped_count.value}")
+
+
+# Main Function
+if __name__ == "__main__":
+    handle = ctypes.c_int()
+    setpoints = SetpointManager(handle, streamer=SpeedStreamer(handle) if RAMP_SPEED_CHANGES else None)
+    start_server()
+    daemon = None
+
+    try:
+        ready, timings = connect_drive(handle)
+        print("Startup timing:")
+        print_timings(timings)
+        if ready:
+            setpoints.reset(0)
+            daemon = DriveDaemon(handle, setpoints)
+            daemon.start()
+            print(f"Drive daemon listening on {daemon.path}")
+
+            # Keep the main thread running and report loop timing
+            while True:
+                time.sleep(REPORT_INTERVAL)
+                daemon.print_report()
+    except KeyboardInterrupt:
+        print("Exiting...")
+    finally:
+        if daemon:
+            daemon.stop()
+            daemon.print_report()
+        if libsimucube.setSpeed(handle.value, 0) == 0:
+            print("Motor disabled on exit.")
+        libsimucube.closeSimucube(handle.value)
+        print("Simucube closed.")
@@ -0,0 +1,74 @@
+import struct
+from collections import namedtuple
+
+# Drive daemon wire protocol, shared by drive_daemon.py and drive_client.py
+
+SOCKET_PATH = "/run/zazuwall/drive.sock"
+
+# Every frame: op, status, payload length, sequence number (little endian, 8 bytes).
+# Requests send status 0; each reply echoes its request's op and sequence, and
+# replies come back in request order, so clients may pipeline.
+HEADER = struct.Struct("<BBHI")
+MAX_PAYLOAD = 0xFFFF
+
+# Ops
+OP_CONTROL = 1       # Take control of the setpoint; one controlling client at a time
+OP_RELEASE = 2       # Give control back; the belt is stopped
+OP_SET_SPEED = 3     # SPEED payload, rpm (0 or MIN..MAX_SPEED_RPM); controller only, carried by the next bus exchange
+OP_STOP = 4          # Zero the setpoint straight away; any client may stop the belt
+OP_STATE = 5         # Latest TELEMETRY payload; answered from memory, no bus traffic
+OP_READ_PARAMS = 6   # u16 addresses in, i32 values out, one batched bus read
+OP_SUBSCRIBE = 7     # EVERY payload: push every Nth telemetry frame, 0 unsubscribes
+OP_TELEMETRY = 8     # Pushed to subscribers with sequence 0
+
+# Reply status
+OK = 0
+ERR_UNKNOWN_OP = 1
+ERR_BAD_PAYLOAD = 2
+ERR_NOT_CONTROLLER = 3  # Another client holds control, or this one never took it
+ERR_BUS = 4
+ERR_DRIVE_DOWN = 5      # Drive recovering or latched; see the telemetry health field
+
+SPEED = struct.Struct("<i")
+MIN_SPEED_RPM = 1000    # Slowest running speed OP_SET_SPEED accepts; 0 stops the belt
+MAX_SPEED_RPM = 3000    # Fastest (20 m/min)
+EVERY = struct.Struct("<H")
+PARAM_ADDRESS = struct.Struct("<H")
+PARAM_VALUE = struct.Struct("<i")
+MAX_PARAMS = 256        # Addresses per OP_READ_PARAMS
+
+# Bus tick, wall clock (ns), setpoint, velocity, torque, fault bits, drive health
+# (supervisor.HEALTH_CODES: 0 ok, 1 recovering, 2 latched)
+TELEMETRY = struct.Struct("<Qqiiiib")
+Telemetry = namedtuple("Telemetry", ["tick", "timestamp_ns", "setpoint", "velocity", "torque",
+                                     "faults", "health"])
+
+
+def frame(op, seq=0, payload=b"", status=0):
+    return HEADER.pack(op, status, len(payload), seq) + payload
+
+
+def decode_telemetry(payload):
+    return Telemetry(*TELEMETRY.unpack(payload))
+
+
+class FrameReader:
+    """Splits a byte stream into (op, status, seq, payload) frames."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes; returns the frames completed by them."""
+        self.buffer += data
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            op, status, length, seq = HEADER.unpack_from(self.buffer, offset)
+            end = offset + HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((op, status, seq, bytes(self.buffer[offset + HEADER.size:end])))
+            offset = end
+        del self.buffer[:offset]
+        return frames
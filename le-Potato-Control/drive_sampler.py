@@ -0,0 +1,91 @@
+import ctypes
+import numpy as np
+from simucube import libsimucube
+
+# Sampler Configuration
+SAMPLER_RATE = 500       # Hz
+SAMPLER_CAPACITY = 4096  # Ring slots (~8 s at 500 Hz)
+
+# Matches DriveSample in simucube_lib.c
+SAMPLE_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("timestamp_ns", "<i8"),
+    ("torque", "<i4"),
+    ("velocity", "<i4"),
+    ("position", "<i4"),
+    ("faults", "<i4"),
+])
+INVALID_SEQ = np.iinfo(np.uint64).max
+
+
+class DriveSampler:
+    """Python view of the native drive sampler.
+
+    libsimucube's pthread fills a ring of DriveSample records; this class maps
+    that memory as a NumPy structured array without copying and hands out the
+    new records in bulk. Sequence numbers in each slot let read() drop records
+    the producer overwrote while they were being copied and count them as
+    overruns.
+    """
+
+    def __init__(self, handle, rate_hz=SAMPLER_RATE, capacity=SAMPLER_CAPACITY, lib=libsimucube):
+        self.lib = lib
+        self.handle = handle
+        self.rate_hz = rate_hz
+        self.capacity = capacity
+        self.ring = None
+        self.next_seq = 0
+        self.overruns = 0
+
+    def start(self):
+        if self.lib.startSampler(self.handle.value, self.rate_hz, self.capacity) != 0:
+            return False
+        self.capacity = self.lib.samplerCapacitySlots()  # A restart keeps the first start's buffer
+        size = self.capacity * SAMPLE_DTYPE.itemsize
+        raw = (ctypes.c_uint8 * size).from_address(self.lib.samplerBuffer())
+        self.ring = np.frombuffer(raw, dtype=SAMPLE_DTYPE)  # Zero-copy view
+        self.next_seq = 0
+        self.overruns = 0
+        return True
+
+    def stop(self):
+        self.lib.stopSampler()
+
+    @property
+    def errors(self):
+        """Sampler ticks where the bus transaction failed."""
+        return self.lib.samplerErrorCount()
+
+    def read(self):
+        """Return all records written since the previous call, oldest first."""
+        head = self.lib.samplerHead()
+        first = max(self.next_seq, head - self.capacity)
+        self.overruns += first - self.next_seq
+        count = head - first
+        if count <= 0:
+            return self.ring[:0].copy()
+
+        start = first % self.capacity
+        end = start + count
+        if end <= self.capacity:
+            block = self.ring[start:end].copy()
+        else:
+            block = np.concatenate((self.ring[start:], self.ring[:end - self.capacity]))
+
+        # Keep only slots holding the expected sequence both in the copy and
+        # after it, i.e. the producer did not touch them while we copied
+        expected = np.arange(first, head, dtype=np.uint64)
+        slots = np.arange(first, head, dtype=np.uint64) % self.capacity
+        valid = (block["seq"] == expected) & (self.ring["seq"][slots] == expected)
+        self.overruns += int(count - np.count_nonzero(valid))
+        self.next_seq = head
+        return block[valid]
+
+    def latest(self, n):
+        """Zero-copy view of up to n most recent slots (may be mid-update)."""
+        head = self.lib.samplerHead()
+        n = min(n, head, self.capacity)
+        start = (head - n) % self.capacity
+        if start + n <= self.capacity:
+            return self.ring[start:start + n]
+        return np.concatenate((self.ring[start:], self.ring[:head % self.capacity]))
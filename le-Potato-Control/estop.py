@@ -0,0 +1,109 @@
+import threading
+from ir_sensor import CHIP_NAME, LINE_OFFSET
+from simucube import libsimucube, EStopStats
+
+# Native E-Stop Configuration
+ESTOP_PRIORITY = 80      # SCHED_FIFO priority of libsimucube's e-stop thread (needs CAP_SYS_NICE)
+DISABLE_MOTOR = False    # Also clear the drive's control bits, not just zero the setpoint
+CLEAR_MS = 5             # Beam must stay clear this long before the stop may be acknowledged
+WAIT_TIMEOUT_MS = 500    # Longest the notifier blocks in estopWait, so stop() is noticed
+
+
+class NativeEStop:
+    """IR sensor stop handled entirely inside libsimucube.
+
+    A native thread waits for edges on the sensor line and, on a broken
+    beam, zeroes the setpoint (and optionally disables the motor) itself,
+    so a GC pause, a slow print or a busy control loop cannot delay it.
+    The stop latches: every setpoint sent to that drive afterwards is forced
+    to 0 until acknowledge() succeeds, which the library refuses while the
+    beam is still broken. Each drive (wall) can have an e-stop of its own.
+
+    Drop-in for IRSensor: triggered, start() and stop() behave the same and
+    on_trigger(edge_ns) / on_clear(clear_ns) are called from a notifier
+    thread, after the fact. on_trigger is informational (the drive is
+    already stopped); on_clear fires once per stop, when the beam has stayed
+    clear for CLEAR_MS, and only tells the owner it may now acknowledge. The
+    owner calls acknowledge() on an operator action (a button press or a
+    resume command), never on its own, so a cleared beam does not restart
+    the wall.
+    """
+
+    def __init__(self, handle, chip_name=CHIP_NAME, line_offset=LINE_OFFSET, on_trigger=None, on_clear=None,
+                 priority=ESTOP_PRIORITY, disable_motor=DISABLE_MOTOR, lib=libsimucube):
+        self.handle = handle
+        self.chip_path = f"/dev/{chip_name}".encode()
+        self.line_offset = line_offset
+        self.on_trigger = on_trigger
+        self.on_clear = on_clear
+        self.priority = priority
+        self.disable_motor = disable_motor
+        self.lib = lib
+        self.thread = None
+        self.running = False
+        self.final = None   # Stats as they were when stop() disarmed the library's e-stop
+
+    @property
+    def triggered(self):
+        return bool(self.lib.estopIsLatched(self.handle.value))
+
+    def start(self):
+        """Arm the native stop on the drive behind handle and start the notifier."""
+        if self.lib.estopStart(self.handle.value, self.chip_path, self.line_offset,
+                               self.priority or 0, int(self.disable_motor)) != 0:
+            raise OSError(f"cannot arm the e-stop on {self.chip_path.decode()} line {self.line_offset}")
+        self.final = None
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="estop_notify", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Disarm; the latch goes with it, so only call this on the way out."""
+        if self.running:
+            self.final = self.stats()
+        self.running = False
+        self.lib.estopStop(self.handle.value)
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def acknowledge(self):
+        """Release the latch; False while the beam is broken or has only just cleared."""
+        return self.lib.estopAcknowledge(self.handle.value) == 0
+
+    def stats(self):
+        if self.final is not None:
+            return self.final
+        stats = EStopStats()
+        self.lib.estopGetStats(self.handle.value, stats)
+        return stats
+
+    def summary(self):
+        stats = self.stats()
+        if not stats.triggers:
+            return "E-stop: no stops"
+        return (f"E-stop: {stats.triggers} stops, last {stats.latency_ns / 1e6:.2f} ms, "
+                f"worst {stats.max_latency_ns / 1e6:.2f} ms "
+                f"edge -> stop command (thread priority {stats.priority or 'default'})")
+
+    def _run(self):
+        triggers = events = 0  # Catches a trip the native thread saw before we got here
+        notified = None         # clear_ns already handed to on_clear
+        while self.running:
+            events = self.lib.estopWait(self.handle.value, events, WAIT_TIMEOUT_MS)
+            stats = self.stats()
+            if stats.triggers != triggers:
+                triggers = stats.triggers
+                if stats.result == 0:
+                    print(f"Sensor triggered: motor stopped natively {stats.latency_ns / 1e6:.2f} ms after edge.")
+                else:
+                    print("Sensor triggered: native stop command failed; latched at 0 rpm.")
+                if self.on_trigger:
+                    self.on_trigger(stats.edge_ns)
+            if stats.latched and stats.level == 1 and stats.clear_ns != notified and self.running:
+                # Beam clear: tell the owner once it has stayed clear, not on a bounce
+                settled = self.lib.estopWait(self.handle.value, events, CLEAR_MS)
+                if settled == events:
+                    notified = stats.clear_ns
+                    if self.on_clear:
+                        self.on_clear(stats.clear_ns)
+                events = settled
@@ -0,0 +1,302 @@
+import bisect
+import json
+import math
+import os
+from collections import deque
+import numpy as np
+
+# Per-deployment filter settings: a JSON file whose keys override the
+# defaults each script passes to deployment_config(), e.g.
+#   {"torque_filters": [["median", {"window": 5}], ["ema", {"alpha": 0.2}]],
+#    "torque_hysteresis": [-30, 30],
+#    "adc_filters": [["median", {"window": 8}]]}
+FILTER_CONFIG = os.environ.get("ZAZU_FILTER_CONFIG", "/etc/zazuwall/filters.json")
+
+# Largest power of (1 - alpha) the block EMA lets accumulate before rescaling
+EMA_CHUNK_LIMIT = 1e100
+
+
+# Running Mean and Variance
+class RunningStats:
+    """Mean and variance over the last `window` samples (all samples if None).
+
+    Sliding Welford update: adding one sample and dropping the oldest is O(1)
+    and does not re-sum the window.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.history = deque(maxlen=self.window) if self.window else None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.value = None
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(max(self.variance, 0.0))
+
+    def update(self, x):
+        x = float(x)
+        if self.window and self.count == self.window:
+            oldest = self.history[0]
+            old_mean = self.mean
+            self.mean += (x - oldest) / self.count
+            self.m2 += (x - oldest) * (x - self.mean + oldest - old_mean)
+        else:
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        if self.history is not None:
+            self.history.append(x)
+        self.value = self.mean
+        return self.mean
+
+    def process(self, block):
+        """Per-sample means for a block, leaving the same state as update()."""
+        block = np.asarray(block, dtype=np.float64)
+        if block.size == 0:
+            return block
+        if not self.window:
+            # Cumulative: fold the block in with the parallel Welford merge
+            n = self.count + np.arange(1, block.size + 1)
+            means = (self.mean * self.count + np.cumsum(block)) / n
+            b_mean = block.mean()
+            b_m2 = float(((block - b_mean) ** 2).sum())
+            delta = b_mean - self.mean
+            total = self.count + block.size
+            self.m2 += b_m2 + delta * delta * self.count * block.size / total
+            self.mean = float(means[-1])
+            self.count = total
+            self.value = self.mean
+            return means
+
+        # Sliding: window sums from a cumulative sum over history + block
+        prior = np.fromiter(self.history, dtype=np.float64, count=len(self.history))
+        data = np.concatenate((prior, block))
+        csum = np.concatenate(([0.0], np.cumsum(data)))
+        ends = np.arange(prior.size + 1, data.size + 1)
+        starts = np.maximum(ends - self.window, 0)
+        means = (csum[ends] - csum[starts]) / (ends - starts)
+
+        # Re-seed the O(1) state exactly from the final window
+        tail = data[-self.window:]
+        self.history.clear()
+        self.history.extend(tail.tolist())
+        self.count = tail.size
+        self.mean = float(tail.mean())
+        self.m2 = float(((tail - self.mean) ** 2).sum())
+        self.value = self.mean
+        return means
+
+
+# Exponential Moving Average
+class EMA:
+    """y += alpha * (x - y), seeded with the first sample."""
+
+    def __init__(self, alpha):
+        if not 0 < alpha <= 1:
+            raise ValueError(f"EMA alpha must be in (0, 1], got {alpha}")
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.value = None
+
+    def update(self, x):
+        x = float(x)
+        self.value = x if self.value is None else self.value + self.alpha * (x - self.value)
+        return self.value
+
+    def process(self, block):
+        """Vectorised EMA: y[n] = d^(n+1) y[-1] + a * sum d^(n-k) x[k], in chunks
+        short enough that d^-n stays finite."""
+        block = np.asarray(block, dtype=np.float64)
+        out = np.empty_like(block)
+        if block.size == 0:
+            return out
+        start = 0
+        if self.value is None:
+            self.value = float(block[0])
+            out[0] = self.value
+            start = 1
+        decay = 1.0 - self.alpha
+        if decay == 0.0:
+            out[start:] = block[start:]
+        else:
+            chunk = max(1, int(math.log(EMA_CHUNK_LIMIT) / -math.log(decay)))
+            for i in range(start, block.size, chunk):
+                x = block[i:i + chunk]
+                powers = decay ** np.arange(1, x.size + 1)
+                out[i:i + x.size] = powers * (self.value + self.alpha * np.cumsum(x / powers))
+                self.value = float(out[i + x.size - 1])
+        self.value = float(out[-1])
+        return out
+
+
+# Sliding Median
+class SlidingMedian:
+    """Median of the last `window` samples from a sorted window.
+
+    Each update is one insort and one removal by bisection, so the cost is a
+    memmove of at most `window` entries rather than a full sort.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.history = deque()
+        self.ordered = []
+        self.value = None
+
+    def _median(self):
+        n = len(self.ordered)
+        mid = n // 2
+        return self.ordered[mid] if n % 2 else (self.ordered[mid - 1] + self.ordered[mid]) / 2.0
+
+    def update(self, x):
+        if len(self.history) == self.window:
+            oldest = self.history.popleft()
+            del self.ordered[bisect.bisect_left(self.ordered, oldest)]
+        self.history.append(x)
+        bisect.insort(self.ordered, x)
+        self.value = self._median()
+        return self.value
+
+    def process(self, block):
+        """Per-sample medians for a block, leaving the same state as update()."""
+        block = np.asarray(block)
+        out = np.empty(block.size, dtype=np.float64)
+        # Fill a partial window one sample at a time
+        warmup = min(block.size, max(0, self.window - 1 - len(self.history)))
+        for i in range(warmup):
+            out[i] = self.update(block[i].item())
+        if warmup == block.size:
+            return out
+
+        # Full windows: one vectorised median over strided views
+        prior = np.fromiter(self.history, dtype=np.float64, count=len(self.history))
+        data = np.concatenate((prior[len(prior) - (self.window - 1):], block[warmup:]))
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.window)
+        out[warmup:] = np.median(windows, axis=1)
+
+        tail = block[-self.window:].tolist() if block.size >= self.window else \
+            (list(self.history) + block[warmup:].tolist())[-self.window:]
+        self.history = deque(tail)
+        self.ordered = sorted(tail)
+        self.value = float(out[-1])
+        return out
+
+
+# Schmitt Trigger
+class Hysteresis:
+    """Two-threshold comparator: goes True at or above `high`, False at or
+    below `low`, and holds its state in between.
+
+    With invert=True the sense flips (True at or below `low`), which suits
+    "switch on when the signal drops" decisions.
+    """
+
+    def __init__(self, low, high, state=False, invert=False):
+        if low > high:
+            raise ValueError(f"Hysteresis low threshold {low} is above high {high}")
+        self.low = low
+        self.high = high
+        self.invert = invert
+        self.initial = state
+        self.reset()
+
+    def reset(self):
+        self.value = self.initial
+
+    def update(self, x):
+        if x >= self.high:
+            self.value = not self.invert
+        elif x <= self.low:
+            self.value = self.invert
+        return self.value
+
+    def process(self, block):
+        """Per-sample comparator states; in-band samples carry the last decision."""
+        block = np.asarray(block)
+        if block.size == 0:
+            return np.empty(0, dtype=bool)
+        decided = (block >= self.high) | (block <= self.low)
+        idx = np.where(decided, np.arange(block.size), -1)
+        np.maximum.accumulate(idx, out=idx)
+        above = block[np.maximum(idx, 0)] >= self.high
+        states = np.where(idx >= 0, above != self.invert, self.value)
+        self.value = bool(states[-1])
+        return states
+
+
+# Filter Chains
+FILTERS = {
+    "mean": RunningStats,
+    "ema": EMA,
+    "median": SlidingMedian,
+    "hysteresis": Hysteresis,
+}
+
+
+class FilterChain:
+    """Filters applied in order; each stage feeds the next."""
+
+    def __init__(self, stages=()):
+        self.stages = list(stages)
+        self.value = None
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+        self.value = None
+
+    def update(self, x):
+        for stage in self.stages:
+            x = stage.update(x)
+        self.value = x
+        return x
+
+    def process(self, block):
+        for stage in self.stages:
+            block = stage.process(block)
+        if len(block):
+            self.value = block[-1].item()
+        return block
+
+
+def build_chain(spec):
+    """Build a FilterChain from [[name, {params}], ...]."""
+    stages = []
+    for name, params in spec:
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter '{name}' (expected one of {', '.join(FILTERS)})")
+        stages.append(FILTERS[name](**params))
+    return FilterChain(stages)
+
+
+_deployment = None
+
+
+def deployment_config(key, default):
+    """Look up a key in the deployment filter config, falling back to default."""
+    global _deployment
+    if _deployment is None:
+        _deployment = {}
+        if os.path.exists(FILTER_CONFIG):
+            try:
+                with open(FILTER_CONFIG, "r") as f:
+                    _deployment = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring filter config {FILTER_CONFIG}: {e}")
+    return _deployment.get(key, default)
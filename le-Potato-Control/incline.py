@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import numpy as np
+from stepper_motor import gpiod, setup_gpio, StepperAxis, STEPS_PER_DEGREE
+
+# Home Limit Switch
+HOME_SWITCH_LINE = 24     # GPIO24 on the stepper's chip, wired to the bottom-end switch
+HOME_ACTIVE = 0           # Line level while the switch is closed
+HOME_DIRECTION = -1       # Step direction that moves toward the switch
+
+# Homing (steps/s, steps)
+HOMING_RATE = 800         # Fast approach
+HOMING_SLOW_RATE = 100    # Final approach, slow enough to stop dead on the switch
+HOME_BACKOFF_STEPS = 200  # Back off the switch before the slow approach
+HOME_MAX_STEPS = 4000     # Give up if the switch is not found within this travel
+HOME_CHECK_MARGIN = 50    # Steps clear of the switch where it must read open
+
+# Angle <-> step calibration: (angle in degrees, steps from the home switch),
+# interpolated linearly between points. Override with a JSON list of pairs.
+CALIBRATION = [(-45, 0), (15, 60 * STEPS_PER_DEGREE)]
+CALIBRATION_PATH = "/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/incline_calibration.json"
+
+# Persisted commanded position
+STATE_PATH = "/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/.incline_state.json"
+
+
+def load_calibration(path=CALIBRATION_PATH):
+    """Calibration table from path if present, else the built-in one."""
+    table = CALIBRATION
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                table = [tuple(point) for point in json.load(f)]
+        except (OSError, ValueError) as e:
+            print(f"Ignoring incline calibration {path}: {e}")
+    table = sorted(table)
+    angles = np.array([angle for angle, _ in table], dtype=np.float64)
+    steps = np.array([step for _, step in table], dtype=np.float64)
+    if len(table) < 2 or np.any(np.diff(steps) <= 0):
+        raise ValueError("Incline calibration needs two or more points with steps increasing with angle")
+    return angles, steps
+
+
+class InclineService:
+    """Absolute incline positioning on top of StepperAxis.
+
+    Angles map to steps through the calibration table, counted from the home
+    switch. The commanded position is saved whenever the axis comes to rest
+    (and marked dirty while it moves), so a clean restart restores it
+    without re-homing; a dirty file, or a switch reading that contradicts
+    it, triggers homing instead. set_angle() just retargets the axis, so a
+    burst of presses becomes one move to the latest angle.
+    """
+
+    def __init__(self, axis, home_line, calibration_path=CALIBRATION_PATH, state_path=STATE_PATH):
+        self.axis = axis
+        self.home_line = home_line
+        self.angles, self.steps = load_calibration(calibration_path)
+        self.min_angle = float(self.angles[0])
+        self.max_angle = float(self.angles[-1])
+        self.state_path = state_path
+        self.homed = False
+        self.pending = None       # Angle requested while homing
+        self.lock = threading.Lock()
+        self.thread = None
+        axis.limit = self._at_limit
+        axis.on_move = lambda: self.save(clean=False)
+        axis.on_idle = lambda: self.save(clean=True)
+
+    # Switch
+    def switch_closed(self):
+        return self.home_line.get_value() == HOME_ACTIVE
+
+    def _at_limit(self, direction):
+        return direction == HOME_DIRECTION and self.switch_closed()
+
+    # Calibration
+    def angle_to_steps(self, angle):
+        return int(round(float(np.interp(angle, self.angles, self.steps))))
+
+    def steps_to_angle(self, steps):
+        return float(np.interp(steps, self.steps, self.angles))
+
+    @property
+    def angle(self):
+        return self.steps_to_angle(self.axis.position)
+
+    @property
+    def target_angle(self):
+        if self.pending is not None:
+            return self.pending
+        return self.steps_to_angle(self.axis.target)
+
+    # Persistence
+    def save(self, clean):
+        state = {"steps": self.axis.position, "homed": self.homed, "clean": clean}
+        tmp = f"{self.state_path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            print(f"Could not save incline position: {e}")
+
+    def restore(self):
+        """Adopt the saved position if it was written at rest and the switch agrees."""
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not (state.get("homed") and state.get("clean")):
+            print("Saved incline position is stale (stopped mid-move).")
+            return False
+        steps = int(state["steps"])
+        closed = self.switch_closed()
+        if closed != (steps <= 0) and (closed or steps >= HOME_CHECK_MARGIN):
+            print(f"Home switch disagrees with saved position ({steps} steps).")
+            return False
+        self.axis.set_position(steps)
+        self.homed = True
+        print(f"Incline restored at {self.angle:+.1f} deg ({steps} steps).")
+        return True
+
+    # Homing
+    def home(self):
+        """Find the switch (fast, back off, slow) and zero the axis there. Blocks."""
+        axis = self.axis
+        cruise = axis.max_rate
+        self.homed = False
+        try:
+            if self.switch_closed():
+                axis.move_by(-HOME_DIRECTION * HOME_BACKOFF_STEPS)
+                axis.wait()
+            for rate in (HOMING_RATE, HOMING_SLOW_RATE):
+                axis.max_rate = rate
+                axis.limit_hit = False
+                axis.move_by(HOME_DIRECTION * HOME_MAX_STEPS)
+                axis.wait()
+                if not axis.limit_hit:
+                    print("Homing failed: home switch not found.")
+                    return False
+                if rate == HOMING_RATE:
+                    axis.move_by(-HOME_DIRECTION * HOME_BACKOFF_STEPS)
+                    axis.wait()
+        finally:
+            axis.max_rate = cruise
+        axis.set_position(0)
+        self.homed = True
+        self.save(clean=True)
+        print("Incline homed.")
+        return True
+
+    def _home_then_resume(self):
+        if self.home():
+            with self.lock:
+                pending, self.pending = self.pending, None
+            if pending is not None:
+                self.set_angle(pending)
+
+    def start(self):
+        """Restore the saved position, or home in the background."""
+        self.axis.start()
+        if not self.restore():
+            self.thread = threading.Thread(target=self._home_then_resume, name="incline_home", daemon=True)
+            self.thread.start()
+
+    # Motion
+    def set_angle(self, angle):
+        """Move to angle (clamped to the calibrated range); returns the clamped angle."""
+        angle = min(max(angle, self.min_angle), self.max_angle)
+        with self.lock:
+            if not self.homed:
+                self.pending = angle
+                return angle
+        self.axis.move_to(self.angle_to_steps(angle))
+        return angle
+
+    def cancel(self):
+        """Decelerate and hold wherever the axis stops."""
+        with self.lock:
+            self.pending = None
+        self.axis.stop()
+
+    def close(self):
+        self.axis.stop()
+        self.axis.wait(2)
+        self.axis.close()
+        if self.homed:
+            self.save(clean=not self.axis.moving)
+
+
+def open_incline(state_path=STATE_PATH):
+    """Set up the stepper and home switch lines and start the position service.
+
+    Returns (chip, service); raises OSError when the GPIO lines are unavailable.
+    """
+    chip, pulse_line, dir_line = setup_gpio()
+    home_line = chip.get_line(HOME_SWITCH_LINE)
+    home_line.request(consumer="InclineHome", type=gpiod.LINE_REQ_DIR_IN)
+    service = InclineService(StepperAxis(pulse_line, dir_line), home_line, state_path=state_path)
+    service.start()
+    return chip, service
@@ -1,19 +1,9 @@
-import subprocess
-
-def activate_ioni():
-    try:
-        # Call the binary
-        result = subprocess.run(
-            ["/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/enable_ioni_configurator"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print("Output from IONI activation:")
-        print(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print("Error activating IONI:")
-        print(e.stderr)
+import time
+from simucube import activate_ioni
 
 if __name__ == "__main__":
-    activate_ioni()
+    start_time = time.perf_counter()
+    if activate_ioni() == 0:
+        print(f"IONI activated in {(time.perf_counter() - start_time) * 1000.0:.1f} ms")
+    else:
+        print("Error activating IONI.")
@@ -1,24 +1,7 @@
 import ctypes
 import time
-
-# Load the shared library
-libsimucube = ctypes.CDLL("/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/Ioni_Functions/libsimucube.so")
-
-# Define function signatures
-libsimucube.openSimucube.restype = ctypes.c_int
-libsimucube.openSimucube.argtypes = [ctypes.POINTER(ctypes.c_int)]
-
-libsimucube.closeSimucube.restype = None
-libsimucube.closeSimucube.argtypes = [ctypes.c_int]
-
-libsimucube.clearFaultsAndInitialize.restype = ctypes.c_int
-libsimucube.clearFaultsAndInitialize.argtypes = [ctypes.c_int]
-
-libsimucube.setSpeed.restype = ctypes.c_int
-libsimucube.setSpeed.argtypes = [ctypes.c_int, ctypes.c_int]
-
-libsimucube.getTorque.restype = ctypes.c_int
-libsimucube.getTorque.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+from simucube import libsimucube
+from drive_sampler import DriveSampler
 
 # Hold motor speed for a specific duration
 def hold_motor_speed(handle, speed, duration):
@@ -26,12 +9,23 @@ def hold_motor_speed(handle, speed, duration):
     set_speed_result = libsimucube.setSpeed(handle.value, speed)
     if set_speed_result == 0:
         print(f"Speed set to {speed}. Holding for {duration} seconds.")
+        # The native sampler reads the drive at a fixed rate; Python only
+        # collects whole blocks of samples
+        sampler = DriveSampler(handle)
+        if not sampler.start():
+            print("Failed to start drive sampler.")
+            return
         start_time = time.time()
-        while time.time() - start_time < duration:
-            torque = ctypes.c_int()
-            if libsimucube.getTorque(handle.value, ctypes.byref(torque)) == 0:
-                print(f"Torque: {torque.value} Nm")
-            time.sleep(0.1)  # Polling delay
+        try:
+            while time.time() - start_time < duration:
+                time.sleep(0.1)  # Reporting interval
+                samples = sampler.read()
+                if len(samples):
+                    print(f"Torque: {samples['torque'].mean():.1f} Nm (n={len(samples)}), "
+                          f"Velocity: {samples['velocity'][-1]}, Faults: {samples['faults'][-1]}")
+        finally:
+            sampler.stop()
+        print(f"Sampler overruns: {sampler.overruns}, bus errors: {sampler.errors}")
     else:
         print(f"Failed to set speed to {speed}. Error code: {set_speed_result}")
 
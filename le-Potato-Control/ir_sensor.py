@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import deque
+from backend import load_gpiod
+
+gpiod = load_gpiod()
+
+# GPIO Configuration
+CHIP_NAME = "gpiochip0"  # GPIO chip for GPIOAO bank
+LINE_OFFSET = 6          # GPIOAO_6 (Pin 12)
+
+# Edge handling
+DEBOUNCE_NS = 5_000_000  # Ignore further edges for 5 ms after an accepted one
+EVENT_HISTORY = 256      # Number of raw edge events kept for inspection
+WAIT_TIMEOUT_NS = 1_000_000_000
+
+# Sensor states (NC sensor: line high = idle, line low = beam broken)
+IDLE = 1
+TRIGGERED = 0
+
+
+def event_timestamp_ns(event):
+    """Kernel timestamp of a gpiod line event in nanoseconds (CLOCK_MONOTONIC)."""
+    return event.sec * 1_000_000_000 + event.nsec
+
+
+class IRSensor:
+    """NC IR safety sensor driven by libgpiod edge events.
+
+    A dedicated thread blocks in event_wait() and reacts to each edge as soon
+    as the kernel reports it. A falling edge calls on_trigger(timestamp_ns)
+    immediately; debouncing is done on the kernel timestamps (leading edge
+    wins, later edges inside DEBOUNCE_NS are ignored and the line is re-read
+    once the window closes), so no sleeps sit in the stop path.
+    """
+
+    def __init__(self, chip_name=CHIP_NAME, line_offset=LINE_OFFSET,
+                 on_trigger=None, on_clear=None, debounce_ns=DEBOUNCE_NS):
+        self.chip_name = chip_name
+        self.line_offset = line_offset
+        self.on_trigger = on_trigger
+        self.on_clear = on_clear
+        self.debounce_ns = debounce_ns
+        self.events = deque(maxlen=EVENT_HISTORY)  # (edge type, timestamp_ns)
+        self.state = IDLE
+        self.last_edge_ns = 0
+        self.chip = None
+        self.line = None
+        self.thread = None
+        self.running = False
+
+    @property
+    def triggered(self):
+        return self.state == TRIGGERED
+
+    def start(self):
+        """Request the line for both-edge events and start the event thread."""
+        self.chip = gpiod.Chip(self.chip_name)
+        self.line = self.chip.get_line(self.line_offset)
+        self.line.request(consumer="nc_sensor", type=gpiod.LINE_REQ_EV_BOTH_EDGES)
+        # Seed the state from the current level so a beam that is already
+        # broken at startup is treated as a trigger
+        self._apply(self.line.get_value(), time.monotonic_ns())
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="ir_sensor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+        if self.chip:
+            self.chip.close()
+
+    def _apply(self, value, timestamp_ns):
+        if value == self.state:
+            return
+        self.state = value
+        self.last_edge_ns = timestamp_ns
+        if value == TRIGGERED:
+            if self.on_trigger:
+                self.on_trigger(timestamp_ns)
+        elif self.on_clear:
+            self.on_clear(timestamp_ns)
+
+    def _run(self):
+        resync = False
+        while self.running:
+            timeout_ns = WAIT_TIMEOUT_NS
+            if resync:
+                remaining = self.last_edge_ns + self.debounce_ns - time.monotonic_ns()
+                timeout_ns = max(remaining, 0)
+            if not self.line.event_wait(sec=timeout_ns // 1_000_000_000,
+                                        nsec=timeout_ns % 1_000_000_000):
+                if resync:
+                    # Debounce window closed: settle on the real line level
+                    resync = False
+                    self._apply(self.line.get_value(), time.monotonic_ns())
+                continue
+
+            event = self.line.event_read()
+            timestamp_ns = event_timestamp_ns(event)
+            rising = event.type == gpiod.LineEvent.RISING_EDGE
+            self.events.append(("rising" if rising else "falling", timestamp_ns))
+
+            if timestamp_ns - self.last_edge_ns < self.debounce_ns:
+                resync = True
+                continue
+            self._apply(IDLE if rising else TRIGGERED, timestamp_ns)
@@ -1,18 +1,16 @@
 import time
 import threading
-from smbus2 import SMBus
-import subprocess
+from lcd_driver import open_lcd, LCD_WIDTH
+from adc_stream import open_adc
+from button_decoder import ButtonDecoder, PRESS, REPEAT
+from simucube import libsimucube, connect_drive, print_timings
+from startup import Startup, ensure_overlays, print_ready
+from scheduler import Scheduler
+from metrics import METRICS, start_server, timed
+from setpoint import SetpointManager
+from speed_ramp import SpeedStreamer
+from supervisor import DriveSupervisor
 import ctypes
-from collections import deque
-
-# I2C Configuration
-I2C_BUS = 1
-LCD_I2C_ADDR = 0x27
-LCD_WIDTH = 16  # Max characters per line
-
-# ADC Configuration
-ADC_CHANNEL = 0
-ADC_PATH = f"/sys/bus/iio/devices/iio:device0/in_voltage{ADC_CHANNEL}_raw"
 
 # Button Calibration Thresholds
 button_thresholds = {
@@ -29,169 +27,133 @@ SPEED_SETPOINT = 1500  # Default speed (1500 rpm = 10 m/min)
 MAX_SPEED_RPM = 3000   # Max speed (20 m/min)
 MIN_SPEED_RPM = 1000   # Min speed (5 m/min)
 SPEED_STEP_RPM = 200   # Increment/decrement step (1 m/min)
-POLL_DELAY = 0.05      # Polling delay
+RAMP_SPEED_CHANGES = True  # Stream S-curve ramps instead of stepping the setpoint
+POLL_DELAY = 0.05      # Button polling period
+LCD_PERIOD = 0.5       # LCD refresh period
+REPORT_INTERVAL = 60   # Seconds between scheduler timing reports
+
+# Real-time scheduling for the button task (None leaves normal scheduling)
+REALTIME_PRIORITY = None  # SCHED_FIFO priority, e.g. 50
+CONTROL_CPUS = None       # CPU affinity set, e.g. {3}
 
 # Shared Variables
 current_speed = SPEED_SETPOINT
 shared_lock = threading.Lock()
 
-# Load the shared library
-libsimucube = ctypes.CDLL("/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/Ioni_Functions/libsimucube.so")
-
-# Define function signatures
-libsimucube.openSimucube.restype = ctypes.c_int
-libsimucube.openSimucube.argtypes = [ctypes.POINTER(ctypes.c_int)]
-
-libsimucube.closeSimucube.restype = None
-libsimucube.closeSimucube.argtypes = [ctypes.c_int]
-
-libsimucube.setSpeed.restype = ctypes.c_int
-libsimucube.setSpeed.argtypes = [ctypes.c_int, ctypes.c_int]
-
-libsimucube.clearFaultsAndInitialize.restype = ctypes.c_int
-libsimucube.clearFaultsAndInitialize.argtypes = [ctypes.c_int]
-
-# Enable IONI Configuration
-def activate_ioni():
-    try:
-        # Call the binary
-        result = subprocess.run(
-            ["/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/enable_ioni_configurator"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print("Output from IONI activation:")
-        print(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print("Error activating IONI:")
-        print(e.stderr)
-
-# LCD Functions
-def lcd_toggle_enable(bus, bits):
-    bus.write_byte(LCD_I2C_ADDR, bits | 0b00000100)
-    time.sleep(0.0005)
-    bus.write_byte(LCD_I2C_ADDR, bits & ~0b00000100)
-    time.sleep(0.0005)
-
-def lcd_send_byte(bus, bits, mode):
-    high_bits = mode | (bits & 0xF0) | 0x08
-    low_bits = mode | ((bits << 4) & 0xF0) | 0x08
-    bus.write_byte(LCD_I2C_ADDR, high_bits)
-    lcd_toggle_enable(bus, high_bits)
-    bus.write_byte(LCD_I2C_ADDR, low_bits)
-    lcd_toggle_enable(bus, low_bits)
-
-def lcd_init(bus):
-    lcd_send_byte(bus, 0x33, 0)
-    lcd_send_byte(bus, 0x32, 0)
-    lcd_send_byte(bus, 0x06, 0)
-    lcd_send_byte(bus, 0x0C, 0)
-    lcd_send_byte(bus, 0x28, 0)
-    lcd_send_byte(bus, 0x01, 0)
-    time.sleep(0.005)
-
-def lcd_display_string(bus, message, line):
-    if line == 1:
-        lcd_send_byte(bus, 0x80, 0)
-    elif line == 2:
-        lcd_send_byte(bus, 0xC0, 0)
-    for char in message.ljust(LCD_WIDTH, " "):
-        lcd_send_byte(bus, ord(char), 1)
-
-# ADC Functions
-def read_adc():
-    try:
-        with open(ADC_PATH, "r") as adc_file:
-            raw_value = int(adc_file.read().strip())
-            return raw_value
-    except Exception as e:
-        print(f"Error reading ADC: {e}")
-        return None
-
-def detect_button(adc_value, thresholds):
-    closest_button = None
-    closest_diff = float("inf")
-    for button, threshold in thresholds.items():
-        diff = abs(adc_value - threshold)
-        if diff < closest_diff:
-            closest_button = button
-            closest_diff = diff
-    return closest_button
-
-# Button Checking Thread
-def button_checking_thread(handle):
-    global current_speed
-    last_detected = None
-
-    while True:
-        adc_value = read_adc()
+# Button Polling Task
+def button_poller(handle, setpoints=None, adc_reader=None):
+    """Build the periodic button task: one ADC read and decode per tick."""
+    adc_reader = adc_reader or open_adc()  # IIO buffered stream, sysfs fallback
+    decoder = ButtonDecoder(button_thresholds)  # Holding a speed button auto-repeats
+    detect_button = timed("detect_button", decoder.update)
+    if setpoints is None:
+        setpoints = SetpointManager(handle)
+        setpoints.request(current_speed)
+    supervisor = DriveSupervisor(handle, setpoints)
+
+    def tick():
+        global current_speed
+        adc_value = adc_reader.read()
         if adc_value is not None:
-            detected_button = detect_button(adc_value, button_thresholds)
-
-            if detected_button != last_detected:
-                last_detected = detected_button
+            for event, detected_button in detect_button(adc_value, time.monotonic()):
+                if event not in (PRESS, REPEAT):
+                    continue
 
                 with shared_lock:
                     if detected_button == "button_2":
                         current_speed = min(current_speed + SPEED_STEP_RPM, MAX_SPEED_RPM)
-                        libsimucube.setSpeed(handle.value, current_speed)
                         print(f"Speed increased to {current_speed} RPM.")
                     elif detected_button == "button_4":
                         current_speed = max(current_speed - SPEED_STEP_RPM, MIN_SPEED_RPM)
-                        libsimucube.setSpeed(handle.value, current_speed)
                         print(f"Speed decreased to {current_speed} RPM.")
-        time.sleep(0.05)
-
-# LCD Updating Thread
-def lcd_updating_thread():
-    with SMBus(I2C_BUS) as bus:
-        lcd_init(bus)
-
-        while True:
-            with shared_lock:
-                speed_m_per_min = current_speed // 150
-                line_1 = f"Speed: {speed_m_per_min:02} m/min".center(LCD_WIDTH)
-                line_2 = "Motor Control".center(LCD_WIDTH)
+                    setpoints.request(current_speed)
 
-            lcd_display_string(bus, line_1, 1)
-            lcd_display_string(bus, line_2, 2)
-            time.sleep(0.5)
+        # Sends only a changed speed (bursts merge) or a due keepalive; while
+        # the drive is faulted or unplugged, a recovery attempt instead
+        if supervisor.healthy:
+            supervisor.observe(setpoints.flush())
+        else:
+            supervisor.recover()
+    return tick
+
+def drive_stopper(handle, setpoints):
+    """Build the button task's on_failure: stop the belt when ticks keep raising."""
+    def on_failure():
+        print("Button task keeps failing; stopping the motor.")
+        with shared_lock:
+            setpoints.request(0)
+        if libsimucube.setSpeed(handle.value, 0) == 0:
+            setpoints.reset(0)
+    return on_failure
+
+# LCD Refresh Task
+def lcd_refresher(lcd=None):
+    """Build the periodic LCD task; only changed cells go out on the bus.
+
+    Returns (tick, close); close blanks the display and releases the bus
+    and runs as the task's on_exit.
+    """
+    lcd = lcd or open_lcd()
+
+    def tick():
+        with shared_lock:
+            speed_m_per_min = current_speed // 150
+        lcd.set_line(f"Speed: {speed_m_per_min:02} m/min".center(LCD_WIDTH), 1)
+        lcd.set_line("Motor Control".center(LCD_WIDTH), 2)
+        lcd.refresh()
+
+    def close():
+        try:
+            lcd.clear()
+        finally:
+            lcd.close()
+    return tick, close
 
 # Main Function
 if __name__ == "__main__":
     handle = ctypes.c_int()
+    scheduler = None
 
     try:
-        # Activate IONI configuration
-        activate_ioni()
-
-        # Open Simucube
-        if libsimucube.openSimucube(ctypes.byref(handle)) == 0:
-            print("Simucube opened successfully.")
-
-            # Clear faults and initialize
-            print("Clearing faults and initializing Simucube...")
-            if libsimucube.clearFaultsAndInitialize(handle.value) == 0:
-                print("Faults cleared and motor initialized.")
-
-                # Initialize speed
-                libsimucube.setSpeed(handle.value, current_speed)
-
-                # Start threads
-                button_thread = threading.Thread(target=button_checking_thread, args=(handle,), daemon=True)
-                lcd_thread = threading.Thread(target=lcd_updating_thread, daemon=True)
-
-                button_thread.start()
-                lcd_thread.start()
-
-                # Keep the main thread running
-                while True:
-                    time.sleep(1)
-            else:
-                print("Failed to clear faults and initialize motor.")
-        else:
-            print("Failed to open Simucube.")
+        # Drive, LCD and ADC come up concurrently; the LCD waits for its overlays
+        startup = Startup()
+        startup.add("overlays", ensure_overlays)
+        startup.add("drive", lambda: connect_drive(handle))
+        startup.add("lcd", open_lcd, after=("overlays",))
+        startup.add("adc", open_adc)
+        startup.add("metrics", start_server, required=False)
+        startup.start()
+        ready, timings = startup.wait_for("drive") or (False, {})
+        startup.wait()
+        startup.report()
+        if ready and startup.ok:
+            print("Faults cleared and motor initialized.")
+
+            # Initialize speed
+            phase = time.perf_counter()
+            streamer = SpeedStreamer(handle) if RAMP_SPEED_CHANGES else None
+            setpoints = SetpointManager(handle, streamer=streamer)
+            setpoints.request(current_speed)
+            setpoints.flush(force=True)
+            timings["first_setpoint"] = (time.perf_counter() - phase) * 1000.0
+            print("Drive connect timing:")
+            print_timings(timings)
+
+            # Start periodic tasks
+            METRICS.gauge("zazu_speed_setpoint_rpm", "Speed the wall is set to.", lambda: current_speed)
+            scheduler = Scheduler()
+            scheduler.add("buttons", POLL_DELAY, button_poller(handle, setpoints, startup.result("adc")),
+                          REALTIME_PRIORITY, CONTROL_CPUS, on_failure=drive_stopper(handle, setpoints))
+            lcd_tick, lcd_close = lcd_refresher(startup.result("lcd"))
+            scheduler.add("lcd", LCD_PERIOD, lcd_tick, on_exit=lcd_close)
+            scheduler.start()
+            print_ready()
+
+            # Keep the main thread running and report loop timing
+            while True:
+                time.sleep(REPORT_INTERVAL)
+                scheduler.print_report()
+                print(setpoints.stats.summary())
 
     except KeyboardInterrupt:
         print("Exiting...")
@@ -200,6 +162,9 @@ if __name__ == "__main__":
         print(f"Error: {e}")
 
     finally:
+        # Join the tasks first so no keepalive goes out after the stop below
+        if scheduler:
+            scheduler.stop()
         libsimucube.setSpeed(handle.value, 0)
         libsimucube.closeSimucube(handle.value)
         print("Simucube closed.")
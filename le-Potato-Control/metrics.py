@@ -0,0 +1,252 @@
+import bisect
+import os
+import threading
+import time
+from tracing import TRACER, traced
+
+# Metrics Endpoint (local only; a scraper on the Pi reads it)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9101         # None disables the TCP listener
+METRICS_SOCKET = None       # Unix socket path, e.g. "/run/zazuwall/metrics.sock"
+
+# Histogram bucket upper edges in microseconds (last bucket is open-ended)
+HISTOGRAM_EDGES_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+# Latency of every wrapped call, labelled by call name
+CALL_SECONDS = "zazu_call_duration_seconds"
+CALL_ERRORS = "zazu_call_errors_total"
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; recording is one bisect and one add."""
+
+    def __init__(self, edges=HISTOGRAM_EDGES_US):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.total = 0
+        self.sum_us = 0.0
+        self.max_us = 0.0
+
+    def record(self, us):
+        self.counts[bisect.bisect_left(self.edges, us)] += 1
+        self.total += 1
+        self.sum_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentile(self, p):
+        """Upper bucket edge containing the p-th percentile."""
+        if not self.total:
+            return 0.0
+        target = self.total * p / 100.0
+        seen = 0
+        for edge, count in zip(self.edges + (self.max_us,), self.counts):
+            seen += count
+            if seen >= target:
+                return float(edge)
+        return self.max_us
+
+
+class Value:
+    """Counter or gauge; either set directly or read from func at scrape time."""
+
+    def __init__(self, func=None):
+        self.value = 0
+        self.func = func
+
+    def inc(self, n=1):
+        self.value += n
+
+    def set(self, value):
+        self.value = value
+
+    def read(self):
+        return self.func() if self.func else self.value
+
+
+def _labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def _number(value):
+    return "+Inf" if value == float("inf") else f"{value:g}" if isinstance(value, float) else str(int(value))
+
+
+class Registry:
+    """Named metric families rendered in the Prometheus text format.
+
+    Series are plain objects updated without locks from whichever thread
+    owns them; a scrape reads them as they are, so a counter seen mid-update
+    is at most one event behind. Counters and gauges that mirror state kept
+    elsewhere take a func and cost nothing until scraped.
+    """
+
+    def __init__(self):
+        self.families = {}   # name -> (type, help, {labels: series})
+        self.lock = threading.Lock()
+
+    def _series(self, kind, name, help, labels, make, replace=False):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, (kind, help, {}))
+            series = family[2].get(key)
+            if series is None or replace:
+                series = family[2][key] = make()
+            return series
+
+    def counter(self, name, help, func=None, **labels):
+        series = self._series("counter", name, help, labels, Value)
+        if func:
+            series.func = func
+        return series
+
+    def gauge(self, name, help, func=None, **labels):
+        series = self._series("gauge", name, help, labels, Value)
+        if func:
+            series.func = func
+        return series
+
+    def histogram(self, name, help, hist=None, **labels):
+        """Histogram series; pass hist to export one that is already being recorded."""
+        if hist is None:
+            return self._series("histogram", name, help, labels, Histogram)
+        return self._series("histogram", name, help, labels, lambda: hist, replace=True)
+
+    def timed(self, call, func, errors=False):
+        """Wrap func so each call lands in the call latency histogram.
+
+        With errors=True a negative return value (libsimucube's failure
+        code) also counts as an error.
+        """
+        hist = self.histogram(CALL_SECONDS, "Latency of instrumented calls.", call=call)
+        failures = self.counter(CALL_ERRORS, "Instrumented calls that returned an error.", call=call)
+        clock = time.perf_counter_ns
+
+        def wrapper(*args):
+            start = clock()
+            result = func(*args)
+            hist.record((clock() - start) / 1000.0)
+            if errors and type(result) is int and result < 0:
+                failures.value += 1
+            return result
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def add_task(self, task):
+        """Export a periodic task's own timing stats under its name."""
+        stats = task.stats
+        self.histogram("zazu_task_duration_seconds", "Time spent in each task tick.",
+                       stats.execution, task=task.name)
+        self.histogram("zazu_task_jitter_seconds", "Task wake-up lateness vs. its deadline.",
+                       stats.jitter, task=task.name)
+        self.counter("zazu_task_runs_total", "Task ticks run.", lambda: stats.runs, task=task.name)
+        self.counter("zazu_task_overruns_total", "Ticks that finished past the next deadline.",
+                     lambda: stats.overruns, task=task.name)
+        self.counter("zazu_task_skipped_total", "Periods dropped to get back on schedule.",
+                     lambda: stats.skipped, task=task.name)
+        self.counter("zazu_task_errors_total", "Ticks that raised.", lambda: stats.errors, task=task.name)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            families = [(name, kind, help, list(series.items()))
+                        for name, (kind, help, series) in sorted(self.families.items())]
+        for name, kind, help, series in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series:
+                if kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(metric.read())}")
+                    continue
+                cumulative = 0
+                for edge, count in zip(metric.edges + (float("inf"),), metric.counts):
+                    cumulative += count
+                    le = edge if edge == float("inf") else edge / 1e6
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', _number(float(le))))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {metric.sum_us / 1e6:g}")
+                lines.append(f"{name}_count{_labels(labels)} {metric.total}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry
+METRICS = Registry()
+
+
+class InstrumentedLibrary:
+    """Proxy for libsimucube that times (and, when tracing, traces) every exported function it hands out."""
+
+    def __init__(self, lib, registry=METRICS):
+        self._lib = lib
+        self._registry = registry
+
+    def __getattr__(self, name):
+        attr = getattr(self._lib, name)
+        if callable(attr) and not name.startswith("_"):
+            if METRICS_ENABLED:
+                attr = self._registry.timed(name, attr, errors=True)
+            attr = traced(name, attr)
+        setattr(self, name, attr)  # Wrap once; later lookups skip __getattr__
+        return attr
+
+
+def instrument_library(lib, registry=METRICS):
+    return InstrumentedLibrary(lib, registry) if METRICS_ENABLED or TRACER else lib
+
+
+def timed(call, func):
+    """Time func under METRICS when metrics are enabled and trace it when tracing is on;
+    with neither, func comes back unchanged."""
+    return traced(call, METRICS.timed(call, func) if METRICS_ENABLED else func)
+
+
+# Endpoint
+def _make_servers(port, socket_path, host):
+    # http.server drags in email and friends; only load it when serving
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the console
+
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    servers = []
+    if port is not None:
+        servers.append(ThreadingHTTPServer((host, port), MetricsHandler))
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        servers.append(UnixHTTPServer(socket_path, MetricsHandler))
+    return servers
+
+
+def start_server(port=METRICS_PORT, socket_path=METRICS_SOCKET, host=METRICS_HOST):
+    """Serve /metrics on a background thread; returns the servers started."""
+    if not METRICS_ENABLED:
+        return []
+    try:
+        servers = _make_servers(port, socket_path, host)
+    except OSError as e:
+        print(f"Metrics endpoint disabled: {e}")
+        return []
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return servers
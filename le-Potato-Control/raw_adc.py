@@ -1,10 +1,21 @@
 import time
+from adc_stream import open_adc, BufferedADC
 
-while True:
-    try:
-        with open("/sys/bus/iio/devices/iio:device0/in_voltage0_raw", "r") as adc_file:
-            raw_value = int(adc_file.read().strip())
-            adc_voltage = (raw_value / 4095) * 1.8  # Assuming a 10-bit ADC and 1.8V reference
+adc = open_adc()
+
+try:
+    while True:
+        raw_value = adc.read()
+        if raw_value is None:
+            time.sleep(0.1)
+            continue
+        adc_voltage = (raw_value / 4095) * 1.8  # 12-bit ADC and 1.8V reference
+        if isinstance(adc, BufferedADC):
+            block = adc.ring.latest(adc.block_size)
+            print(f"ADC value: {adc_voltage:.2f} V (block of {len(block)}, spread {block.max() - block.min()})")
+        else:
             print(f"ADC value: {adc_voltage:.2f} V")
-    except Exception as e:
-        print(f"Error: {e}")
+except KeyboardInterrupt:
+    print("Exiting...")
+finally:
+    adc.close()
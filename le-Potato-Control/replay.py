@@ -0,0 +1,83 @@
+import sys
+import numpy as np
+from controller import WallState, SPEED_SETPOINT, NATIVE_ESTOP
+from telemetry import Telemetry, BUTTONS, TELEMETRY_PATH
+from torque_speed import TorqueGate
+
+# Usage: python3 replay.py [telemetry file] [--last N] [--auto] [--speed RPM]
+# Off the wall, run with ZAZU_BACKEND=sim. Filters and thresholds come from
+# the deployment filter config, so a session can be re-run against new tuning.
+
+MAX_LISTED = 20  # Divergences printed in full
+
+
+def replay(records, auto_mode=False, speed=SPEED_SETPOINT, native_estop=NATIVE_ESTOP):
+    """Setpoint the controller logic would have commanded for each record.
+
+    Each row is replayed the way drive_task saw it: the row's button press
+    is applied, the setpoint is chosen from the belt state so far, then the
+    row's torque (or sensor stop) updates that state for the next row. With
+    the native e-stop a press during a sensor stop only acknowledges it, as
+    Controller._handle_button does: speed and mode stay as they were.
+    """
+    state = WallState()
+    state.auto_mode = auto_mode
+    state.motor_running = not auto_mode  # As Controller.run() starts out
+    state.speed = speed
+    gate = TorqueGate()
+    commanded = np.empty(len(records), dtype=np.int32)
+    for i, (torque, sensor, button) in enumerate(zip(records["torque"], records["sensor"], records["button"])):
+        if button >= 0:
+            if native_estop and state.sensor_stop:
+                # The recorded sensor column shows when the latch actually released
+                state.resume_required = False
+            else:
+                state.apply_button(BUTTONS[button])
+        if sensor and not state.sensor_stop:
+            state.motor_running = False
+            state.resume_required = True
+        state.sensor_stop = bool(sensor)
+        commanded[i] = state.speed if state.motor_running and not state.sensor_stop else 0
+        if state.sensor_stop:
+            gate.reset()
+        else:
+            state.update_motor(gate, int(torque))
+    return commanded
+
+
+def transitions(setpoints):
+    """Indices where the belt started or stopped."""
+    running = setpoints != 0
+    return np.flatnonzero(running[1:] != running[:-1]) + 1
+
+
+# Main Function
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    path, last, auto_mode, speed = TELEMETRY_PATH, None, False, SPEED_SETPOINT
+    while args:
+        arg = args.pop(0)
+        if arg == "--last":
+            last = int(args.pop(0))
+        elif arg == "--auto":
+            auto_mode = True
+        elif arg == "--speed":
+            speed = int(args.pop(0))
+        else:
+            path = arg
+
+    records = Telemetry(path).records(last)
+    if len(records) == 0:
+        print("No records.")
+        sys.exit(0)
+    seconds = (records["timestamp_ns"][-1] - records["timestamp_ns"][0]) / 1e9
+    replayed = replay(records, auto_mode, speed)
+    recorded = records["setpoint"]
+
+    print(f"{len(records)} records over {seconds:.1f} s")
+    print(f"Belt start/stop: recorded {len(transitions(recorded))}, replayed {len(transitions(replayed))}")
+    diverged = np.flatnonzero(replayed != recorded)
+    print(f"Rows where the replayed setpoint differs: {len(diverged)}")
+    for i in diverged[:MAX_LISTED]:
+        t = (records["timestamp_ns"][i] - records["timestamp_ns"][0]) / 1e9
+        print(f"  {t:9.2f} s  torque {records['torque'][i]:6}  recorded {recorded[i]:5}  replayed {replayed[i]:5}")
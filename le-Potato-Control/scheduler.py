@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import traceback
+from metrics import Histogram, METRICS
+from tracing import traced
+
+MAX_CONSECUTIVE_ERRORS = 10  # Failed ticks in a row before the task's on_failure runs
+
+
+class TaskStats:
+    def __init__(self):
+        self.runs = 0
+        self.overruns = 0   # Work finished after the next deadline
+        self.skipped = 0    # Whole periods dropped to get back on schedule
+        self.errors = 0     # Ticks that raised
+        self.jitter = Histogram()     # Wake-up lateness vs. the deadline
+        self.execution = Histogram()  # Time spent in the task function
+
+    def summary(self):
+        return (f"runs={self.runs} overruns={self.overruns} skipped={self.skipped} errors={self.errors} "
+                f"jitter p50<={self.jitter.percentile(50):.0f}us p99<={self.jitter.percentile(99):.0f}us "
+                f"max={self.jitter.max_us:.0f}us exec p99<={self.execution.percentile(99):.0f}us "
+                f"max={self.execution.max_us:.0f}us")
+
+
+class PeriodicTask:
+    def __init__(self, name, period, func, priority=None, cpus=None, on_failure=None, on_exit=None):
+        self.name = name
+        self.period = period
+        self.func = func
+        self.priority = priority  # SCHED_FIFO priority, None for normal scheduling
+        self.cpus = cpus          # CPU affinity set, None for no pinning
+        self.on_failure = on_failure  # Called once MAX_CONSECUTIVE_ERRORS ticks in a row raised
+        self.on_exit = on_exit        # Called on the task's thread when the loop ends
+        self.stats = TaskStats()
+        self.running = False
+        METRICS.add_task(self)
+
+
+def apply_realtime(priority=None, cpus=None):
+    """Put the calling thread under SCHED_FIFO and/or pin it to CPUs."""
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (OSError, AttributeError) as e:
+            print(f"Could not set CPU affinity {cpus}: {e}")
+    if priority:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        except (OSError, AttributeError) as e:
+            print(f"Could not enable SCHED_FIFO priority {priority}: {e}")
+
+
+def run_periodic(task):
+    """Run task.func every task.period on absolute monotonic deadlines.
+
+    The next deadline is derived from the previous one rather than from when
+    the work finished, so work time does not stretch the period. When the work
+    overruns, the missed periods are counted and skipped instead of being run
+    back to back.
+
+    A tick that raises is logged and counted and the loop keeps going; after
+    MAX_CONSECUTIVE_ERRORS failures in a row task.on_failure (e.g. stopping
+    the drive) runs once for that streak.
+    """
+    apply_realtime(task.priority, task.cpus)
+    func = traced(task.name, task.func)  # Each tick is one span around the calls it makes
+    stats = task.stats
+    period = task.period
+    task.running = True
+    failures = 0
+    deadline = time.monotonic() + period
+    try:
+        while task.running:
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            start = time.monotonic()
+            stats.jitter.record((start - deadline) * 1e6)
+
+            try:
+                func()
+                failures = 0
+            except Exception:
+                stats.errors += 1
+                failures += 1
+                if failures == 1:
+                    print(f"[{task.name}] Tick failed:")
+                    traceback.print_exc()
+                if failures == MAX_CONSECUTIVE_ERRORS:
+                    print(f"[{task.name}] {failures} ticks failed in a row.")
+                    if task.on_failure:
+                        task.on_failure()
+
+            end = time.monotonic()
+            stats.execution.record((end - start) * 1e6)
+            stats.runs += 1
+            deadline += period
+            if end > deadline:
+                stats.overruns += 1
+                missed = int((end - deadline) // period)
+                stats.skipped += missed
+                deadline += missed * period
+    finally:
+        task.running = False
+        if task.on_exit:
+            task.on_exit()
+
+
+class Scheduler:
+    """Runs each periodic task on its own thread at its own rate."""
+
+    def __init__(self):
+        self.tasks = []
+        self.threads = []
+
+    def add(self, name, period, func, priority=None, cpus=None, on_failure=None, on_exit=None):
+        task = PeriodicTask(name, period, func, priority, cpus, on_failure, on_exit)
+        self.tasks.append(task)
+        return task
+
+    def start(self):
+        for task in self.tasks:
+            thread = threading.Thread(target=run_periodic, args=(task,), name=task.name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=1.0):
+        for task in self.tasks:
+            task.running = False
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def print_report(self):
+        for task in self.tasks:
+            print(f"[{task.name} @ {1.0 / task.period:g} Hz] {task.stats.summary()}")
@@ -0,0 +1,136 @@
+import ctypes
+import time
+from simucube import libsimucube
+
+# Setpoint write policy
+KEEPALIVE_INTERVAL = 0.25   # Re-send the current setpoint at least this often (s)
+MIN_WRITE_INTERVAL = 0.02   # Changes inside this window merge into one write (s)
+
+
+class WriteStats:
+    def __init__(self):
+        self.writes = 0       # Setpoint changes sent to the drive
+        self.ramps = 0        # Of those, changes streamed as a buffered ramp
+        self.keepalives = 0   # Unchanged setpoint re-sent to feed the watchdog
+        self.reads = 0        # State reads that carried no setpoint
+        self.suppressed = 0   # Requests equal to what the drive already has
+        self.coalesced = 0    # Pending values replaced before they were sent
+        self.failures = 0
+
+    def summary(self):
+        sent = self.writes + self.keepalives
+        return (f"setpoint writes={self.writes} ramps={self.ramps} keepalives={self.keepalives} reads={self.reads} "
+                f"suppressed={self.suppressed} coalesced={self.coalesced} failures={self.failures} "
+                f"bus transactions={sent + self.reads}")
+
+
+class SetpointManager:
+    """Sends the speed setpoint only when it changes, plus periodic keepalives.
+
+    request() just records the wanted value. flush() (standalone setSpeed) or
+    exchange() (batched with the state read) decide whether the bus sees a
+    write: a new value, or the same value once KEEPALIVE_INTERVAL has passed.
+    Bursts of requests inside MIN_WRITE_INTERVAL collapse into the latest one.
+    With a SpeedStreamer attached, changes play out as buffered S-curve ramps
+    and keepalives pause while a ramp is streaming.
+    Callers serialise access to the drive as before; the manager holds no lock.
+    """
+
+    def __init__(self, handle, lib=libsimucube, keepalive=KEEPALIVE_INTERVAL,
+                 min_interval=MIN_WRITE_INTERVAL, streamer=None):
+        self.handle = handle
+        self.lib = lib
+        self.streamer = streamer
+        self.keepalive = keepalive
+        self.min_interval = min_interval
+        self.target = 0      # Latest requested setpoint
+        self.sent = None     # Last setpoint the drive acknowledged, None if unknown
+        self.last_write = 0.0
+        self.stats = WriteStats()
+
+    @property
+    def pending(self):
+        return self.target != self.sent
+
+    def request(self, speed):
+        """Record the wanted setpoint; nothing goes out on the bus here."""
+        if speed == self.target:
+            if not self.pending:
+                self.stats.suppressed += 1
+            return
+        if self.pending and self.sent is not None:
+            self.stats.coalesced += 1
+        self.target = speed
+
+    def invalidate(self):
+        """Forget what the drive holds, e.g. after someone else wrote a setpoint."""
+        self.sent = None
+
+    def reset(self, speed=0, now=None):
+        """The drive was re-initialised holding speed; the next change ramps from it."""
+        self.sent = speed
+        self.last_write = time.monotonic() if now is None else now
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        since = now - self.last_write
+        if self.pending:
+            return since >= self.min_interval or self.sent is None
+        if self.streamer is not None and self.streamer.active:
+            return False  # The stream is feeding the drive
+        return since >= self.keepalive
+
+    def _ramp(self, speed, now):
+        """Stream a ramp to speed when a streamer is attached and the start is known.
+
+        A stop (speed 0) is written directly, and nothing is streamed while a
+        native e-stop is latched (the library would refuse the stream); the
+        plain write the caller falls back to is clamped to 0 by the latch.
+        """
+        if self.streamer is None or self.sent is None or speed == self.sent or speed == 0:
+            return None
+        if self.lib.estopIsLatched(self.handle.value):
+            return None
+        start = self.streamer.commanded(now) if self.streamer.active else self.sent
+        result = self.streamer.ramp(start, speed, now)
+        if result == 0:
+            self.stats.ramps += 1
+        return result
+
+    def _sent(self, speed, now, result):
+        if result != 0:
+            self.stats.failures += 1
+            self.sent = None
+            return result
+        if speed == self.sent:
+            self.stats.keepalives += 1
+        else:
+            self.stats.writes += 1
+        self.sent = speed
+        self.last_write = now
+        return result
+
+    def flush(self, now=None, force=False):
+        """Write the setpoint with setSpeed if it is due. Returns None if skipped."""
+        now = time.monotonic() if now is None else now
+        if not force and not self.due(now):
+            return None
+        speed = self.target
+        result = self._ramp(speed, now)
+        if result is None:
+            result = self.lib.setSpeed(self.handle.value, speed)
+        return self._sent(speed, now, result)
+
+    def exchange(self, state, now=None):
+        """Read the drive state, carrying the setpoint only when it is due."""
+        now = time.monotonic() if now is None else now
+        if not self.due(now):
+            self.stats.reads += 1
+            return self.lib.readState(self.handle.value, ctypes.byref(state))
+        speed = self.target
+        result = self._ramp(speed, now)
+        if result is None:
+            result = self.lib.exchangeState(self.handle.value, speed, ctypes.byref(state))
+        elif result == 0:
+            result = self.lib.readState(self.handle.value, ctypes.byref(state))
+        return self._sent(speed, now, result)
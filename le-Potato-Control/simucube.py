@@ -0,0 +1,280 @@
+import ctypes
+import time
+from collections import namedtuple
+from backend import SIMULATED, load_simucube
+from metrics import instrument_library
+from tracing import start_native_tracing
+
+# Shared library built from Ioni_Functions/simucube_lib.c
+LIB_PATH = "/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/Ioni_Functions/libsimucube.so"
+
+# IONI SimpleMotion USB port identification (adjust if needed)
+IONI_USB_VID = 0x0403     # FTDI bridge on the SM USB port
+IONI_USB_PID = 0x6015
+IONI_USB_SERIAL = b""     # Empty matches any serial
+ACTIVATION_TIMEOUT_MS = 3000
+PORT_CACHE = b"/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/.simucube_port"
+IONI_NODE = 1             # SimpleMotion node address of the drive
+
+# One drive: its IONI USB serial binds it to a port, node is its bus address.
+# config_cache None uses drive_config's default hash file.
+DriveAddress = namedtuple("DriveAddress", ["name", "serial", "node", "port_cache", "config_cache"])
+DEFAULT_DRIVE = DriveAddress("wall", IONI_USB_SERIAL, IONI_NODE, PORT_CACHE, None)
+
+# Drive communication watchdog: the drive stops by itself if the host goes
+# quiet for longer than the timeout. The parameter address depends on the
+# drive firmware (see its parameter list in Granity); None leaves it unset,
+# which connect_drive warns about, or refuses when REQUIRE_WATCHDOG is set.
+WATCHDOG_PARAM = None
+WATCHDOG_TIMEOUT_MS = 1000
+REQUIRE_WATCHDOG = False  # Fail startup instead of running without a drive-side watchdog
+
+
+class DriveState(ctypes.Structure):
+    """Mirror of the DriveState struct filled by exchangeState/readState."""
+    _fields_ = [
+        ("torque", ctypes.c_int),
+        ("velocity", ctypes.c_int),
+        ("faults", ctypes.c_int),
+        ("status", ctypes.c_int),
+        ("position", ctypes.c_int),
+    ]
+
+
+class EStopStats(ctypes.Structure):
+    """Mirror of the EstopStats struct filled by estopGetStats."""
+    _fields_ = [
+        ("triggers", ctypes.c_uint64),
+        ("events", ctypes.c_uint64),
+        ("edge_ns", ctypes.c_int64),
+        ("latency_ns", ctypes.c_int64),
+        ("max_latency_ns", ctypes.c_int64),
+        ("clear_ns", ctypes.c_int64),
+        ("latched", ctypes.c_int32),
+        ("level", ctypes.c_int32),
+        ("result", ctypes.c_int32),
+        ("priority", ctypes.c_int32),
+    ]
+
+
+def load_library(path=LIB_PATH):
+    """Load libsimucube and declare the exported function signatures."""
+    lib = load_simucube(path)
+    if SIMULATED:
+        return lib  # Virtual wall takes the same arguments, no ctypes setup
+
+    lib.openSimucube.restype = ctypes.c_int
+    lib.openSimucube.argtypes = [ctypes.POINTER(ctypes.c_int)]
+
+    lib.openSimucubeFast.restype = ctypes.c_int
+    lib.openSimucubeFast.argtypes = [ctypes.POINTER(ctypes.c_int), ctypes.c_int, ctypes.c_int,
+                                     ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+
+    lib.activateIoni.restype = ctypes.c_int
+    lib.activateIoni.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+
+    lib.findSimucubePort.restype = ctypes.c_int
+    lib.findSimucubePort.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p,
+                                     ctypes.c_char_p, ctypes.c_int]
+
+    lib.closeSimucube.restype = None
+    lib.closeSimucube.argtypes = [ctypes.c_int]
+
+    lib.clearFaultsAndInitialize.restype = ctypes.c_int
+    lib.clearFaultsAndInitialize.argtypes = [ctypes.c_int]
+
+    lib.setSpeed.restype = ctypes.c_int
+    lib.setSpeed.argtypes = [ctypes.c_int, ctypes.c_int]
+
+    lib.getTorque.restype = ctypes.c_int
+    lib.getTorque.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+
+    lib.getFaults.restype = ctypes.c_int
+    lib.getFaults.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+
+    lib.setParameter.restype = ctypes.c_int
+    lib.setParameter.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int]
+
+    lib.getParameter.restype = ctypes.c_int
+    lib.getParameter.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+
+    # Bulk parameter access, batched into queued transactions (see drive_config.py)
+    lib.readParameters.restype = ctypes.c_int
+    lib.readParameters.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                   ctypes.c_int]
+
+    lib.writeParameters.restype = ctypes.c_int
+    lib.writeParameters.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                    ctypes.POINTER(ctypes.c_int), ctypes.c_int]
+
+    lib.saveConfiguration.restype = ctypes.c_int
+    lib.saveConfiguration.argtypes = [ctypes.c_int]
+
+    # Batched setpoint write + state read in one bus transaction
+    lib.exchangeState.restype = ctypes.c_int
+    lib.exchangeState.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(DriveState)]
+
+    lib.readState.restype = ctypes.c_int
+    lib.readState.argtypes = [ctypes.c_int, ctypes.POINTER(DriveState)]
+
+    # Background sampler ring buffer (see drive_sampler.py)
+    lib.startSampler.restype = ctypes.c_int
+    lib.startSampler.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int]
+
+    lib.stopSampler.restype = None
+    lib.stopSampler.argtypes = []
+
+    lib.samplerBuffer.restype = ctypes.c_void_p
+    lib.samplerBuffer.argtypes = []
+
+    lib.samplerCapacitySlots.restype = ctypes.c_int
+    lib.samplerCapacitySlots.argtypes = []
+
+    lib.samplerHead.restype = ctypes.c_uint64
+    lib.samplerHead.argtypes = []
+
+    lib.samplerErrorCount.restype = ctypes.c_uint64
+    lib.samplerErrorCount.argtypes = []
+
+    # Buffered setpoint streaming, one stream per bus (see speed_ramp.py)
+    lib.streamStart.restype = ctypes.c_int
+    lib.streamStart.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.c_int, ctypes.c_int]
+
+    lib.streamAbort.restype = None
+    lib.streamAbort.argtypes = [ctypes.c_int]
+
+    lib.streamActive.restype = ctypes.c_int
+    lib.streamActive.argtypes = [ctypes.c_int]
+
+    lib.streamSentPoints.restype = ctypes.c_int
+    lib.streamSentPoints.argtypes = [ctypes.c_int]
+
+    lib.streamFillCount.restype = ctypes.c_uint64
+    lib.streamFillCount.argtypes = [ctypes.c_int]
+
+    # Span tracing ring (see tracing.py)
+    lib.traceStart.restype = ctypes.c_int
+    lib.traceStart.argtypes = [ctypes.c_int]
+
+    lib.traceStop.restype = None
+    lib.traceStop.argtypes = []
+
+    lib.traceBuffer.restype = ctypes.c_void_p
+    lib.traceBuffer.argtypes = []
+
+    lib.traceCapacitySlots.restype = ctypes.c_int
+    lib.traceCapacitySlots.argtypes = []
+
+    lib.traceHead.restype = ctypes.c_uint64
+    lib.traceHead.argtypes = []
+
+    lib.traceNameCount.restype = ctypes.c_int
+    lib.traceNameCount.argtypes = []
+
+    lib.traceName.restype = ctypes.c_char_p
+    lib.traceName.argtypes = [ctypes.c_int]
+
+    # Native IR sensor e-stop thread (see estop.py)
+    lib.estopStart.restype = ctypes.c_int
+    lib.estopStart.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+
+    lib.estopStop.restype = None
+    lib.estopStop.argtypes = [ctypes.c_int]
+
+    lib.estopRebind.restype = ctypes.c_int
+    lib.estopRebind.argtypes = [ctypes.c_int, ctypes.c_int]
+
+    lib.estopIsLatched.restype = ctypes.c_int
+    lib.estopIsLatched.argtypes = [ctypes.c_int]
+
+    lib.estopAcknowledge.restype = ctypes.c_int
+    lib.estopAcknowledge.argtypes = [ctypes.c_int]
+
+    lib.estopGetStats.restype = ctypes.c_int
+    lib.estopGetStats.argtypes = [ctypes.c_int, ctypes.POINTER(EStopStats)]
+
+    lib.estopWait.restype = ctypes.c_uint64
+    lib.estopWait.argtypes = [ctypes.c_int, ctypes.c_uint64, ctypes.c_int]
+
+    return lib
+
+
+# Load the shared library; every call is timed for the metrics endpoint
+# (and traced, natively and around the ctypes call, when tracing is on)
+libsimucube = instrument_library(start_native_tracing(load_library()))
+
+
+def activate_ioni(lib=libsimucube, serial=IONI_USB_SERIAL):
+    """Put the Simucube into IONI configuration mode (in-process HID command)."""
+    return lib.activateIoni(IONI_USB_VID, IONI_USB_PID, serial, ACTIVATION_TIMEOUT_MS)
+
+
+def open_drive(handle, drive=DEFAULT_DRIVE, lib=libsimucube):
+    """Open the bus to one drive, bound to its USB serial when it has one."""
+    return lib.openSimucubeFast(ctypes.byref(handle), IONI_USB_VID, IONI_USB_PID, drive.serial,
+                                drive.port_cache, drive.node) == 0
+
+
+def enable_watchdog(handle, timeout_ms=WATCHDOG_TIMEOUT_MS, lib=libsimucube):
+    """Arm the drive's communication timeout. Returns None when not configured."""
+    if WATCHDOG_PARAM is None:
+        return None
+    if lib.setParameter(handle.value, WATCHDOG_PARAM, timeout_ms) != 0:
+        print("Failed to arm the drive watchdog.")
+        return False
+    return True
+
+
+def connect_drive(handle, lib=libsimucube, activate=True, drive=DEFAULT_DRIVE):
+    """Activate the IONI, open its port, apply the drive config and clear faults,
+    timing each phase. Pass activate=False when activation already ran.
+
+    Returns (ok, timings) where timings maps phase name to milliseconds.
+    """
+    timings = {}
+    if activate:
+        start = time.perf_counter()
+        if activate_ioni(lib, drive.serial) != 0:
+            print("IONI activation failed; trying to open the drive anyway.")
+        timings["activate"] = (time.perf_counter() - start) * 1000.0
+
+    phase = time.perf_counter()
+    opened = open_drive(handle, drive, lib)
+    timings["open"] = (time.perf_counter() - phase) * 1000.0
+    if not opened:
+        print(f"Failed to open Simucube ({drive.name}).")
+        return False, timings
+
+    # Apply the .drc before initializing so the motor starts on the new settings
+    from drive_config import configure_drive, CONFIG_CACHE
+    phase = time.perf_counter()
+    if configure_drive(handle, lib, cache_path=drive.config_cache or CONFIG_CACHE) is not None:
+        timings["config"] = (time.perf_counter() - phase) * 1000.0
+
+    phase = time.perf_counter()
+    initialized = lib.clearFaultsAndInitialize(handle.value) == 0
+    timings["initialize"] = (time.perf_counter() - phase) * 1000.0
+    if not initialized:
+        print("Failed to clear faults and initialize motor.")
+        return False, timings
+
+    if WATCHDOG_PARAM is None:
+        print("WARNING: WATCHDOG_PARAM is not set; the drive will NOT stop by itself if this host "
+              "hangs. Set it to the firmware's communication timeout parameter in simucube.py.")
+        if REQUIRE_WATCHDOG:
+            print("Refusing to start without the drive watchdog (REQUIRE_WATCHDOG).")
+            return False, timings
+    else:
+        phase = time.perf_counter()
+        armed = enable_watchdog(handle, lib=lib)
+        timings["watchdog"] = (time.perf_counter() - phase) * 1000.0
+        if not armed and REQUIRE_WATCHDOG:
+            return False, timings
+    return True, timings
+
+
+def print_timings(timings):
+    """Print a per-phase startup timing breakdown."""
+    for phase, ms in timings.items():
+        print(f"  {phase:<12} {ms:8.1f} ms")
+    print(f"  {'total':<12} {sum(timings.values()):8.1f} ms")
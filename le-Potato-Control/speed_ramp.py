@@ -0,0 +1,101 @@
+import ctypes
+import math
+import time
+import numpy as np
+from simucube import libsimucube
+
+# Buffered streaming
+STREAM_RATE = 500            # Drive playback rate (Hz)
+STREAM_RATES = (400, 500, 1000, 2000, 2500)  # Rates the drive's motion buffer accepts
+
+# S-curve limits
+MAX_ACCEL_RPM_S = 4000.0     # Peak acceleration of a ramp
+MAX_JERK_RPM_S2 = 20000.0    # Rate of change of acceleration
+
+
+def s_curve(start, end, rate=STREAM_RATE, max_accel=MAX_ACCEL_RPM_S, max_jerk=MAX_JERK_RPM_S2):
+    """Jerk-limited speed trajectory from start to end, one point per drive sample.
+
+    Acceleration ramps up at max_jerk, holds at max_accel, then ramps down
+    again; short changes that never reach max_accel become a pure jerk
+    up/jerk down triangle. The last point is always exactly `end`.
+    """
+    span = abs(end - start)
+    if span == 0:
+        return np.array([end], dtype=np.int32)
+    t_jerk = max_accel / max_jerk
+    if span < max_accel * t_jerk:
+        t_jerk = math.sqrt(span / max_jerk)
+        t_hold = 0.0
+    else:
+        t_hold = span / max_accel - t_jerk
+    accel = max_jerk * t_jerk
+    total = 2 * t_jerk + t_hold
+
+    t = np.arange(1, math.ceil(total * rate) + 1, dtype=np.float64) / rate
+    t = np.minimum(t, total)
+    rise = 0.5 * max_jerk * t * t
+    hold = 0.5 * accel * t_jerk + accel * (t - t_jerk)
+    fall = span - 0.5 * max_jerk * (total - t) ** 2
+    delta = np.where(t < t_jerk, rise, np.where(t < t_jerk + t_hold, hold, fall))
+
+    points = np.rint(start + math.copysign(1, end - start) * delta).astype(np.int32)
+    points[-1] = end
+    return points
+
+
+class SpeedStreamer:
+    """Plays precomputed speed ramps through libsimucube's buffered stream.
+
+    The whole trajectory is handed over in one call; libsimucube's stream
+    thread keeps the drive buffer filled and the drive plays it back at its
+    own sample rate. Any direct setpoint write cancels the ramp in progress.
+    """
+
+    def __init__(self, handle, lib=libsimucube, rate=STREAM_RATE,
+                 max_accel=MAX_ACCEL_RPM_S, max_jerk=MAX_JERK_RPM_S2):
+        if rate not in STREAM_RATES:
+            raise ValueError(f"Stream rate {rate} Hz not supported (use one of {STREAM_RATES})")
+        self.handle = handle
+        self.lib = lib
+        self.rate = rate
+        self.max_accel = max_accel
+        self.max_jerk = max_jerk
+        self.points = None
+        self.started = 0.0
+        self.ramps = 0
+
+    @property
+    def active(self):
+        return bool(self.lib.streamActive(self.handle.value))
+
+    def commanded(self, now=None):
+        """Setpoint the drive is playing now, estimated from the ramp start time."""
+        if self.points is None:
+            return None
+        now = time.monotonic() if now is None else now
+        index = int((now - self.started) * self.rate)
+        return int(self.points[min(max(index, 0), len(self.points) - 1)])
+
+    def ramp(self, start, end, now=None):
+        """Stream an S-curve from start to end. Returns the libsimucube status."""
+        points = s_curve(start, end, self.rate, self.max_accel, self.max_jerk)
+        result = self.lib.streamStart(self.handle.value, points.ctypes.data_as(ctypes.POINTER(ctypes.c_int)),
+                                      len(points), self.rate)
+        if result == 0:
+            self.points = points
+            self.started = time.monotonic() if now is None else now
+            self.ramps += 1
+        return result
+
+    def abort(self):
+        self.lib.streamAbort(self.handle.value)
+
+    def wait(self, timeout=None):
+        """Block until the ramp has played out (or timeout seconds pass)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.active:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(1.0 / self.rate)
+        return True
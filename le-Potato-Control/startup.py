@@ -0,0 +1,232 @@
+import importlib
+import json
+import os
+import subprocess
+import threading
+import time
+from backend import SIMULATED
+
+# I2C overlays the LCD needs (Le Potato device tree overlays via ldto)
+OVERLAYS = ("i2c-ao", "i2c-b")
+OVERLAY_CACHE = "/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/.overlay_cache"
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+
+# Startup report
+BAR_WIDTH = 30  # Characters for the longest phase in the timeline
+
+
+def boot_id():
+    try:
+        with open(BOOT_ID_PATH, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def ensure_overlays(names=OVERLAYS, cache_path=OVERLAY_CACHE):
+    """Enable the I2C overlays, without running ldto if this boot already has them.
+
+    ldto overlays last until reboot, so the cache records the boot id they
+    were confirmed under. Returns "cached", "checked", "enabled" or "failed".
+    """
+    if SIMULATED:
+        return "cached"
+    current = boot_id()
+    try:
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+        if current and cached.get("boot_id") == current and set(names) <= set(cached.get("overlays", [])):
+            return "cached"
+    except (OSError, ValueError):
+        pass
+
+    try:
+        status = subprocess.run(["ldto", "status"], capture_output=True, text=True).stdout
+        missing = [name for name in names if name not in status]
+        for name in missing:
+            subprocess.run(["sudo", "ldto", "enable", name], check=True)
+            print(f"Successfully enabled {name} overlay.")
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error enabling I2C overlays: {e}")
+        return "failed"  # The buses may already be up; let the LCD try
+    try:
+        with open(cache_path, "w") as f:
+            json.dump({"boot_id": current, "overlays": list(names)}, f)
+    except OSError as e:
+        print(f"Could not cache overlay state: {e}")
+    return "enabled" if missing else "checked"
+
+
+def since_power_on():
+    """Seconds since the kernel booted (suspend included)."""
+    return time.clock_gettime(time.CLOCK_BOOTTIME)
+
+
+def since_process_start():
+    """Seconds since this process was started, from /proc/self/stat."""
+    with open("/proc/self/stat", "r") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    start_ticks = int(fields[19])  # Field 22, counted after "pid (comm)"
+    return since_power_on() - start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+def print_ready():
+    print(f"Ready to climb {since_power_on():.1f} s after power-on "
+          f"({since_process_start():.2f} s after launch).")
+
+
+class Phase:
+    def __init__(self, name, func, after, required):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.required = required
+        self.start = None
+        self.end = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    @property
+    def failed(self):
+        return self.error is not None or self.result is False
+
+
+class Startup:
+    """Runs startup phases concurrently, each as soon as its prerequisites finish.
+
+    Every phase gets its own thread; most of the work is bus, I2C, USB or
+    subprocess waits that release the GIL, so independent phases overlap.
+    A phase fails by raising or returning False; phases after it are
+    skipped. Phases can be added while others are already running.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.started = None
+        self.lock = threading.Lock()
+
+    def add(self, name, func, after=(), required=True):
+        phase = Phase(name, func, after, required)
+        with self.lock:
+            self.phases[name] = phase
+            running = self.started is not None
+        if running:
+            self._launch(phase)
+        return phase
+
+    def _launch(self, phase):
+        threading.Thread(target=self._run_phase, args=(phase,), name=f"startup-{phase.name}",
+                         daemon=True).start()
+
+    def _run_phase(self, phase):
+        try:
+            for name in phase.after:
+                before = self.phases[name]
+                before.done.wait()
+                if before.failed:
+                    phase.error = f"skipped, {name} failed"
+                    return
+            phase.start = time.monotonic()
+            phase.result = phase.func()
+        except Exception as e:
+            phase.error = e
+        finally:
+            phase.end = time.monotonic()
+            phase.done.set()
+
+    def start(self):
+        with self.lock:
+            self.started = time.monotonic()
+            phases = list(self.phases.values())
+        for phase in phases:
+            self._launch(phase)
+
+    def wait_for(self, name):
+        """Block until one phase finishes; returns its result (None if it failed)."""
+        phase = self.phases[name]
+        phase.done.wait()
+        return None if phase.failed else phase.result
+
+    def wait(self, optional=False):
+        """Block until every required phase (including ones added meanwhile) is
+        done; optional ones too with optional=True, otherwise they carry on in
+        the background. Returns True when all required phases succeeded."""
+        while True:
+            with self.lock:
+                pending = [phase for phase in self.phases.values()
+                           if not phase.done.is_set() and (phase.required or optional)]
+            if not pending:
+                break
+            for phase in pending:
+                phase.done.wait()
+        return self.ok
+
+    def run(self):
+        self.start()
+        return self.wait()
+
+    @property
+    def ok(self):
+        return not any(phase.required and phase.failed for phase in self.phases.values())
+
+    def result(self, name):
+        return self.phases[name].result
+
+    def report(self):
+        """Per-phase start offset, duration and a timeline bar."""
+        phases = sorted(self.phases.values(), key=lambda p: (p.start or p.end or 0))
+        end = max((p.end for p in phases if p.end), default=self.started)
+        span = max(end - self.started, 1e-6)
+        print("Startup timing (ms from start):")
+        for phase in phases:
+            if phase.start is None:
+                print(f"  {phase.name:<12} {'':>8} {'':>8}  {phase.error or 'waiting'}")
+                continue
+            if phase.end is None:
+                print(f"  {phase.name:<12} {(phase.start - self.started) * 1000.0:8.1f} {'':>8}  still running")
+                continue
+            offset = (phase.start - self.started) * 1000.0
+            duration = (phase.end - phase.start) * 1000.0
+            left = int(BAR_WIDTH * offset / 1000.0 / span)
+            width = max(int(BAR_WIDTH * duration / 1000.0 / span), 1)
+            status = f"  FAILED: {phase.error or 'returned False'}" if phase.failed else ""
+            print(f"  {phase.name:<12} {offset:8.1f} {duration:8.1f}  |{' ' * left}{'#' * width}"
+                  f"{' ' * max(BAR_WIDTH - left - width, 0)}|{status}")
+        busy = sum(p.end - p.start for p in phases if p.start is not None and p.end)
+        print(f"  {'elapsed':<12} {span * 1000.0:17.1f}  (phases sum to {busy * 1000.0:.1f} ms)")
+
+
+def _activate():
+    from simucube import activate_ioni
+    if activate_ioni() != 0:
+        print("IONI activation failed; trying to open the drive anyway.")
+
+
+# Boot Sequence
+def boot():
+    """Fastest path to a running wall.
+
+    Only the light modules load before the IONI activation starts; the
+    controller and its heavy imports (NumPy, asyncio) load on another
+    thread while the Simucube re-enumerates its USB port.
+    """
+    startup = Startup()
+    startup.add("activate", _activate)
+    startup.add("overlays", ensure_overlays)
+    startup.add("imports", lambda: importlib.import_module("controller"))
+    startup.start()
+
+    module = startup.wait_for("imports")
+    if module is None:
+        startup.wait()
+        startup.report()
+        return
+    controller = module.Controller()
+    controller.add_phases(startup, activated="activate")
+    module.run_wall(controller, startup)
+
+
+# Main Function
+if __name__ == "__main__":
+    boot()
@@ -1,13 +1,33 @@
+import math
+import threading
 import time
-import gpiod
+import numpy as np
+from backend import load_gpiod
+from scheduler import Histogram, apply_realtime
+
+gpiod = load_gpiod()
 
 # GPIO Configuration for Stepper Motor
 PULSE_PIN = 23  # GPIO23 (Physical pin 16)
 DIR_PIN = 18    # GPIO18 (Physical pin 12)
 GPIO_CHIP = "/dev/gpiochip1"  # GPIO chip device (updated)
 
-# Stepper Motor Pulse Delay
-PULSE_DELAY = 0.001  # Delay between pulses (adjust for speed)
+# Incline Axis
+STEPS_PER_DEGREE = 40     # Stepper steps per degree of incline
+
+# Motion Profile (steps/s, steps/s^2)
+MAX_STEP_RATE = 4000      # Cruise rate
+START_STEP_RATE = 200     # Rate the motor can start and stop at without ramping
+STEP_ACCEL = 8000         # Acceleration and deceleration
+
+# Pulse Timing (seconds)
+PULSE_WIDTH = 5e-6        # Minimum STEP high time for the driver
+DIR_SETUP = 5e-6          # DIR must settle before the first STEP edge
+SPIN_WINDOW = 0.0002      # Sleep until this close to an edge, then spin
+
+# Real-time scheduling for the pulse thread (None leaves normal scheduling)
+MOTION_PRIORITY = None    # SCHED_FIFO priority, e.g. 60
+MOTION_CPUS = None        # CPU set to pin the pulse thread to, e.g. {2}
 
 # GPIO Initialization
 def setup_gpio():
@@ -28,31 +48,256 @@ def setup_gpio():
         print(f"Error during GPIO setup: {e}")
         raise
 
-# GPIO Functions for Stepper Motor
-def step_motor(pulse_line, dir_line, direction, steps=1):
-    """Step the motor in the given direction for a number of steps."""
-    dir_line.set_value(direction)  # Set direction
-    for _ in range(steps):
-        pulse_line.set_value(1)  # Pulse HIGH
-        time.sleep(PULSE_DELAY)
-        pulse_line.set_value(0)  # Pulse LOW
-        time.sleep(PULSE_DELAY)
+# Step Profiles
+def trapezoid_intervals(steps, max_rate=MAX_STEP_RATE, accel=STEP_ACCEL,
+                        min_rate=START_STEP_RATE, start_rate=None):
+    """Time before each step of a trapezoidal move, in seconds.
+
+    Step k runs at min(sqrt(v0^2 + 2ak), max_rate, sqrt(vmin^2 + 2a(n-1-k))),
+    so the move accelerates from start_rate, cruises, and decelerates to
+    min_rate on the last step. Short moves become a triangle.
+    """
+    if steps <= 0:
+        return np.empty(0)
+    v0 = max(start_rate or min_rate, min_rate)
+    k = np.arange(steps, dtype=np.float64)
+    up = np.sqrt(v0 * v0 + 2.0 * accel * k)
+    down = np.sqrt(min_rate * min_rate + 2.0 * accel * (steps - 1 - k))
+    return 1.0 / np.minimum(np.minimum(up, down), max_rate)
+
+
+def stopping_steps(rate, accel=STEP_ACCEL, min_rate=START_STEP_RATE):
+    """Steps needed to decelerate from rate to min_rate."""
+    if rate <= min_rate:
+        return 0
+    return math.ceil((rate * rate - min_rate * min_rate) / (2.0 * accel))
+
+
+def decel_intervals(rate, accel=STEP_ACCEL, min_rate=START_STEP_RATE):
+    """Intervals that bring a move running at rate down to min_rate."""
+    steps = stopping_steps(rate, accel, min_rate)
+    k = np.arange(1, steps + 1, dtype=np.float64)
+    return 1.0 / np.sqrt(np.maximum(rate * rate - 2.0 * accel * k, min_rate * min_rate))
+
+
+def sleep_until(deadline):
+    """Sleep to just short of deadline, then spin; returns lateness in seconds."""
+    remaining = deadline - time.monotonic()
+    if remaining > SPIN_WINDOW:
+        time.sleep(remaining - SPIN_WINDOW)
+    now = time.monotonic()
+    while now < deadline:
+        now = time.monotonic()
+    return now - deadline
+
+
+class MotionStats:
+    def __init__(self):
+        self.moves = 0
+        self.steps = 0
+        self.late = Histogram()   # Step edge lateness vs. its deadline (us)
+        self.last_rate = 0.0      # Achieved steps/s over the last move
+        self.peak_rate = 0.0      # Highest planned step rate over the last move
+
+    def summary(self):
+        return (f"moves={self.moves} steps={self.steps} rate={self.last_rate:.0f}/s "
+                f"(planned peak {self.peak_rate:.0f}/s) edge error p50<={self.late.percentile(50):.0f}us "
+                f"p99<={self.late.percentile(99):.0f}us max={self.late.max_us:.0f}us")
+
+
+class StepperAxis:
+    """Incline motion engine: trapezoidal step trains on a real-time thread.
+
+    move_to()/move_by() only set the target and return. The pulse thread
+    plans a trapezoidal profile, precomputes every step interval and emits
+    edges on absolute monotonic deadlines, so the move is not stretched by
+    GPIO call time. A new target mid-move is blended in: further along the
+    same direction the profile is replanned from the current rate, otherwise
+    the axis decelerates to a stop first. stop() decelerates, abort() halts
+    on the next edge.
+    """
+
+    def __init__(self, pulse_line, dir_line, max_rate=MAX_STEP_RATE, accel=STEP_ACCEL,
+                 min_rate=START_STEP_RATE, priority=MOTION_PRIORITY, cpus=MOTION_CPUS):
+        self.pulse_line = pulse_line
+        self.dir_line = dir_line
+        self.max_rate = max_rate
+        self.accel = accel
+        self.min_rate = min_rate
+        self.priority = priority
+        self.cpus = cpus
+        self.position = 0     # Steps, updated as each pulse goes out
+        self.target = 0
+        self.rate = 0.0       # Current step rate
+        self.stats = MotionStats()
+        self.changed = threading.Condition()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.generation = 0   # Bumped on every new command
+        self.halting = False
+        self.aborting = False
+        self.running = False
+        self.thread = None
+        self.limit = None     # Optional limit(direction) checked after every step; True halts
+        self.limit_hit = False
+        self.on_move = None   # Called on the pulse thread as a move starts
+        self.on_idle = None   # Called on the pulse thread when the axis comes to rest
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="stepper", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        with self.changed:
+            self.running = False
+            self.aborting = True
+            self.changed.notify()
+        if self.thread:
+            self.thread.join(timeout=2)
+        self.pulse_line.set_value(0)
+
+    @property
+    def moving(self):
+        return not self.idle.is_set()
+
+    def move_to(self, target):
+        with self.changed:
+            self.target = int(target)
+            self.halting = False
+            self.aborting = False
+            self.generation += 1
+            if self.target != self.position:
+                self.idle.clear()
+            self.changed.notify()
+
+    def move_by(self, steps):
+        self.move_to(self.target + steps)
+
+    def stop(self):
+        """Decelerate to a stop; the target becomes wherever the axis stops."""
+        with self.changed:
+            self.halting = True
+            self.generation += 1
+
+    def abort(self):
+        """Stop on the next edge without decelerating (may lose steps at speed)."""
+        with self.changed:
+            self.aborting = True
+            self.generation += 1
+
+    def wait(self, timeout=None):
+        return self.idle.wait(timeout)
+
+    def set_position(self, steps):
+        """Redefine the current position (e.g. after homing); axis must be idle."""
+        with self.changed:
+            self.position = self.target = int(steps)
+
+    def _pulse(self):
+        self.pulse_line.set_value(1)
+        sleep_until(time.monotonic() + PULSE_WIDTH)
+        self.pulse_line.set_value(0)
+
+    def _plan(self, direction):
+        """Intervals for the rest of the move given the current target and rate."""
+        remaining = (self.target - self.position) * direction
+        if self.halting or remaining < max(stopping_steps(self.rate, self.accel, self.min_rate), 1):
+            return decel_intervals(self.rate, self.accel, self.min_rate)
+        return trapezoid_intervals(remaining, self.max_rate, self.accel, self.min_rate,
+                                   start_rate=self.rate)
+
+    def _move(self):
+        with self.changed:
+            direction = 1 if self.target > self.position else -1
+            generation = self.generation
+            self.rate = 0.0
+            plan = self._plan(direction)
+        self.dir_line.set_value(1 if direction > 0 else 0)
+        sleep_until(time.monotonic() + DIR_SETUP)
+
+        stats = self.stats
+        stats.moves += 1
+        stats.peak_rate = 0.0
+        steps = 0
+        start = deadline = time.monotonic()
+        i = 0
+        while i < len(plan):
+            if self.aborting:
+                break
+            if self.generation != generation:
+                # New command: blend into a fresh plan from the current rate
+                with self.changed:
+                    generation = self.generation
+                    plan = self._plan(direction)
+                i = 0
+                continue
+
+            interval = plan[i]
+            deadline += interval
+            late = sleep_until(deadline)
+            self._pulse()
+            self.position += direction
+            self.rate = 1.0 / interval
+            stats.late.record(late * 1e6)
+            stats.peak_rate = max(stats.peak_rate, self.rate)
+            steps += 1
+            i += 1
+            if self.limit is not None and self.limit(direction):
+                self.limit_hit = True
+                self.aborting = True
+
+        elapsed = time.monotonic() - start
+        stats.steps += steps
+        stats.last_rate = steps / elapsed if elapsed > 0 else 0.0
+        self.rate = 0.0
+        with self.changed:
+            # Stopped on request: stay put instead of resuming toward the target
+            if self.aborting or self.halting:
+                self.target = self.position
+            self.halting = False
+            self.aborting = False
+
+    def _run(self):
+        apply_realtime(self.priority, self.cpus)
+        while self.running:
+            with self.changed:
+                while self.running and self.target == self.position:
+                    self.idle.set()
+                    self.changed.wait()
+                if not self.running:
+                    break
+                self.idle.clear()
+            if self.on_move:
+                self.on_move()
+            self._move()
+            if self.on_idle and self.target == self.position:
+                self.on_idle()
+        self.idle.set()
 
 # Main Function
 if __name__ == "__main__":
     try:
         # Setup GPIO
         chip, pulse_line, dir_line = setup_gpio()
+        axis = StepperAxis(pulse_line, dir_line)
+        axis.start()
 
         # Test motor movement
-        print("Testing stepper motor: moving forward 50 steps")
-        step_motor(pulse_line, dir_line, 1, 50)  # Move forward
+        print("Testing stepper motor: moving forward 2000 steps")
+        axis.move_by(2000)
+        axis.wait()
+        print(axis.stats.summary())
 
-        print("Testing stepper motor: moving backward 50 steps")
-        step_motor(pulse_line, dir_line, 0, 50)  # Move backward
+        print("Testing stepper motor: moving backward 2000 steps")
+        axis.move_by(-2000)
+        axis.wait()
+        print(axis.stats.summary())
 
     except KeyboardInterrupt:
         print("Exiting...")
     finally:
+        if 'axis' in locals():
+            axis.close()
         if 'chip' in locals():
             chip.close()
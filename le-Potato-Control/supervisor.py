@@ -0,0 +1,239 @@
+import ctypes
+import time
+from collections import deque
+from simucube import libsimucube, activate_ioni, enable_watchdog, open_drive, DEFAULT_DRIVE, WATCHDOG_PARAM
+from metrics import METRICS, Histogram
+
+# SMP_FAULTS bits (FLT_* in simplemotion_defs.h)
+FAULT_NAMES = {
+    1 << 1: "follow error",
+    1 << 2: "overcurrent",
+    1 << 3: "communication",
+    1 << 4: "encoder",
+    1 << 5: "overtemperature",
+    1 << 6: "undervoltage",
+    1 << 7: "overvoltage",
+    1 << 8: "program or memory",
+    1 << 9: "hardware",
+    1 << 10: "overvelocity",
+    1 << 11: "init",
+    1 << 12: "motion",
+    1 << 13: "range",
+    1 << 14: "power stage forced off",
+    1 << 15: "host communication",
+    1 << 16: "config",
+}
+# Faults a clear can fix: tracking and supply transients, and lost host traffic.
+# Anything else (encoder, heat, hardware, config) latches until someone looks.
+RECOVERABLE_FAULTS = (1 << 1) | (1 << 3) | (1 << 6) | (1 << 10) | (1 << 12) | (1 << 13) | (1 << 15)
+
+# Recovery policy
+BUS_ERROR_LIMIT = 3          # Consecutive failed transactions before the link counts as lost
+MAX_FAULT_CLEARS = 3         # Recoverable faults cleared per window before latching
+FAULT_CLEAR_WINDOW = 60.0    # Seconds
+FAULT_POLL_INTERVAL = 0.5    # getFaults period for callers whose traffic carries no fault bits
+RECONNECT_BACKOFF = 0.1      # First reopen delay (s), doubled per failed attempt
+RECONNECT_BACKOFF_MAX = 5.0
+REACTIVATE_EVERY = 3         # Failed reopens between IONI re-activations (a power-cycled
+                             # Simucube comes back with its SM USB port hidden)
+
+# Drive health, also exported as the zazu_drive_health gauge
+OK = "ok"
+RECOVERING = "recovering"
+LATCHED = "latched"
+HEALTH_CODES = {OK: 0, RECOVERING: 1, LATCHED: 2}
+
+# Time-to-recover buckets (microseconds, like every other histogram): 10 ms to 60 s
+RECOVERY_EDGES_US = (10000, 50000, 100000, 250000, 500000, 1000000, 2500000, 5000000,
+                     10000000, 30000000, 60000000)
+
+
+def describe_faults(faults):
+    names = [name for bit, name in FAULT_NAMES.items() if faults & bit]
+    unknown = faults & ~sum(FAULT_NAMES)
+    if unknown:
+        names.append(f"0x{unknown:x}")
+    return ", ".join(names) or "none"
+
+
+def is_recoverable(faults):
+    return faults != 0 and not faults & ~RECOVERABLE_FAULTS
+
+
+class DriveSupervisor:
+    """Watches every drive transaction and brings the drive back when it drops out.
+
+    The owner of the bus calls observe() with each transaction's result
+    (and the fault bits, when the transaction read them) while the drive is
+    healthy, and recover() instead of talking to the drive while it is not.
+    Recoverable faults are cleared straight away; a run of failed
+    transactions closes and reopens the bus with exponential backoff. Either
+    way the setpoint is zeroed before the motor is re-enabled and the
+    SetpointManager is told the drive holds 0, so the belt ramps back up to
+    the last commanded speed. Everything runs on the caller's thread; the
+    supervisor holds no lock of its own.
+    """
+
+    def __init__(self, handle, setpoints, lib=libsimucube, on_change=None, drive=DEFAULT_DRIVE, labels=None):
+        self.handle = handle
+        self.setpoints = setpoints
+        self.lib = lib
+        self.drive = drive           # Where to reopen the bus
+        self.title = "Drive" if drive.name == DEFAULT_DRIVE.name else f"{drive.name} drive"  # For log lines
+        self.on_change = on_change   # Called with the new health on every transition
+        self.health = OK
+        self.cause = None            # "fault" or "bus" while recovering
+        self.faults = 0              # Bits that started the current recovery
+        self.since = None            # When the current outage was first seen
+        self.bus_errors = 0          # Consecutive failed transactions
+        self.link_lost = False
+        self.estop_bus = None        # Handle a native e-stop was last bound to, until it follows a reopen
+        self.attempts = 0            # Failed recovery attempts this outage
+        self.next_attempt = 0.0
+        self.last_fault_poll = 0.0
+        self.clears = deque()        # Times of recent fault clears
+        self.last_recovery_ms = None
+        self.fault_bits = ctypes.c_int()
+
+        labels = labels or {}        # Extra metric labels, e.g. {"wall": name}
+        self.recovery_hist = {cause: METRICS.histogram(
+            "zazu_drive_recovery_seconds", "Time from a drive fault or lost link to running again.",
+            Histogram(RECOVERY_EDGES_US), cause=cause, **labels) for cause in ("fault", "bus")}
+        self.fault_count = {kind: METRICS.counter(
+            "zazu_drive_faults_total", "Drive faults seen, by whether they could be cleared.",
+            kind=kind, **labels) for kind in ("recoverable", "latched")}
+        self.bus_error_count = METRICS.counter("zazu_drive_bus_errors_total", "Failed drive transactions.",
+                                               **labels)
+        self.reconnect_count = METRICS.counter("zazu_drive_reconnects_total", "Times the drive bus was reopened.",
+                                               **labels)
+        METRICS.gauge("zazu_drive_health", "0 ok, 1 recovering, 2 latched fault.",
+                      lambda: HEALTH_CODES[self.health], **labels)
+
+    @property
+    def healthy(self):
+        return self.health == OK
+
+    def _set_health(self, health):
+        if health != self.health:
+            self.health = health
+            if self.on_change:
+                self.on_change(health)
+
+    # Healthy path
+    def observe(self, result, faults=None, now=None):
+        """Account for one transaction. result None means nothing went out;
+        without fault bits they are polled every FAULT_POLL_INTERVAL."""
+        if not self.healthy:
+            return
+        now = time.monotonic() if now is None else now
+        if result is not None and result != 0:
+            self.bus_error_count.inc()
+            self.bus_errors += 1
+            if self.since is None:
+                self.since = now
+            if self.bus_errors >= BUS_ERROR_LIMIT:
+                print(f"{self.title} link lost after {self.bus_errors} failed transactions; reconnecting.")
+                self.link_lost = True
+                self._start("bus", now)
+            return
+        if result == 0:
+            self.bus_errors = 0
+            self.since = None
+        if faults is not None:
+            self.last_fault_poll = now
+        elif now - self.last_fault_poll >= FAULT_POLL_INTERVAL:
+            self.last_fault_poll = now
+            if self.lib.getFaults(self.handle.value, ctypes.byref(self.fault_bits)) == 0:
+                faults = self.fault_bits.value
+        if faults:
+            self._fault(faults, now)
+
+    def _fault(self, faults, now):
+        self.faults = faults
+        while self.clears and now - self.clears[0] > FAULT_CLEAR_WINDOW:
+            self.clears.popleft()
+        if not is_recoverable(faults):
+            self.fault_count["latched"].inc()
+            print(f"{self.title} fault latched: {describe_faults(faults)}. Belt stopped; restart once fixed.")
+            self._set_health(LATCHED)
+        elif len(self.clears) >= MAX_FAULT_CLEARS:
+            self.fault_count["latched"].inc()
+            print(f"{self.title} fault latched: {describe_faults(faults)} recurred "
+                  f"{len(self.clears) + 1} times in {FAULT_CLEAR_WINDOW:.0f} s.")
+            self._set_health(LATCHED)
+        else:
+            self.fault_count["recoverable"].inc()
+            print(f"{self.title} fault: {describe_faults(faults)}; clearing.")
+            self.since = now
+            self._start("fault", now)
+
+    def _start(self, cause, now):
+        self.cause = cause
+        self.attempts = 0
+        self.next_attempt = now
+        self._set_health(RECOVERING)
+
+    # Recovery path
+    def recover(self, now=None):
+        """Run one recovery attempt if it is due. Returns True once the drive is back."""
+        if self.health != RECOVERING:
+            return self.healthy
+        now = time.monotonic() if now is None else now
+        if now < self.next_attempt:
+            return False
+        if self._attempt():
+            self._recovered(time.monotonic())
+            return True
+        self.attempts += 1
+        delay = min(RECONNECT_BACKOFF * 2 ** (self.attempts - 1), RECONNECT_BACKOFF_MAX)
+        self.next_attempt = time.monotonic() + delay
+        return False
+
+    def _attempt(self):
+        lib, handle = self.lib, self.handle
+        if self.link_lost:
+            if self.estop_bus is None:
+                self.estop_bus = handle.value
+            lib.closeSimucube(handle.value)
+            if self.attempts and self.attempts % REACTIVATE_EVERY == 0:
+                activate_ioni(lib, self.drive.serial)
+            if not open_drive(handle, self.drive, lib):
+                return False
+            # A native e-stop on this drive must follow it to the new bus before
+            # anything is sent there; if it cannot, stay down rather than run unguarded
+            if lib.estopRebind(self.estop_bus, handle.value) != 0:
+                print(f"{self.title}: e-stop could not follow the reopened bus; staying down.")
+                return False
+            self.estop_bus = None
+            self.reconnect_count.inc()
+            self.link_lost = False
+        # Zero the setpoint first so a re-enabled motor does not jump to the old speed
+        if lib.setSpeed(handle.value, 0) != 0:
+            self.link_lost = True  # Nothing gets through; reopen on the next attempt
+            return False
+        if lib.clearFaultsAndInitialize(handle.value) != 0:
+            return False
+        if WATCHDOG_PARAM is not None:
+            enable_watchdog(handle, lib=lib)
+        return True
+
+    def _recovered(self, now):
+        if self.cause == "fault":
+            self.clears.append(now)
+        elapsed = now - (self.since if self.since is not None else now)
+        self.recovery_hist[self.cause].record(elapsed * 1e6)
+        self.last_recovery_ms = elapsed * 1000.0
+        print(f"{self.title} recovered from {'fault' if self.cause == 'fault' else 'lost link'} "
+              f"in {self.last_recovery_ms:.0f} ms; resuming {self.setpoints.target} rpm.")
+        self.setpoints.reset(0)
+        self.bus_errors = 0
+        self.since = None
+        self.faults = 0
+        self.cause = None
+        self._set_health(OK)
+
+    def status_text(self):
+        """Short LCD status while the drive is not healthy."""
+        if self.health == LATCHED:
+            return "DRIVE FAULT"
+        return "RECONNECTING" if self.link_lost else "CLEARING FAULT"
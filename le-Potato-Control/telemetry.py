@@ -0,0 +1,156 @@
+import os
+import time
+import numpy as np
+
+# Recorder Configuration
+TELEMETRY_PATH = "/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/telemetry.zzt"
+TELEMETRY_CAPACITY = 1 << 20   # Records kept (~14 h at the 20 Hz drive rate, ~30 MB)
+
+# Column layout: one contiguous array per field, in this order
+COLUMNS = [
+    ("timestamp_ns", "<i8"),   # Wall clock (time.time_ns)
+    ("setpoint", "<i4"),       # Speed commanded to the drive (rpm)
+    ("velocity", "<i4"),       # Actual speed feedback
+    ("torque", "<i4"),         # Raw torque reading
+    ("faults", "<i4"),
+    ("incline", "<i2"),        # Incline target (degrees)
+    ("adc", "<i2"),            # Latest button ladder code, -1 if none
+    ("sensor", "<i1"),         # 1 while the IR sensor stop is active
+    ("button", "<i1"),         # Index into BUTTONS pressed since the last record, -1 if none
+]
+BUTTONS = ["button_1", "button_2", "button_3", "button_4", "button_5"]
+
+# File header: magic, version, capacity, head (records ever written), created
+MAGIC = int.from_bytes(b"ZAZUTELM", "little")
+VERSION = 1
+HEADER_SIZE = 64
+COLUMN_ALIGN = 64
+HEAD = 3                       # Index of the head counter in the header
+
+
+def _layout(capacity):
+    """Byte offset of each column and the total file size."""
+    offsets = {}
+    offset = HEADER_SIZE
+    for name, dtype in COLUMNS:
+        offsets[name] = offset
+        size = capacity * np.dtype(dtype).itemsize
+        offset += -(-size // COLUMN_ALIGN) * COLUMN_ALIGN
+    return offsets, offset
+
+
+def _map(path, mode):
+    """Map an existing telemetry file; returns (raw, header, columns)."""
+    raw = np.memmap(path, dtype=np.uint8, mode=mode)
+    header = raw[:HEADER_SIZE].view("<u8")
+    if header[0] != MAGIC or header[1] != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} telemetry file")
+    capacity = int(header[2])
+    offsets, size = _layout(capacity)
+    if len(raw) < size:
+        raise ValueError(f"{path} is truncated")
+    columns = {name: raw[offsets[name]:offsets[name] + capacity * np.dtype(dtype).itemsize].view(dtype)
+               for name, dtype in COLUMNS}
+    return raw, header, columns
+
+
+class TelemetryRecorder:
+    """Append-only ring of fixed-width records in a preallocated, memory-mapped file.
+
+    Each field is its own column, so analysis maps a column straight into a
+    NumPy array. Disk use is fixed at creation; once full the oldest records
+    are overwritten. record() is a handful of stores into the mapping and
+    takes no lock: there must be a single writer thread, which publishes a
+    record by bumping the head counter after its columns are written.
+    Reopening an existing file of the same capacity keeps appending to it.
+    """
+
+    def __init__(self, path=TELEMETRY_PATH, capacity=TELEMETRY_CAPACITY):
+        self.path = path
+        try:
+            self.raw, self.header, self.columns = _map(path, "r+")
+            if int(self.header[2]) != capacity:
+                raise ValueError(f"{path} has capacity {int(self.header[2])}")
+        except (OSError, ValueError):
+            self._create(capacity)
+        self.capacity = int(self.header[2])
+        self.head = int(self.header[HEAD])
+
+    def _create(self, capacity):
+        _, size = _layout(capacity)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            # Reserve the blocks now so a full disk shows up here, not mid-session
+            os.posix_fallocate(fd, 0, size)
+        finally:
+            os.close(fd)
+        raw = np.memmap(self.path, dtype=np.uint8, mode="r+")
+        header = raw[:HEADER_SIZE].view("<u8")
+        header[:5] = [MAGIC, VERSION, capacity, 0, time.time_ns()]
+        raw.flush()
+        self.raw, self.header, self.columns = _map(self.path, "r+")
+
+    def record(self, setpoint, velocity, torque, faults, sensor=False, adc=-1, button=None, incline=0,
+               timestamp_ns=None):
+        slot = self.head % self.capacity
+        c = self.columns
+        c["timestamp_ns"][slot] = time.time_ns() if timestamp_ns is None else timestamp_ns
+        c["setpoint"][slot] = setpoint
+        c["velocity"][slot] = velocity
+        c["torque"][slot] = torque
+        c["faults"][slot] = faults
+        c["incline"][slot] = incline
+        c["adc"][slot] = adc
+        c["sensor"][slot] = sensor
+        c["button"][slot] = -1 if button is None else BUTTONS.index(button)
+        self.head += 1
+        self.header[HEAD] = self.head
+
+    def flush(self):
+        self.raw.flush()
+
+    def close(self):
+        self.flush()
+
+
+def open_recorder(path=TELEMETRY_PATH, capacity=TELEMETRY_CAPACITY):
+    """TelemetryRecorder, or None (with a message) when the file cannot be created."""
+    try:
+        return TelemetryRecorder(path, capacity)
+    except OSError as e:
+        print(f"Telemetry disabled: {e}")
+        return None
+
+
+class Telemetry:
+    """Read-only view of a telemetry file, safe to open while it is being written."""
+
+    def __init__(self, path=TELEMETRY_PATH):
+        self.raw, self.header, self.columns = _map(path, "r")
+        self.capacity = int(self.header[2])
+        self.created_ns = int(self.header[4])
+
+    @property
+    def head(self):
+        return int(self.header[HEAD])
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    def column(self, name):
+        """Zero-copy view of a column in slot order (not time order once wrapped)."""
+        return self.columns[name][:len(self)]
+
+    def records(self, last=None):
+        """Copy of the records oldest first as a structured array (the last `last` only)."""
+        head = self.head
+        first = max(head - self.capacity, 0)
+        if last is not None:
+            first = max(first, head - last)
+        slots = np.arange(first, head) % self.capacity
+        out = np.empty(len(slots), dtype=np.dtype(COLUMNS))
+        for name, _ in COLUMNS:
+            out[name] = self.columns[name][slots]
+        # Drop slots the writer lapped while we were copying
+        lapped = max(self.head - self.capacity - first, 0)
+        return out[lapped:]
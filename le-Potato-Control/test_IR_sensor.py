@@ -1,27 +1,26 @@
-import gpiod
 import time
+from ir_sensor import IRSensor
 
-# GPIO Configuration
-CHIP_NAME = "gpiochip0"  # GPIO chip for GPIOAO bank
-LINE_OFFSET = 6          # GPIOAO_6 (Pin 12)
+def on_trigger(event_ns):
+    delay_ms = (time.monotonic_ns() - event_ns) / 1e6
+    print(f"Sensor Triggered (connection open). Reported {delay_ms:.3f} ms after edge.")
+
+def on_clear(event_ns):
+    print("Sensor Idle (connection closed).")
 
 # Setup GPIO
-chip = gpiod.Chip(CHIP_NAME)
-line = chip.get_line(LINE_OFFSET)
-line.request(consumer="nc_sensor", type=gpiod.LINE_REQ_DIR_IN)
+sensor = IRSensor(on_trigger=on_trigger, on_clear=on_clear)
+sensor.start()
 
 print("Testing GPIOAO_6 (Pin 12)...")
+print("Sensor Triggered (connection open)." if sensor.triggered else "Sensor Idle (connection closed).")
 
 try:
     while True:
-        # Read the value of GPIOAO_6
-        value = line.get_value()
-        if value == 1:
-            print("Sensor Idle (connection closed).")
-        else:
-            print("Sensor Triggered (connection open).")
-        time.sleep(0.1)
+        time.sleep(1)
 except KeyboardInterrupt:
     print("Exiting...")
 finally:
-    chip.close()
+    sensor.stop()
+    for edge, timestamp_ns in sensor.events:
+        print(f"{timestamp_ns / 1e9:.6f} {edge}")
@@ -0,0 +1,42 @@
+import os
+os.environ.setdefault("ZAZU_BACKEND", "sim")  # replay imports the controller, which loads libsimucube
+
+import numpy as np
+from telemetry import COLUMNS, BUTTONS
+from replay import replay
+
+# Run with: python3 -m pytest test_replay.py
+
+SPEED = 1500
+
+
+def session(rows, stop=(), presses=None):
+    """Telemetry records for a manual-mode session: idle torque, the sensor
+    stop active on the rows in stop, presses mapping row -> button name."""
+    records = np.zeros(rows, dtype=np.dtype(COLUMNS))
+    records["button"] = -1
+    records["sensor"][list(stop)] = 1
+    for row, button in (presses or {}).items():
+        records["button"][row] = BUTTONS.index(button)
+    return records
+
+
+def test_press_during_native_stop_only_acknowledges():
+    records = session(15, stop=range(5, 10), presses={7: "button_2"})
+    commanded = replay(records, speed=SPEED, native_estop=True)
+    assert list(commanded[:5]) == [SPEED] * 5
+    assert list(commanded[5:10]) == [0] * 5
+    # Acknowledged: the belt resumes at the old speed on the tick after the latch releases
+    assert list(commanded[10:]) == [0] + [SPEED] * 4
+
+
+def test_mode_press_during_native_stop_keeps_mode():
+    records = session(15, stop=range(5, 10), presses={7: "button_5"})
+    commanded = replay(records, speed=SPEED, native_estop=True)
+    assert list(commanded[10:]) == [0] + [SPEED] * 4  # Still manual; auto mode would wait for torque
+
+
+def test_press_during_python_stop_changes_speed():
+    records = session(15, stop=range(5, 10), presses={7: "button_2"})
+    commanded = replay(records, speed=SPEED, native_estop=False)
+    assert list(commanded[10:]) == [0] + [SPEED + 200] * 4
@@ -1,141 +1,237 @@
 import ctypes
+import sys
 import time
-import subprocess
+import threading
 from collections import deque
-import gpiod
-
-# Activate IONI
-def activate_ioni():
-    try:
-        # Call the binary
-        result = subprocess.run(
-            ["/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/enable_ioni_configurator"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print("Output from IONI activation:")
-        print(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print("Error activating IONI:")
-        print(e.stderr)
-
-# Load the shared library
-libsimucube = ctypes.CDLL("/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/Ioni_Functions/libsimucube.so")
-
-# Define function signatures
-libsimucube.openSimucube.restype = ctypes.c_int
-libsimucube.openSimucube.argtypes = [ctypes.POINTER(ctypes.c_int)]
-
-libsimucube.closeSimucube.restype = None
-libsimucube.closeSimucube.argtypes = [ctypes.c_int]
-
-libsimucube.clearFaultsAndInitialize.restype = ctypes.c_int
-libsimucube.clearFaultsAndInitialize.argtypes = [ctypes.c_int]
-
-libsimucube.setSpeed.restype = ctypes.c_int
-libsimucube.setSpeed.argtypes = [ctypes.c_int, ctypes.c_int]
-
-libsimucube.getTorque.restype = ctypes.c_int
-libsimucube.getTorque.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+from ir_sensor import IRSensor
+from estop import NativeEStop
+from simucube import libsimucube, DriveState, connect_drive, print_timings
+from scheduler import PeriodicTask, run_periodic
+from setpoint import SetpointManager
+from speed_ramp import SpeedStreamer
+from filters import build_chain, Hysteresis, deployment_config
+from telemetry import open_recorder
+from metrics import METRICS, start_server
+from supervisor import DriveSupervisor
 
 # Motor Configuration
 SPEED_SETPOINT = 2000  # Speed when motor is enabled
-POLL_DELAY = 0.05      # Delay between checks (in seconds)
+POLL_DELAY = 0.05      # Control loop period (in seconds)
+RAMP_SPEED_CHANGES = True  # Start and stop the belt with streamed S-curve ramps
 ROLLING_WINDOW_SIZE = 20  # Number of samples for rolling average
 
-# GPIO Configuration
-CHIP_NAME = "gpiochip0"  # GPIO chip for GPIOAO bank
-LINE_OFFSET = 6           # GPIOAO_6 (Pin 12)
+# Torque filtering; both can be overridden in the deployment filter config
+TORQUE_FILTERS = deployment_config("torque_filters", [["mean", {"window": ROLLING_WINDOW_SIZE}]])
+TORQUE_ON_BELOW, TORQUE_OFF_ABOVE = deployment_config("torque_hysteresis", [-20, 20])
+
+# Real-time scheduling for the control loop (None leaves the default policy)
+REALTIME_PRIORITY = None  # SCHED_FIFO priority, e.g. 50 (needs CAP_SYS_NICE)
+CONTROL_CPUS = None       # CPU set to pin the loop to, e.g. {3}
+
+# IR stop handled by libsimucube's own e-stop thread (estop.py) rather than
+# a Python callback; False goes back to IRSensor + setSpeed(0) from Python
+NATIVE_ESTOP = True
+
+# Drive access is shared between the control loop and the sensor thread
+drive_lock = threading.Lock()
+stop_latencies_ms = deque(maxlen=100)  # Sensor edge -> setSpeed(0) returned
+
+# Sensor Stop Path
+def make_sensor_stop(handle, setpoints=None):
+    """Build the falling-edge callback that stops the motor immediately."""
+    def on_trigger(event_ns):
+        with drive_lock:
+            result = libsimucube.setSpeed(handle.value, 0)
+            if setpoints is not None:
+                setpoints.invalidate()  # The drive no longer holds what we last sent
+        latency_ms = (time.monotonic_ns() - event_ns) / 1e6
+        stop_latencies_ms.append(latency_ms)
+        if result == 0:
+            print(f"Sensor triggered: motor stopped {latency_ms:.2f} ms after edge.")
+        else:
+            print("Sensor triggered: failed to disable motor.")
+    return on_trigger
+
+def on_estop_clear(clear_ns):
+    """Beam clear: the latch holds until the operator acknowledges."""
+    print("Sensor clear: press Enter to acknowledge the e-stop and resume.")
+
+def make_estop_resume(sensor, setpoints):
+    """Build the operator resume command that releases the native e-stop latch."""
+    def resume():
+        with drive_lock:
+            if not sensor.triggered:
+                return
+            acknowledged = sensor.acknowledge()
+            if acknowledged:
+                setpoints.reset(0)  # The latch held the drive at 0; ramp up from there
+        if acknowledged:
+            print("E-stop acknowledged by operator.")
+        else:
+            print("Beam still broken; e-stop stays latched.")
+    return resume
+
+def read_resume_commands(resume):
+    """Call resume for every Enter on the console, from a daemon thread."""
+    def run():
+        for _ in sys.stdin:  # Ends quietly on EOF (no console attached)
+            resume()
+    threading.Thread(target=run, name="estop_resume", daemon=True).start()
+
+# Torque Decision
+class TorqueGate:
+    """Filtered torque -> run/stop decision, shared by the control loops and replay.
+
+    Run while the filtered torque is below the on threshold, stop once it
+    rises past the off threshold; in between keep doing what we were doing.
+    """
+
+    def __init__(self, filters=TORQUE_FILTERS, on_below=TORQUE_ON_BELOW, off_above=TORQUE_OFF_ABOVE):
+        self.filter = build_chain(filters)
+        self.hysteresis = Hysteresis(on_below, off_above, invert=True)
+        self.torque = 0.0  # Last filtered torque
+
+    def update(self, torque):
+        self.torque = self.filter.update(torque)
+        return self.hysteresis.update(self.torque)
+
+    def reset(self):
+        self.filter.reset()
+        self.hysteresis.reset()
+        self.torque = 0.0
 
 # Monitor Torque and Sensor
-def monitor_torque_and_sensor(handle, line):
-    """Monitor torque and sensor to control motor."""
+def torque_monitor(handle, sensor, setpoints=None, recorder=None):
+    """Build the periodic control task: one drive transaction per tick."""
     motor_running = False
-    torque_window = deque(maxlen=ROLLING_WINDOW_SIZE)  # Rolling window for torque
-
-    while True:
-        # Read sensor state
-        sensor_state = line.get_value()
-        if sensor_state == 0:  # NC sensor triggered (connection open)
-            print("Sensor triggered: Stopping motor...")
-            if motor_running:
-                motor_running = False
-            if libsimucube.setSpeed(handle.value, 0) == 0:
-                print("Motor disabled due to sensor.")
+    gate = TorqueGate()
+    state = DriveState()
+    if setpoints is None:
+        setpoints = SetpointManager(handle)
+    supervisor = DriveSupervisor(handle, setpoints)
+    METRICS.gauge("zazu_speed_commanded_rpm", "Setpoint last requested from the drive.",
+                  lambda: setpoints.target)
+    METRICS.gauge("zazu_velocity", "Drive velocity feedback.", lambda: state.velocity)
+    METRICS.gauge("zazu_torque", "Raw drive torque.", lambda: state.torque)
+    METRICS.gauge("zazu_torque_filtered", "Filtered torque used for auto mode.", lambda: gate.torque)
+    METRICS.gauge("zazu_faults", "Drive fault bits.", lambda: state.faults)
+    METRICS.gauge("zazu_motor_running", "1 while the belt should run.", lambda: motor_running)
+    METRICS.gauge("zazu_sensor_stop", "1 while the IR sensor stop is active.", lambda: sensor.triggered)
+
+    def tick():
+        nonlocal motor_running
+        # The sensor thread has already stopped the drive; just stay stopped
+        if sensor.triggered:
+            motor_running = False
+            gate.reset()
+            if recorder:
+                recorder.record(0, state.velocity, state.torque, state.faults, sensor=True)
+            return
+
+        # Read torque, velocity and faults; the setpoint rides along only
+        # when it changed or a keepalive is due
+        with drive_lock:
+            if sensor.triggered:
+                result = -1
+            elif not supervisor.healthy:
+                supervisor.recover()  # Clear the fault or reopen the bus, then resume
+                return
             else:
-                print("Failed to disable motor.")
-            time.sleep(POLL_DELAY)
-            continue
-
-        # Continuously send 0 speed setpoint if motor is not running
-        if not motor_running:
-            if libsimucube.setSpeed(handle.value, 0) != 0:
-                print("Failed to maintain motor disabled state.")
-
-        # Read torque value
-        torque_value = ctypes.c_int()
-        if libsimucube.getTorque(handle, ctypes.byref(torque_value)) == 0:
-            torque_window.append(torque_value.value)
-            average_torque = sum(torque_window) / len(torque_window)
-            print(f"Torque: {torque_value.value}, Rolling Average Torque: {average_torque:.2f}")
-
-            # Enable motor when average torque is below threshold
-            if average_torque < 0 and not motor_running:
-                print("Rolling average torque is below threshold. Turning motor ON...")
+                setpoints.request(SPEED_SETPOINT if motor_running else 0)
+                result = setpoints.exchange(state)
+                supervisor.observe(result, state.faults if result == 0 else None)
+        if result == 0:
+            if recorder:
+                recorder.record(setpoints.target, state.velocity, state.torque, state.faults)
+            run = gate.update(state.torque)
+
+            # Enable motor when filtered torque drops below the on threshold
+            if run and not motor_running:
+                print(f"Filtered torque {gate.torque:.1f} is below threshold. Turning motor ON...")
                 motor_running = True
-                if libsimucube.setSpeed(handle.value, SPEED_SETPOINT) == 0:
+                with drive_lock:
+                    # Re-check under the lock so a trigger that raced us wins
+                    setpoints.request(SPEED_SETPOINT)
+                    if sensor.triggered:
+                        result = -1
+                    else:
+                        result = setpoints.flush(force=True)
+                        supervisor.observe(result)
+                if result == 0:
                     print(f"Motor enabled at speed {SPEED_SETPOINT}.")
                 else:
                     print("Failed to enable motor.")
 
-            # Disable motor when average torque is above or equal to threshold
-            elif average_torque >= 0 and motor_running:
-                print("Rolling average torque is above or equal to threshold. Turning motor OFF...")
+            # Disable motor when filtered torque rises past the off threshold
+            elif not run and motor_running:
+                print(f"Filtered torque {gate.torque:.1f} is above threshold. Turning motor OFF...")
                 motor_running = False
-                if libsimucube.setSpeed(handle.value, 0) == 0:
+                with drive_lock:
+                    setpoints.request(0)
+                    result = setpoints.flush(force=True)
+                    supervisor.observe(result)
+                if result == 0:
                     print("Motor disabled.")
                 else:
                     print("Failed to disable motor.")
 
-        else:
-            print("Failed to read torque.")
+        elif not sensor.triggered and supervisor.healthy:
+            print("Failed to exchange drive state.")
+    return tick
 
-        time.sleep(POLL_DELAY)
+def monitor_torque_and_sensor(handle, sensor, setpoints=None, recorder=None):
+    """Monitor torque and sensor to control motor (blocks the calling thread)."""
+    if setpoints is None:
+        setpoints = SetpointManager(handle)
+    task = PeriodicTask("torque", POLL_DELAY, torque_monitor(handle, sensor, setpoints, recorder),
+                        REALTIME_PRIORITY, CONTROL_CPUS)
+    try:
+        run_periodic(task)
+    finally:
+        print(f"[{task.name}] {task.stats.summary()}")
+        print(f"[{task.name}] {setpoints.stats.summary()}")
 
 # Main Function
 if __name__ == "__main__":
-    activate_ioni()
-
     handle = ctypes.c_int()
     
-    # Setup GPIO
-    chip = gpiod.Chip(CHIP_NAME)
-    line = chip.get_line(LINE_OFFSET)
-    line.request(consumer="nc_sensor", type=gpiod.LINE_REQ_DIR_IN)
+    # Setup GPIO edge events; the stop callback is live once the drive is open
+    setpoints = SetpointManager(handle, streamer=SpeedStreamer(handle) if RAMP_SPEED_CHANGES else None)
+    if NATIVE_ESTOP:
+        sensor = NativeEStop(handle)
+        sensor.on_clear = on_estop_clear
+    else:
+        sensor = IRSensor(on_trigger=make_sensor_stop(handle, setpoints))
+    recorder = open_recorder()
+    start_server()
 
     try:
-        # Open Simucube
-        if libsimucube.openSimucube(ctypes.byref(handle)) == 0:
-            print("Simucube opened successfully.")
-
-            # Clear faults and initialize
-            print("Clearing faults and initializing Simucube...")
-            if libsimucube.clearFaultsAndInitialize(handle.value) == 0:
-                print("Faults cleared and motor initialized.")
-
-                # Start monitoring torque and sensor
-                print("Monitoring torque and sensor to control motor...")
-                monitor_torque_and_sensor(handle, line)
-            else:
-                print("Failed to clear faults and initialize motor.")
-        else:
-            print("Failed to open Simucube.")
+        # Activate IONI, open the drive and clear faults
+        ready, timings = connect_drive(handle)
+        print("Startup timing:")
+        print_timings(timings)
+        if ready:
+            print("Faults cleared and motor initialized.")
+
+            # Start monitoring torque and sensor
+            print("Monitoring torque and sensor to control motor...")
+            sensor.start()
+            if NATIVE_ESTOP:
+                read_resume_commands(make_estop_resume(sensor, setpoints))
+            monitor_torque_and_sensor(handle, sensor, setpoints, recorder)
     except KeyboardInterrupt:
         print("Exiting...")
     finally:
+        # Disarm the e-stop before the bus it writes to goes away, as the controller does
+        sensor.stop()
         if libsimucube.setSpeed(handle.value, 0) == 0:
             print("Motor disabled on exit.")
         libsimucube.closeSimucube(handle.value)
-        chip.close()
+        if recorder:
+            recorder.close()
+        if NATIVE_ESTOP:
+            print(sensor.summary())
+        elif stop_latencies_ms:
+            worst = max(stop_latencies_ms)
+            print(f"Sensor stop latency: {len(stop_latencies_ms)} stops, worst {worst:.2f} ms")
         print("Simucube closed.")
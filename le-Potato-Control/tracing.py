@@ -0,0 +1,116 @@
+import atexit
+import ctypes
+import itertools
+import json
+import os
+import threading
+import time
+
+# Tracing Configuration (opt-in, off on production units unless asked for):
+#   ZAZU_TRACE=/tmp/wall.trace.json   record spans for the whole run and write
+#                                     a Chrome/Perfetto trace there on exit
+TRACE_PATH = os.environ.get("ZAZU_TRACE")
+TRACE_CAPACITY = 1 << 16   # Spans kept on each side (Python, libsimucube); oldest overwritten
+
+# Matches TraceRecord in simucube_lib.c
+NATIVE_SPAN_FIELDS = [("seq", "<u8"), ("begin_ns", "<i8"), ("end_ns", "<i8"), ("tid", "<u4"), ("name", "<u4")]
+INVALID_SEQ = 2 ** 64 - 1
+
+
+class Tracer:
+    """Preallocated ring of (name, thread ID, begin ns, end ns) spans.
+
+    Slots are claimed from an itertools counter, which is atomic under the
+    GIL, so any thread can record without a lock. Timestamps come from
+    perf_counter_ns (CLOCK_MONOTONIC on Linux, the clock libsimucube's own
+    spans use) and thread IDs are kernel TIDs, so Python and native spans
+    land on the same timeline and thread tracks.
+    """
+
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.capacity = capacity
+        self.spans = [None] * capacity
+        self.counter = itertools.count()
+        self.native = None       # libsimucube once its tracing is started
+        self.threads = {}        # Thread ID -> name, kept after the thread exits
+
+    def record(self, name, begin_ns, end_ns):
+        tid = threading.get_native_id()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        self.spans[next(self.counter) % self.capacity] = (name, tid, begin_ns, end_ns)
+
+    def start_native(self, lib):
+        if lib.traceStart(self.capacity) > 0:
+            self.native = lib
+
+    def _native_spans(self):
+        import numpy as np
+        lib = self.native
+        head = lib.traceHead()
+        capacity = lib.traceCapacitySlots()
+        raw = (ctypes.c_uint8 * (capacity * 32)).from_address(lib.traceBuffer())
+        ring = np.frombuffer(raw, dtype=np.dtype(NATIVE_SPAN_FIELDS)).copy()
+        names = [lib.traceName(i).decode() for i in range(lib.traceNameCount())]
+        # Keep slots holding one of the last capacity spans, written in full
+        valid = (ring["seq"] != INVALID_SEQ) & (ring["seq"] + capacity >= head)
+        return [(names[r["name"]], int(r["tid"]), int(r["begin_ns"]), int(r["end_ns"])) for r in ring[valid]]
+
+    def events(self):
+        """Chrome trace events for every span still in the buffers."""
+        pid = os.getpid()
+        spans = [("python", span) for span in list(self.spans) if span is not None]
+        if self.native is not None:
+            spans += [("libsimucube", span) for span in self._native_spans()]
+        events = [{"name": name, "cat": category, "ph": "X", "pid": pid, "tid": tid,
+                   "ts": begin / 1000.0, "dur": (end - begin) / 1000.0}
+                  for category, (name, tid, begin, end) in spans]
+        threads = dict(self.threads)
+        threads.update((thread.native_id, thread.name) for thread in threading.enumerate())
+        for tid, name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        return events
+
+    def export(self, path):
+        """Write a Chrome/Perfetto trace (chrome://tracing or ui.perfetto.dev)."""
+        if self.native is not None:
+            self.native.traceStop()
+        events = self.events()
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Trace with {len(events)} events written to {path}")
+
+
+# Process-wide tracer, None while tracing is off
+TRACER = Tracer() if TRACE_PATH else None
+if TRACER:
+    atexit.register(TRACER.export, TRACE_PATH)
+
+
+def record(name, begin_ns, end_ns=None):
+    """Record a span the caller already timed with perf_counter_ns."""
+    if TRACER:
+        TRACER.record(name, begin_ns, time.perf_counter_ns() if end_ns is None else end_ns)
+
+
+def traced(name, func):
+    """Record a span for every call of func; returns func unchanged while tracing is off."""
+    if TRACER is None:
+        return func
+    record = TRACER.record
+
+    def wrapper(*args, **kwargs):
+        begin = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, begin, time.perf_counter_ns())
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def start_native_tracing(lib):
+    """Turn on libsimucube's own spans when tracing; the simulated drive has none."""
+    if TRACER and hasattr(lib, "traceStart"):
+        TRACER.start_native(lib)
+    return lib
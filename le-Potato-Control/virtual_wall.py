@@ -0,0 +1,779 @@
+import ctypes
+import json
+import math
+import random
+import threading
+import time
+import numpy as np
+
+# Real clock functions, captured before any virtual clock is installed
+_real_sleep = time.sleep
+_real_monotonic = time.monotonic
+_real_time = time.time
+
+# Default scenario (times in seconds of virtual time)
+DEFAULT_SCENARIO = {
+    "bus_latency": 0.002,       # Round trip per libsimucube call
+    "bus_jitter": 0.0005,       # Uniform extra latency
+    "speed_tau": 0.25,          # Belt speed first-order lag
+    "max_accel": 8000.0,        # rpm/s
+    "friction": 40,             # Torque units opposing motion
+    "torque_noise": 5,
+    "climbers": [[2.0, 30.0, 200]],          # [start, end, load torque]
+    "sensor_trips": [[25.0, 26.0]],          # IR beam broken [start, end]
+    "presses": [[5.0, 0.2, "button_2"], [8.0, 1.5, "button_2"], [12.0, 0.2, "button_4"]],
+    "faults": [],                            # [time, fault bits]
+    "disconnects": [],                       # [start, end] bus unavailable
+    "adc_noise": 8,
+    "watchdog_param": None,                  # Address the drive treats as its comm timeout (ms)
+    "incline_start_steps": 1000,             # Stepper steps above the home switch at power-up
+    "drive_params": {},                      # Parameter address -> value at power-up
+    "readonly_params": [],                   # Addresses whose writes the drive rejects
+}
+
+# Fault bit raised when the drive's communication watchdog expires (FLT_HOST_COMM_ERROR)
+WATCHDOG_FAULT = 1 << 15
+
+# ADC code per button on the ladder
+BUTTON_CODES = {
+    "button_1": 5,
+    "button_2": 540,
+    "button_3": 1807,
+    "button_4": 1196,
+    "button_5": 2615,
+    "no_press": 3507,
+}
+
+SENSOR_CHIP = "gpiochip0"
+SENSOR_LINE = 6
+
+# Bulk parameter access: parameters per bus transaction, and the command
+# status a rejected write returns
+PARAM_BATCH = 16
+CMD_STATUS_INVALID_ADDR = 2
+
+# Incline stepper and its home limit switch (closed, reading 0, at or below step 0)
+STEPPER_CHIP = "gpiochip1"
+STEP_LINE = 23
+DIR_LINE = 18
+HOME_SWITCH_LINE = 24
+
+# Native e-stop (EstopStats field names as exposed by simucube.EStopStats)
+ESTOP_FIELDS = ["triggers", "events", "edge_ns", "latency_ns", "max_latency_ns", "clear_ns",
+                "latched", "level", "result", "priority"]
+ESTOP_CLEAR_NS = 5_000_000   # Beam clear this long before the stop may be acknowledged
+
+
+class VirtualClock:
+    """Monotonic clock running scale times faster than real time.
+
+    install() swaps the time module functions so unmodified scripts sleep
+    and timestamp in virtual time.
+    """
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.real_start = _real_monotonic()
+        self.virtual_start = self.real_start
+        self.wall_offset = _real_time() - self.real_start
+
+    def monotonic(self):
+        return self.virtual_start + (_real_monotonic() - self.real_start) * self.scale
+
+    def monotonic_ns(self):
+        return int(self.monotonic() * 1e9)
+
+    def time(self):
+        return self.monotonic() + self.wall_offset
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            _real_sleep(seconds / self.scale)
+
+    def install(self):
+        time.sleep = self.sleep
+        time.monotonic = self.monotonic
+        time.monotonic_ns = self.monotonic_ns
+        time.perf_counter = self.monotonic
+        time.perf_counter_ns = self.monotonic_ns
+        time.time = self.time
+
+
+class VirtualWall:
+    """Shared state of the simulated wall: belt, drive, climber and inputs."""
+
+    def __init__(self, scenario=None):
+        self.scenario = dict(DEFAULT_SCENARIO)
+        if scenario:
+            self.scenario.update(scenario)
+        self.lock = threading.RLock()
+        self.start = time.monotonic()
+        self.last_update = self.start
+        self.setpoint = 0
+        self.velocity = 0.0
+        self.position = 0.0
+        self.accel = 0.0
+        self.enabled = False
+        self.faults = 0
+        self.injected = sorted(self.scenario["faults"])
+        self.bus_calls = 0
+        self.gpio_outputs = {}
+        # JSON scenarios carry parameter addresses as string keys
+        self.params = {int(addr): value for addr, value in self.scenario["drive_params"].items()}
+        self.saved_params = dict(self.params)
+        self.readonly_params = set(self.scenario["readonly_params"])
+        self.watchdog_ms = 0
+        self.incline_steps = self.scenario["incline_start_steps"]
+        self.last_contact = self.start
+
+    def now(self):
+        return time.monotonic() - self.start
+
+    def _in(self, windows, t):
+        return any(start <= t < end for start, end, *rest in windows)
+
+    def climber_load(self, t):
+        return sum(load for start, end, load in self.scenario["climbers"] if start <= t < end)
+
+    def bus_available(self):
+        return not self._in(self.scenario["disconnects"], self.now())
+
+    def sensor_level(self):
+        """NC sensor: 1 idle, 0 while a scenario trip is active."""
+        return 0 if self._in(self.scenario["sensor_trips"], self.now()) else 1
+
+    def home_switch_level(self):
+        return 0 if self.incline_steps <= 0 else 1
+
+    def step(self):
+        """One STEP rising edge: move the incline the way DIR points."""
+        self.incline_steps += 1 if self.gpio_outputs.get((STEPPER_CHIP, DIR_LINE), 0) else -1
+
+    def adc_code(self):
+        t = self.now()
+        button = "no_press"
+        for start, duration, name in self.scenario["presses"]:
+            if start <= t < start + duration:
+                button = name
+        noise = self.scenario["adc_noise"]
+        return min(max(BUTTON_CODES[button] + random.randint(-noise, noise), 0), 4095)
+
+    def update(self):
+        """Advance belt dynamics to the current virtual time."""
+        with self.lock:
+            now = time.monotonic()
+            dt = now - self.last_update
+            self.last_update = now
+            t = now - self.start
+            while self.injected and self.injected[0][0] <= t:
+                self.faults |= self.injected.pop(0)[1]
+            target = self.setpoint if self.enabled and not self.faults else 0
+            if dt <= 0:
+                return
+            tau = self.scenario["speed_tau"]
+            wanted = (target - self.velocity) * (1 - math.exp(-dt / tau)) / dt
+            limit = self.scenario["max_accel"]
+            self.accel = max(-limit, min(limit, wanted))
+            self.velocity += self.accel * dt
+            self.position += self.velocity * dt / 60.0
+
+    def torque(self):
+        friction = self.scenario["friction"]
+        direction = (self.velocity > 1) - (self.velocity < -1)
+        noise = self.scenario["torque_noise"]
+        return int(friction * direction - self.climber_load(self.now())
+                   + self.accel * 0.01 + random.uniform(-noise, noise))
+
+    def contact(self):
+        """Record host traffic; an expired watchdog faults the drive first."""
+        with self.lock:
+            now = time.monotonic()
+            if self.watchdog_ms and (now - self.last_contact) * 1000.0 > self.watchdog_ms:
+                self.faults |= WATCHDOG_FAULT
+            self.last_contact = now
+
+    def bus_delay(self):
+        self.bus_calls += 1
+        latency = self.scenario["bus_latency"] + random.uniform(0, self.scenario["bus_jitter"])
+        time.sleep(latency)
+
+
+def _deref(value):
+    """Accept ctypes.byref()/pointer() arguments as well as plain objects."""
+    if hasattr(value, "_obj"):
+        return value._obj
+    if hasattr(value, "contents"):
+        return value.contents
+    return value
+
+
+def _int(value):
+    return value.value if hasattr(value, "value") else int(value)
+
+
+class SimulatedSimucube:
+    """One simulated drive on its own bus, answering libsimucube's calls with its return codes."""
+
+    def __init__(self, wall, bus=1):
+        self.wall = wall
+        self.bus = bus   # Handle value handed out by open
+        self.sampler = None
+        self.sampler_memory = None
+        self.stream = None
+        self.stream_running = False
+        self.stream_sent = 0
+        self.stream_fills = 0
+        self.link_lost = False
+        self.estop = dict.fromkeys(ESTOP_FIELDS, 0)
+        self.estop_changed = threading.Condition()
+        self.estop_disable = False
+        self.estop_thread = None
+        self.estop_running = False
+
+    def _call(self):
+        self.wall.bus_delay()
+        self.wall.update()
+        if self.link_lost or not self.wall.bus_available():
+            self.link_lost = True  # The port went away; the handle stays dead until reopened
+            return False
+        self.wall.contact()
+        return True
+
+    def activateIoni(self, vid=0, pid=0, serial=None, timeout_ms=0):
+        return 0
+
+    def findSimucubePort(self, vid, pid, serial, port, port_len):
+        return 0
+
+    def openSimucube(self, handle):
+        self.link_lost = False
+        if not self._call():
+            return -1
+        _deref(handle).value = self.bus
+        return 0
+
+    def openSimucubeFast(self, handle, vid=0, pid=0, serial=None, cache=None, node=1):
+        return self.openSimucube(handle)
+
+    def closeSimucube(self, handle):
+        self.stopSampler()
+        self.streamAbort()
+        with self.wall.lock:
+            self.wall.enabled = False
+
+    def clearFaultsAndInitialize(self, handle):
+        if not self._call():
+            return -1
+        with self.wall.lock:
+            self.wall.faults = 0
+            self.wall.enabled = True
+        return 0
+
+    def setSpeed(self, handle, speed):
+        self.streamAbort()
+        if not self._call():
+            return -1
+        with self.wall.lock:
+            self.wall.setpoint = 0 if self.estop["latched"] else _int(speed)
+        return 0
+
+    def setParameter(self, handle, address, value):
+        if not self._call():
+            return -1
+        address, value = _int(address), _int(value)
+        with self.wall.lock:
+            self.wall.params[address] = value
+            if address == self.wall.scenario["watchdog_param"]:
+                self.wall.watchdog_ms = value
+        return 0
+
+    def getParameter(self, handle, address, value):
+        if not self._call():
+            return -1
+        _deref(value).value = self.wall.params.get(_int(address), 0)
+        return 0
+
+    def readParameters(self, handle, addresses, values, count):
+        for first in range(0, _int(count), PARAM_BATCH):
+            if not self._call():
+                return -1
+            for i in range(first, min(first + PARAM_BATCH, _int(count))):
+                values[i] = self.wall.params.get(addresses[i], 0)
+        return 0
+
+    def writeParameters(self, handle, addresses, values, statuses, count):
+        rejected = 0
+        for first in range(0, _int(count), PARAM_BATCH):
+            if not self._call():
+                return -1
+            with self.wall.lock:
+                for i in range(first, min(first + PARAM_BATCH, _int(count))):
+                    if addresses[i] in self.wall.readonly_params:
+                        statuses[i] = CMD_STATUS_INVALID_ADDR
+                        rejected += 1
+                        continue
+                    self.wall.params[addresses[i]] = values[i]
+                    if addresses[i] == self.wall.scenario["watchdog_param"]:
+                        self.wall.watchdog_ms = values[i]
+                    statuses[i] = 0
+        return rejected
+
+    def saveConfiguration(self, handle):
+        if not self._call():
+            return -1
+        with self.wall.lock:
+            self.wall.saved_params = dict(self.wall.params)
+        return 0
+
+    def getTorque(self, handle, torque):
+        if not self._call():
+            return -1
+        _deref(torque).value = self.wall.torque()
+        return 0
+
+    def getFaults(self, handle, faults):
+        if not self._call():
+            return -1
+        _deref(faults).value = self.wall.faults
+        return 0
+
+    def _fill_state(self, state):
+        state = _deref(state)
+        state.torque = self.wall.torque()
+        state.velocity = int(self.wall.velocity)
+        state.faults = self.wall.faults
+        state.status = int(self.wall.enabled)
+        state.position = int(self.wall.position)
+
+    def exchangeState(self, handle, speed, state):
+        self.streamAbort()
+        if not self._call():
+            return -1
+        with self.wall.lock:
+            self.wall.setpoint = 0 if self.estop["latched"] else _int(speed)
+        self._fill_state(state)
+        return 0
+
+    def readState(self, handle, state):
+        if not self._call():
+            return -1
+        self._fill_state(state)
+        return 0
+
+    # Background sampler with the same memory layout as the native one
+    def startSampler(self, handle, rate_hz, capacity):
+        from drive_sampler import SAMPLE_DTYPE
+        if self.sampler is not None:
+            return -1
+        if self.sampler_memory is None:
+            # Kept for good, as the library does: a reader may still hold a view
+            self.sampler_memory = (ctypes.c_uint8 * (capacity * SAMPLE_DTYPE.itemsize))()
+            self.sampler_capacity = capacity
+        capacity = self.sampler_capacity
+        ring = np.frombuffer(self.sampler_memory, dtype=SAMPLE_DTYPE)
+        ring["seq"] = np.iinfo(np.uint64).max
+        self.sampler_head = 0
+        self.sampler_errors = 0
+        self.sampler_running = True
+
+        def run():
+            period = 1.0 / rate_hz
+            deadline = time.monotonic()
+            while self.sampler_running:
+                if self._call():
+                    slot = ring[self.sampler_head % capacity]
+                    slot["seq"] = self.sampler_head
+                    slot["timestamp_ns"] = time.monotonic_ns()
+                    slot["torque"] = self.wall.torque()
+                    slot["velocity"] = int(self.wall.velocity)
+                    slot["position"] = int(self.wall.position)
+                    slot["faults"] = self.wall.faults
+                    self.sampler_head += 1
+                else:
+                    self.sampler_errors += 1
+                deadline += period
+                time.sleep(max(0.0, deadline - time.monotonic()))
+
+        self.sampler = threading.Thread(target=run, name="sim_sampler", daemon=True)
+        self.sampler.start()
+        return 0
+
+    def stopSampler(self):
+        if self.sampler is not None:
+            self.sampler_running = False
+            self.sampler.join()
+            self.sampler = None
+
+    def samplerBuffer(self):
+        return ctypes.addressof(self.sampler_memory)
+
+    def samplerCapacitySlots(self):
+        return self.sampler_capacity
+
+    def samplerHead(self):
+        return self.sampler_head
+
+    def samplerErrorCount(self):
+        return self.sampler_errors
+
+    # Buffered setpoint stream: the drive plays points back at its own rate
+    def streamStart(self, handle, setpoints, count, rate_hz):
+        if count <= 0 or rate_hz <= 0 or self.estop["latched"]:
+            return -1
+        self.streamAbort()
+        if not self._call():
+            return -1
+        points = np.ctypeslib.as_array(setpoints, shape=(count,)).copy()
+        self.stream_sent = 0
+        self.stream_running = True
+
+        def play():
+            period = 1.0 / rate_hz
+            deadline = time.monotonic()
+            # The real buffer is filled ahead of playback in batches
+            self.stream_sent = count
+            self.stream_fills += 1
+            for point in points:
+                if not self.stream_running:
+                    return
+                with self.wall.lock:
+                    self.wall.setpoint = int(point)
+                deadline += period
+                time.sleep(max(0.0, deadline - time.monotonic()))
+            self.stream_running = False
+
+        self.stream = threading.Thread(target=play, name="sim_stream", daemon=True)
+        self.stream.start()
+        return 0
+
+    def streamAbort(self, handle=None):
+        stream = self.stream  # The e-stop thread may abort concurrently
+        if stream is not None:
+            self.stream_running = False
+            stream.join()
+            self.stream = None
+
+    def streamActive(self, handle=None):
+        return int(self.stream_running)
+
+    def streamSentPoints(self, handle=None):
+        return self.stream_sent
+
+    def streamFillCount(self, handle=None):
+        return self.stream_fills
+
+    # Native e-stop: a thread watching the wall's sensor level stands in for GPIO edge events
+    def estopStart(self, handle, chip_path, line, priority, disable_motor):
+        if self.estop_thread is not None:
+            return -1
+        with self.estop_changed:
+            self.estop = dict.fromkeys(ESTOP_FIELDS, 0)
+            self.estop["level"] = 1
+        self.estop_disable = bool(disable_motor)
+        self.estop_running = True
+        self.estop_thread = threading.Thread(target=self._estop_run, name="estop", daemon=True)
+        self.estop_thread.start()
+        return 0
+
+    def _estop_trip(self, edge_ns):
+        self.stream_running = False
+        with self.wall.lock:
+            first = not self.estop["latched"]
+            self.estop["latched"] = 1
+        result = 0
+        if first:
+            self.streamAbort()
+            result = 0 if self._call() else -1
+            if result == 0:
+                with self.wall.lock:
+                    self.wall.setpoint = 0
+                    if self.estop_disable:
+                        self.wall.enabled = False
+        latency = time.monotonic_ns() - edge_ns
+        with self.estop_changed:
+            estop = self.estop
+            estop["level"] = 0
+            estop["clear_ns"] = 0
+            if first:
+                estop["triggers"] += 1
+                estop["edge_ns"] = edge_ns
+                estop["latency_ns"] = latency
+                estop["max_latency_ns"] = max(estop["max_latency_ns"], latency)
+                estop["result"] = result
+            estop["events"] += 1
+            self.estop_changed.notify_all()
+
+    def _estop_clear(self, edge_ns):
+        with self.estop_changed:
+            self.estop["level"] = 1
+            self.estop["clear_ns"] = edge_ns
+            self.estop["events"] += 1
+            self.estop_changed.notify_all()
+
+    def _estop_run(self):
+        level = None
+        while self.estop_running:
+            current = self.wall.sensor_level()
+            if current != level:
+                level = current
+                (self._estop_clear if current else self._estop_trip)(time.monotonic_ns())
+            _real_sleep(0.0002)
+
+    def estopStop(self, handle):
+        if self.estop_thread is None:
+            return
+        self.estop_running = False
+        self.estop_thread.join()
+        self.estop_thread = None
+        with self.estop_changed:
+            self.estop["latched"] = 0
+            self.estop["events"] += 1
+            self.estop_changed.notify_all()
+
+    def estopRebind(self, handle, new_handle):
+        return 0  # Simulated handles survive a reopen
+
+    def estopIsLatched(self, handle):
+        return self.estop["latched"]
+
+    def estopAcknowledge(self, handle):
+        with self.estop_changed:
+            estop = self.estop
+            if not estop["latched"]:
+                return 0
+            if (estop["level"] != 1 or not estop["clear_ns"]
+                    or time.monotonic_ns() - estop["clear_ns"] < ESTOP_CLEAR_NS or self.wall.sensor_level() != 1):
+                return -1
+            with self.wall.lock:
+                estop["latched"] = 0
+            estop["events"] += 1
+            self.estop_changed.notify_all()
+        return 0
+
+    def estopGetStats(self, handle, stats):
+        if self.estop_thread is None:
+            return -1
+        stats = _deref(stats)
+        with self.estop_changed:
+            for field in ESTOP_FIELDS:
+                setattr(stats, field, self.estop[field])
+        return 0
+
+    def estopWait(self, handle, seen, timeout_ms):
+        with self.estop_changed:
+            self.estop_changed.wait_for(lambda: self.estop["events"] != seen or not self.estop_running,
+                                        timeout_ms / 1000.0)
+            return self.estop["events"]
+
+
+class SimulatedHost:
+    """Stand-in for libsimucube on a host with any number of drives.
+
+    Each (serial, node) opened gets its own SimulatedSimucube and VirtualWall
+    (the first one gets the shared wall the GPIO, ADC and LCD fakes use), and
+    every call is routed to a drive by its handle, like the per-bus state in
+    the native library. Drives share no lock, so bus waits overlap.
+    """
+
+    # Calls that take no handle: the sampler is single, like the native one
+    UNROUTED = {"stopSampler", "samplerBuffer", "samplerCapacitySlots", "samplerHead", "samplerErrorCount"}
+
+    def __init__(self, wall):
+        self.wall = wall
+        self.drives = {}       # (serial, node) -> SimulatedSimucube
+        self.buses = {}        # handle value -> SimulatedSimucube
+        self.sampling = None   # Drive the sampler runs on
+        self.lock = threading.Lock()
+
+    def _drive(self, serial, node):
+        key = (bytes(serial or b""), _int(node))
+        with self.lock:
+            drive = self.drives.get(key)
+            if drive is None:
+                wall = self.wall if not self.drives else VirtualWall(self.wall.scenario)
+                drive = self.drives[key] = SimulatedSimucube(wall, bus=len(self.drives) + 1)
+                self.buses[drive.bus] = drive
+            return drive
+
+    def activateIoni(self, vid=0, pid=0, serial=None, timeout_ms=0):
+        return 0
+
+    def findSimucubePort(self, vid, pid, serial, port, port_len):
+        return 0
+
+    def openSimucube(self, handle):
+        return self._drive(b"", 1).openSimucube(handle)
+
+    def openSimucubeFast(self, handle, vid=0, pid=0, serial=None, cache=None, node=1):
+        return self._drive(serial, node).openSimucube(handle)
+
+    def startSampler(self, handle, rate_hz, capacity):
+        self.sampling = self.buses[_int(handle)]
+        return self.sampling.startSampler(handle, rate_hz, capacity)
+
+    def __getattr__(self, name):
+        if name in self.UNROUTED:
+            return lambda: getattr(self.sampling or self._drive(b"", 1), name)()
+        if not hasattr(SimulatedSimucube, name):
+            raise AttributeError(name)
+
+        def call(handle, *args):
+            drive = self.buses.get(_int(handle))
+            if drive is None:
+                return -1  # Never opened, like a bad smbus handle
+            return getattr(drive, name)(handle, *args)
+        return call
+
+
+class VirtualSMBus:
+    """SMBus stand-in that decodes PCF8574/HD44780 traffic into a text screen."""
+
+    def __init__(self, bus_number=1, width=16, rows=2):
+        self.width = width
+        self.screen = [[" "] * width for _ in range(rows)]
+        self.address = 0
+        self.previous = 0
+        self.nibble = None
+        self.bytes_written = 0
+
+    def _latch(self, value):
+        # Data is taken on the falling edge of EN (bit 2)
+        if self.nibble is None:
+            self.nibble = value & 0xF0
+            return
+        byte = self.nibble | (value >> 4)
+        self.nibble = None
+        if value & 0x01:
+            row, col = divmod(self.address, 0x40)
+            if row < len(self.screen) and col < self.width:
+                self.screen[row][col] = chr(byte)
+            self.address += 1
+        elif byte == 0x01:
+            self.screen = [[" "] * self.width for _ in self.screen]
+            self.address = 0
+        elif byte & 0x80:
+            self.address = byte & 0x7F
+
+    def write_byte(self, addr, value):
+        self.bytes_written += 1
+        if self.previous & 0x04 and not value & 0x04:
+            self._latch(self.previous)
+        self.previous = value
+
+    def i2c_rdwr(self, *messages):
+        for message in messages:
+            for value in bytes(message):
+                self.write_byte(message.addr, value)
+
+    def text(self):
+        return ["".join(row) for row in self.screen]
+
+    def close(self):
+        pass
+
+
+class VirtualADC:
+    """Button ladder ADC stand-in with the ADCReader interface."""
+
+    def __init__(self, wall):
+        self.wall = wall
+
+    def read(self):
+        return self.wall.adc_code()
+
+    def close(self):
+        pass
+
+
+class VirtualLineEvent:
+    RISING_EDGE = 1
+    FALLING_EDGE = 2
+
+    def __init__(self, event_type, timestamp_ns):
+        self.type = event_type
+        self.sec, self.nsec = divmod(timestamp_ns, 1_000_000_000)
+
+
+class VirtualLine:
+    """gpiod line stand-in; input levels come from the wall, outputs are stored."""
+
+    def __init__(self, wall, chip_name, offset):
+        self.wall = wall
+        self.key = (chip_name, offset)
+        self.level = None
+        self.pending = []
+
+    def _input_level(self):
+        if self.key == (SENSOR_CHIP, SENSOR_LINE):
+            return self.wall.sensor_level()
+        if self.key == (STEPPER_CHIP, HOME_SWITCH_LINE):
+            return self.wall.home_switch_level()
+        return self.wall.gpio_outputs.get(self.key, 1)
+
+    def request(self, consumer=None, type=None, default_val=0, flags=0):
+        self.level = self._input_level()
+
+    def get_value(self):
+        return self._input_level()
+
+    def set_value(self, value):
+        if self.key == (STEPPER_CHIP, STEP_LINE) and value and not self.wall.gpio_outputs.get(self.key):
+            self.wall.step()
+        self.wall.gpio_outputs[self.key] = value
+
+    def _poll(self):
+        level = self._input_level()
+        if level != self.level:
+            self.level = level
+            edge = VirtualLineEvent.RISING_EDGE if level else VirtualLineEvent.FALLING_EDGE
+            self.pending.append(VirtualLineEvent(edge, time.monotonic_ns()))
+
+    def event_wait(self, sec=0, nsec=0):
+        deadline = time.monotonic() + sec + nsec / 1e9
+        while True:
+            self._poll()
+            if self.pending:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            _real_sleep(0.0005)
+
+    def event_read(self):
+        return self.pending.pop(0)
+
+    def release(self):
+        pass
+
+
+class VirtualChip:
+    def __init__(self, wall, name):
+        self.wall = wall
+        self.name = name.replace("/dev/", "")
+
+    def get_line(self, offset):
+        return VirtualLine(self.wall, self.name, offset)
+
+    def close(self):
+        pass
+
+
+class VirtualGpiod:
+    """Module-like stand-in for the libgpiod v1 Python bindings."""
+
+    LINE_REQ_DIR_IN = 1
+    LINE_REQ_DIR_OUT = 2
+    LINE_REQ_EV_FALLING_EDGE = 3
+    LINE_REQ_EV_RISING_EDGE = 4
+    LINE_REQ_EV_BOTH_EDGES = 5
+    LineEvent = VirtualLineEvent
+
+    def __init__(self, wall):
+        self.wall = wall
+
+    def Chip(self, name):
+        return VirtualChip(self.wall, name)
+
+
+def load_scenario(path):
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,218 @@
+import ctypes
+import threading
+import time
+from ir_sensor import IRSensor
+from simucube import libsimucube, DriveAddress, DriveState, IONI_NODE, activate_ioni, connect_drive, print_timings
+from scheduler import PeriodicTask, run_periodic
+from setpoint import SetpointManager
+from speed_ramp import SpeedStreamer
+from startup import Startup, print_ready
+from metrics import METRICS, start_server
+from supervisor import DriveSupervisor
+from torque_speed import TorqueGate
+
+# Usage: python3 walls.py [wall name ...]   (every wall in WALLS by default)
+
+CACHE_DIR = "/home/jonno/ZazuWall-Simucube-Control/le-Potato-Control/"
+
+
+def wall_drive(name, serial, node=IONI_NODE):
+    """DriveAddress with its own port and drive config caches."""
+    return DriveAddress(name, serial, node, f"{CACHE_DIR}.simucube_port.{name}".encode(),
+                        f"{CACHE_DIR}.drive_config_hash.{name}")
+
+
+# Walls driven from this host, each bound to the FTDI serial of its IONI
+# (udevadm info -q property /dev/ttyUSB0 | grep ID_SERIAL_SHORT)
+WALLS = [
+    wall_drive("wall1", b"ZW000001"),
+    wall_drive("wall2", b"ZW000002"),
+    wall_drive("wall3", b"ZW000003"),
+    wall_drive("wall4", b"ZW000004"),
+]
+SENSOR_LINES = {"wall1": 6}  # IR stop sensor line on gpiochip0 per wall; walls left out have none
+
+# Motor Configuration
+SPEED_SETPOINT = 2000      # Speed when motor is enabled
+CONTROL_PERIOD = 0.05      # Per-wall control loop period (s)
+RAMP_SPEED_CHANGES = True  # Start and stop belts with streamed S-curve ramps
+REPORT_INTERVAL = 60       # Seconds between loop timing reports
+
+# Real-time scheduling for the wall loops (None leaves the default policy)
+REALTIME_PRIORITY = None   # SCHED_FIFO priority, e.g. 50
+
+
+class Wall:
+    """One wall: its drive handle, control state and its own I/O thread.
+
+    Nothing is shared between walls but the process. Each loop talks only to
+    its own bus (the native library locks per bus), so a slow or reconnecting
+    drive never holds up the others. Metrics carry a wall label, and the loop
+    is a PeriodicTask named after the wall.
+    """
+
+    def __init__(self, drive, speed=SPEED_SETPOINT, period=CONTROL_PERIOD, sensor_line=None, lib=libsimucube):
+        self.drive = drive
+        self.name = drive.name
+        self.speed = speed
+        self.lib = lib
+        self.handle = ctypes.c_int(-1)  # -1 until the drive's bus is opened
+        self.state = DriveState()
+        self.lock = threading.Lock()   # This wall's bus: loop vs. sensor stop
+        streamer = SpeedStreamer(self.handle, lib) if RAMP_SPEED_CHANGES else None
+        self.setpoints = SetpointManager(self.handle, lib, streamer=streamer)
+        labels = {"wall": self.name}
+        self.supervisor = DriveSupervisor(self.handle, self.setpoints, lib, drive=drive, labels=labels)
+        self.gate = TorqueGate()
+        self.motor_running = False
+        self.sensor = None
+        if sensor_line is not None:
+            self.sensor = IRSensor(line_offset=sensor_line, on_trigger=self._sensor_stop)
+        self.exchange_time = METRICS.histogram("zazu_wall_exchange_seconds",
+                                               "Drive state exchange round trip.", **labels)
+        self.task = PeriodicTask(self.name, period, self.tick, REALTIME_PRIORITY)
+        self.thread = None
+
+        METRICS.gauge("zazu_speed_commanded_rpm", "Setpoint last requested from the drive.",
+                      lambda: self.setpoints.target, **labels)
+        METRICS.gauge("zazu_velocity", "Drive velocity feedback.", lambda: self.state.velocity, **labels)
+        METRICS.gauge("zazu_torque", "Raw drive torque.", lambda: self.state.torque, **labels)
+        METRICS.gauge("zazu_torque_filtered", "Filtered torque used for auto mode.",
+                      lambda: self.gate.torque, **labels)
+        METRICS.gauge("zazu_faults", "Drive fault bits.", lambda: self.state.faults, **labels)
+        METRICS.gauge("zazu_motor_running", "1 while the belt should run.", lambda: self.motor_running, **labels)
+
+    @property
+    def stopped_by_sensor(self):
+        return self.sensor is not None and self.sensor.triggered
+
+    def connect(self):
+        """Open, configure and initialise this wall's drive (activation already ran)."""
+        ready, timings = connect_drive(self.handle, self.lib, activate=False, drive=self.drive)
+        if ready:
+            self.setpoints.reset(0)
+        return ready, timings
+
+    def _sensor_stop(self, event_ns):
+        with self.lock:
+            result = self.lib.setSpeed(self.handle.value, 0)
+            self.setpoints.invalidate()
+        latency_ms = (time.monotonic_ns() - event_ns) / 1e6
+        print(f"[{self.name}] Sensor triggered: motor {'stopped' if result == 0 else 'NOT stopped'} "
+              f"{latency_ms:.2f} ms after edge.")
+
+    def tick(self):
+        """One drive transaction, then the torque decision for the next one."""
+        if self.stopped_by_sensor:
+            self.motor_running = False
+            self.gate.reset()
+            return
+        with self.lock:
+            if self.stopped_by_sensor:
+                return
+            if not self.supervisor.healthy:
+                self.supervisor.recover()
+                return
+            self.setpoints.request(self.speed if self.motor_running else 0)
+            start = time.perf_counter_ns()
+            result = self.setpoints.exchange(self.state)
+            self.exchange_time.record((time.perf_counter_ns() - start) / 1000.0)
+            self.supervisor.observe(result, self.state.faults if result == 0 else None)
+        if result != 0:
+            return
+
+        # The new setpoint rides along with the next exchange
+        run = self.gate.update(self.state.torque)
+        if run != self.motor_running:
+            self.motor_running = run
+            print(f"[{self.name}] Filtered torque {self.gate.torque:.1f}: motor {'ON' if run else 'OFF'}.")
+
+    def start(self):
+        if self.sensor is not None:
+            self.sensor.start()
+        self.thread = threading.Thread(target=run_periodic, args=(self.task,), name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        self.task.running = False
+        if self.thread:
+            self.thread.join(timeout)
+        if self.sensor is not None:
+            self.sensor.stop()
+
+    def close(self):
+        """Stop and close this wall's bus; a wall whose bus never opened has none."""
+        with self.lock:
+            if self.handle.value < 0:
+                return
+            if self.lib.setSpeed(self.handle.value, 0) == 0:
+                print(f"[{self.name}] Motor disabled on exit.")
+            self.lib.closeSimucube(self.handle.value)
+            self.handle.value = -1
+
+    def print_report(self):
+        hist = self.exchange_time
+        print(f"[{self.name} @ {1.0 / self.task.period:g} Hz] {self.task.stats.summary()}")
+        print(f"[{self.name}] exchange p50<={hist.percentile(50):.0f}us p99<={hist.percentile(99):.0f}us "
+              f"max={hist.max_us:.0f}us; {self.setpoints.stats.summary()}")
+
+
+def connect_walls(walls, lib=libsimucube):
+    """Activate every IONI once, then bring the drives up concurrently.
+
+    Returns the walls whose drive came up; the rest are reported and left out.
+    """
+    start = time.perf_counter()
+    if activate_ioni(lib, b"") != 0:  # Empty serial: every Simucube on the host
+        print("IONI activation failed; trying to open the drives anyway.")
+    activate_ms = (time.perf_counter() - start) * 1000.0
+
+    startup = Startup()
+    for wall in walls:
+        startup.add(wall.name, wall.connect)
+    startup.add("metrics", start_server, required=False)
+    startup.run()
+    startup.report()
+
+    ready = []
+    for wall in walls:
+        ok, timings = startup.result(wall.name) or (False, {})
+        print(f"[{wall.name}] drive connect timing (activation {activate_ms:.1f} ms shared):")
+        print_timings(timings)
+        if ok:
+            ready.append(wall)
+        else:
+            print(f"[{wall.name}] drive not ready; this wall stays off.")
+    return ready
+
+
+# Main Function
+if __name__ == "__main__":
+    import sys
+
+    names = sys.argv[1:]
+    drives = [drive for drive in WALLS if not names or drive.name in names]
+    walls = [Wall(drive, sensor_line=SENSOR_LINES.get(drive.name)) for drive in drives]
+    running = []
+    try:
+        running = connect_walls(walls)
+        if running:
+            for wall in running:
+                wall.start()
+            print_ready()
+            print(f"Controlling {len(running)} of {len(walls)} walls: {', '.join(w.name for w in running)}")
+
+            # Keep the main thread running and report loop timing
+            while True:
+                time.sleep(REPORT_INTERVAL)
+                for wall in running:
+                    wall.print_report()
+    except KeyboardInterrupt:
+        print("Exiting...")
+    finally:
+        for wall in running:
+            wall.stop()
+        for wall in walls:
+            wall.close()
+            wall.print_report()
+        print("Simucubes closed.")